@@ -0,0 +1,65 @@
+# action_batch.py
+# Batched ReAct steps: the planner may answer with a JSON array of independent tool calls instead of a single call,
+# e.g. reading three files at once. The calls of one step run concurrently (file and analysis tools on a thread pool,
+# LLM generation calls together through the async connectors) and come back as one combined observation whose
+# results are in the order the planner gave the calls, so the history is the same whatever order they finished in.
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_ACTION_BATCH_CONFIG = {
+    "max_calls": 8,        # Tool calls per step; calls beyond this are not run and get an error result
+    "max_llm_calls": 2,    # ... of which LLM generation calls
+    "max_concurrency": 4,  # Tool calls running at the same time
+}
+
+# These end or pause the sub-task, so they cannot share a step with other calls
+SOLO_TOOLS = ("finish_sub_task", "RequestClarificationTool.request_clarification")
+
+
+def check_batch(actions: list, config: dict, is_llm_call) -> dict[int, dict]:
+    """Error observations, by position, for the calls of a batch that must not run (malformed, solo-only, over a limit)."""
+    rejected, accepted, llm_calls = {}, 0, 0
+    for i, action in enumerate(actions):
+        if not isinstance(action, dict) or not isinstance(action.get("tool_name"), str):
+            rejected[i] = {"status": "error", "message": "Batched action is not a JSON object with a 'tool_name'."}
+        elif action["tool_name"] in SOLO_TOOLS:
+            rejected[i] = {"status": "error", "message": f"'{action['tool_name']}' must be the only action of a step, not part of a batch."}
+        elif accepted >= int(config["max_calls"]):
+            rejected[i] = {"status": "error", "message": f"Not run: a step may batch at most {config['max_calls']} tool calls."}
+        elif is_llm_call(action) and llm_calls >= int(config["max_llm_calls"]):
+            rejected[i] = {"status": "error", "message": f"Not run: a step may batch at most {config['max_llm_calls']} LLM generation calls."}
+        else:
+            accepted += 1
+            llm_calls += 1 if is_llm_call(action) else 0
+    return rejected
+
+
+def run_batch(actions: list, config: dict, run_call, run_llm_calls, is_llm_call) -> list[dict]:
+    """Observations for every action of a batch, in input order. run_call(action) runs one call on a pool thread;
+    run_llm_calls(actions) runs all LLM generation calls of the batch in one go. Neither should raise."""
+    observations: list[dict | None] = [None] * len(actions)
+    for i, observation in check_batch(actions, config, is_llm_call).items():
+        observations[i] = observation
+    pending = [i for i in range(len(actions)) if observations[i] is None]
+    llm_indices = [i for i in pending if is_llm_call(actions[i])]
+    io_indices = [i for i in pending if i not in llm_indices]
+    workers = max(1, min(int(config["max_concurrency"]), len(io_indices) + (1 if llm_indices else 0)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool-batch") as pool:
+        # Each call runs in a copy of the step's context (the sub-task its usage and history belong to)
+        futures = [(i, pool.submit(contextvars.copy_context().run, run_call, actions[i])) for i in io_indices]
+        llm_future = pool.submit(contextvars.copy_context().run, run_llm_calls, [actions[i] for i in llm_indices]) if llm_indices else None
+        for i, future in futures:
+            observations[i] = future.result()
+        if llm_future is not None:
+            for i, observation in zip(llm_indices, llm_future.result()):
+                observations[i] = observation
+    return observations
+
+
+def combine_observations(actions: list, observations: list[dict]) -> dict:
+    """One observation for a batched step: overall status plus each call's result, tagged with its tool name."""
+    results = [{"tool_name": action.get("tool_name") if isinstance(action, dict) else None, **observation}
+               for action, observation in zip(actions, observations)]
+    succeeded = sum(1 for observation in observations if observation.get("status") != "error")
+    status = "success" if succeeded == len(observations) else ("error" if succeeded == 0 else "partial")
+    return {"status": status, "message": f"Batch of {len(observations)} tool calls: {succeeded} succeeded.", "results": results}
@@ -0,0 +1,143 @@
+# action_memo.py
+# In-run memoization of idempotent tool calls and detection of repeated-action loops in the ReAct executor.
+# Each (tool, canonical arguments) pair gets a fingerprint. Calls to pure tools (code analysis) and file reads (keyed
+# on the file's size and mtime as well, so an edited file is read again) are answered from the memo instead of being
+# run again. Small planners also tend to repeat whole steps; when the last steps of a sub-task form a repeating cycle
+# (A A, A B A B, ...) the next repeat is not run. The planner gets a corrective observation instead, and a sub-task
+# that keeps looping after max_loop_warnings of them is ended early rather than burning its remaining iterations.
+import copy
+import hashlib
+import json
+import os
+import threading
+
+DEFAULT_ACTION_MEMO_CONFIG = {
+    "enabled": True,
+    "cycle_repeats": 2,        # A cycle counts as a loop once it has run this many times in a row
+    "max_cycle_length": 3,     # Longest cycle (in steps) that is detected
+    "max_loop_warnings": 2,    # Corrective observations per sub-task before it is ended early
+    "max_entries": 512,        # Memoized results kept per run
+}
+
+# Tools whose result only depends on their arguments (read_file: and on the file's current version)
+MEMOIZABLE_TOOLS = ("FileSystemTool.read_file", "CodeAnalysisTool.get_code_structure", "CodeAnalysisTool.get_file_context_snippet",
+                    "CodeAnalysisTool.extract_relevant_context")
+
+_PATH_ARGUMENTS = ("file_path_str",)
+
+
+def canonical_arguments(arguments: dict) -> dict:
+    """Arguments with path spellings normalised ("./a.py" and "a.py" are the same call)."""
+    canonical = dict(arguments or {})
+    for key in _PATH_ARGUMENTS:
+        if isinstance(canonical.get(key), str):
+            canonical[key] = os.path.normpath(canonical[key].strip())
+    return canonical
+
+
+def fingerprint(tool_name: str | None, arguments: dict | None) -> str:
+    text = json.dumps([tool_name, canonical_arguments(arguments if isinstance(arguments, dict) else {})],
+                      sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def step_fingerprint(action) -> str:
+    """Fingerprint of a whole step: one action or a batch of them (in order)."""
+    if isinstance(action, list):
+        return hashlib.sha1("|".join(step_fingerprint(a) for a in action).encode("utf-8")).hexdigest()
+    if not isinstance(action, dict):
+        return fingerprint(None, {"raw": str(action)})
+    return fingerprint(action.get("tool_name"), action.get("arguments") if isinstance(action.get("arguments"), dict) else {})
+
+
+class ActionMemo:
+    def __init__(self, config: dict | None = None, resolve_path=None):
+        cfg = dict(DEFAULT_ACTION_MEMO_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.resolve_path = resolve_path # Project-relative path -> absolute Path, for read_file versions
+        self._lock = threading.Lock()
+        self._results: dict[str, dict] = {}        # Call fingerprint -> observation
+        self._steps: dict[str, list[str]] = {}     # Sub-task id -> step fingerprints, in order
+        self._warnings: dict[str, int] = {}        # Sub-task id -> corrective observations given
+        self.stats = {"memo_hits": 0, "memo_misses": 0, "loops_detected": 0, "sub_tasks_ended_early": 0,
+                      "tool_calls_saved": 0, "iterations_saved": 0}
+
+    # --- memoized tool results ---
+
+    def _key(self, tool_name: str, arguments: dict) -> str | None:
+        if not self.config["enabled"] or tool_name not in MEMOIZABLE_TOOLS:
+            return None
+        key = fingerprint(tool_name, arguments)
+        if tool_name == "FileSystemTool.read_file" and self.resolve_path is not None:
+            try:
+                st = os.stat(self.resolve_path(str(arguments.get("file_path_str") or "")))
+                key += f":{st.st_size}:{st.st_mtime_ns}"
+            except (OSError, ValueError):
+                return None # Missing files are not memoized; they may be created later in the run
+        return key
+
+    def lookup(self, tool_name: str, arguments: dict) -> dict | None:
+        """An earlier observation of this exact call, marked as memoized, or None."""
+        key = self._key(tool_name, arguments)
+        if key is None:
+            return None
+        with self._lock:
+            observation = self._results.get(key)
+            self.stats["memo_hits" if observation is not None else "memo_misses"] += 1
+            if observation is None:
+                return None
+            self.stats["tool_calls_saved"] += 1
+        observation = copy.deepcopy(observation)
+        observation["memoized"] = True
+        observation["message"] = (observation.get("message", "") + " (Same call as an earlier step; result reused, not run again.)").strip()
+        return observation
+
+    def store(self, tool_name: str, arguments: dict, observation: dict):
+        key = self._key(tool_name, arguments)
+        if key is None or observation.get("status") == "error":
+            return
+        with self._lock:
+            self._results[key] = copy.deepcopy(observation)
+            while len(self._results) > int(self.config["max_entries"]):
+                self._results.pop(next(iter(self._results)))
+
+    # --- loop detection ---
+
+    def check_step(self, sub_task_id, action) -> int | None:
+        """Records a step the planner asked for; returns the cycle length if running it would repeat a loop."""
+        if not self.config["enabled"]:
+            return None
+        key = str(sub_task_id)
+        with self._lock:
+            steps = self._steps.setdefault(key, [])
+            steps.append(step_fingerprint(action))
+            repeats = int(self.config["cycle_repeats"])
+            for length in range(1, int(self.config["max_cycle_length"]) + 1):
+                window = steps[-length * (repeats + 1):]
+                if len(window) == length * (repeats + 1) and all(window[i] == window[i % length] for i in range(len(window))):
+                    steps.pop() # The repeat is not run, so it is not part of the sub-task's sequence
+                    self.stats["loops_detected"] += 1
+                    self._warnings[key] = self._warnings.get(key, 0) + 1
+                    return length
+        return None
+
+    def should_end_sub_task(self, sub_task_id) -> bool:
+        with self._lock:
+            return self._warnings.get(str(sub_task_id), 0) > int(self.config["max_loop_warnings"])
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+def loop_observation(cycle_length: int, repeats: int) -> dict:
+    what = "the same action" if cycle_length == 1 else f"the same {cycle_length} actions in turn"
+    return {"status": "error", "loop_detected": True,
+            "message": f"Loop detected: you have repeated {what} {repeats} times; it was not run again. Its result is already in "
+                       "the history above. Choose a different action, or call finish_sub_task if the work is done."}
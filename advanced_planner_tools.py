@@ -1,11 +1,26 @@
 # advanced_planner_tools.py
+import contextvars
 import json
+import threading
 from pathlib import Path
 
+from file_cache import FileCache
+from observation_store import ObservationStore
+from action_batch import DEFAULT_ACTION_BATCH_CONFIG, combine_observations, run_batch
+from plan_scheduler import DEFAULT_SCHEDULER_CONFIG, build_dependencies, run_dag
+from action_memo import ActionMemo, loop_observation
+
+class _SubTaskContext:
+    """What StateManager tracks for the sub-task running in the current thread (or asyncio task)."""
+    def __init__(self):
+        self.sub_task_id: str | int | None = None
+        self.planning_iterations: int = 0
+        self.models: dict = {} # planning_model / generation_model chosen for this sub-task's next step (budget tiers)
+
 class StateManager:
     def __init__(self, user_prompt: str, operational_mode: str, mode_config: dict,
                  project_base_path: Path, 
-                 dry_run: bool):
+                 dry_run: bool, file_cache_config: dict | None = None, observation_store_config: dict | None = None):
         self.user_prompt = user_prompt
         self.operational_mode = operational_mode
         self.mode_config = mode_config 
@@ -13,18 +28,61 @@ class StateManager:
         self.dry_run = dry_run
         
         self.plan: dict | None = None
-        self.current_sub_task_id: str | int | None = None
-        self.history_per_sub_task: dict[str, list] = {} 
-        self.file_cache: dict[str, str | None] = {} # Value can be None if read failed
+        # current_sub_task_id / planning_iterations_current_sub_task live in a context variable, so sub-tasks scheduled
+        # on different worker threads each see their own (see the properties below)
+        self._sub_task_context = contextvars.ContextVar(f"sub_task_context_{id(self)}", default=None)
+        self._main_sub_task_context = _SubTaskContext()
+        self._state_lock = threading.Lock() # Shared counters and the history/checkpoint order
+        self.history_per_sub_task: dict[str, list] = {} # Large observation/argument values are stored as handles
+        self.observations = ObservationStore(observation_store_config)
+        self.file_cache = FileCache(project_base_path, file_cache_config) # Keyed by resolved path; None text if read failed
         self.openrouter_api_calls_made_total: int = 0
-        self.planning_iterations_current_sub_task: int = 0
+        self.resumed_planning_iterations: dict[str, int] = {} # Per sub-task, restored from a checkpoint
         self.collected_change_directives: list[list[dict]] = [] 
+        self.llm_usage_records: list[dict] = [] # One entry per LLM call (see connectors.LLMUsage)
+        self._usage_lock = threading.Lock()
+        self.finished_sub_tasks: dict[str, list] = {} # sub-task id -> its directives, for sub-tasks that are done
+        self.checkpoint = None # checkpoint.RunCheckpoint; when set, every plan, step and finished sub-task is recorded
+        self.budget = None # budget.BudgetScheduler; when set, it picks each step's models and can stop the run
 
         print(f"DEBUG StateManager: Initialized with mode_config: {json.dumps(self.mode_config, indent=2)}")
         print(f"DEBUG StateManager: Project Base Path: {self.project_base_path.resolve() if self.project_base_path else 'Not Set'}")
 
+    def _context(self) -> _SubTaskContext:
+        context = self._sub_task_context.get()
+        return context if context is not None else self._main_sub_task_context
+
+    def enter_sub_task_context(self):
+        """Gives the calling context (a worker running one sub-task) its own sub-task id and iteration counter."""
+        self._sub_task_context.set(_SubTaskContext())
+
+    @property
+    def current_sub_task_id(self) -> str | int | None:
+        return self._context().sub_task_id
+
+    @current_sub_task_id.setter
+    def current_sub_task_id(self, value: str | int | None):
+        self._context().sub_task_id = value
+
+    @property
+    def planning_iterations_current_sub_task(self) -> int:
+        return self._context().planning_iterations
+
+    @planning_iterations_current_sub_task.setter
+    def planning_iterations_current_sub_task(self, value: int):
+        self._context().planning_iterations = value
+
+    def get_model(self, role: str) -> str | None:
+        """The model for 'planning_model' or 'generation_model' in the current sub-task: the budget's pick, else the mode's."""
+        return self._context().models.get(role) or self.mode_config.get(role)
+
+    def use_models(self, models: dict):
+        self._context().models = dict(models or {})
+
     def set_plan(self, plan_dict: dict | None):
         self.plan = plan_dict
+        if self.checkpoint is not None:
+            self.checkpoint.write_plan(plan_dict)
         if self.plan:
             print(f"DEBUG StateManager: Plan set: {json.dumps(self.plan, indent=2)}")
         else:
@@ -38,6 +96,13 @@ class StateManager:
                     return task.get("description", "No description for this sub-task.")
         return "N/A - No current sub-task identified or plan not set."
 
+    def get_current_sub_task_files(self) -> list[str]:
+        """The files the current sub-task declared, else the plan's estimated_involved_files."""
+        for task in (self.plan or {}).get("sub_tasks") or []:
+            if task.get("id") == self.current_sub_task_id and task.get("files"):
+                return list(task["files"])
+        return list((self.plan or {}).get("estimated_involved_files") or [])
+
     def add_history(self, sub_task_id: int | str, thought: str | None, action: dict | str | None, observation: dict):
         sub_task_id_key = str(sub_task_id)
         if sub_task_id_key not in self.history_per_sub_task:
@@ -48,22 +113,43 @@ class StateManager:
             action_to_store = {"raw_unparsed_action": action}
         elif action is None: # Handle None action
             action_to_store = {"error": "Action was None"}
+        elif isinstance(action, dict): # File contents passed as arguments or directives in a result go to the store too
+            action_to_store = self._compact_action(action)
+        elif isinstance(action, list): # Batched step
+            action_to_store = [self._compact_action(a) if isinstance(a, dict) else a for a in action]
+        if isinstance(observation, dict) and isinstance(observation.get("results"), list):
+            # Batched step: each call's result gets its own handle, so the latest ones can be shown side by side
+            results = [self.observations.compact(r) for r in observation["results"]]
+            observation = dict(self.observations.compact({k: v for k, v in observation.items() if k != "results"}), results=results)
+        else:
+            observation = self.observations.compact(observation)
 
 
-        self.history_per_sub_task[sub_task_id_key].append({
+        entry = {
             "thought": thought or "No thought recorded.", # Handle None thought
             "action": action_to_store, 
             "observation": observation 
-        })
+        }
+        with self._state_lock:
+            self.history_per_sub_task[sub_task_id_key].append(entry)
+            if self.checkpoint is not None: # Every iteration ends with exactly one history entry
+                self.checkpoint.write_step(self, sub_task_id_key, entry)
         action_name = action_to_store.get('tool_name', 'N/A') if isinstance(action_to_store, dict) else str(action_to_store)[:30]
         obs_summary = str(observation)[:70] + "..." if len(str(observation)) > 70 else str(observation)
         # print(f"DEBUG StateManager: History added for sub-task {sub_task_id_key}: T:{str(thought)[:30]}... A:{action_name} O:{obs_summary}")
 
+    def _compact_action(self, action: dict) -> dict:
+        compacted = dict(action)
+        for key in ("arguments", "result"):
+            if isinstance(action.get(key), dict):
+                compacted[key] = self.observations.compact(action[key])
+        return compacted
+
     def get_history_for_sub_task(self, sub_task_id: int | str) -> list:
         return self.history_per_sub_task.get(str(sub_task_id), [])
 
     def update_file_cache(self, file_path: str, content: str | None): # Content can be None if read fails
-        self.file_cache[file_path] = content
+        self.file_cache.put(file_path, content)
         if content is not None:
             print(f"DEBUG StateManager: File cache updated for '{file_path}' ({len(content)} chars)")
         else:
@@ -71,6 +157,7 @@ class StateManager:
 
 
     def get_file_from_cache(self, file_path: str) -> str | None:
+        # Loads the file on a miss and re-validates a cached copy against the disk, so the result is always current
         return self.file_cache.get(file_path)
 
     def increment_api_calls(self, provider_model_str=""):
@@ -81,7 +168,8 @@ class StateManager:
             effective_provider = "ollama" 
 
         if effective_provider == "openrouter":
-            self.openrouter_api_calls_made_total += 1
+            with self._state_lock:
+                self.openrouter_api_calls_made_total += 1
             print(f"DEBUG StateManager: Total OpenRouter API calls: {self.openrouter_api_calls_made_total}/{self.mode_config.get('max_api_calls_openrouter', 'N/A')}")
         
         # This counter is for sub-task iterations, regardless of provider for the specific call
@@ -109,9 +197,26 @@ class StateManager:
         if sub_task_iter_limit_val is not None and isinstance(sub_task_iter_limit_val, int) and self.planning_iterations_current_sub_task >= sub_task_iter_limit_val:
             print(f"WARNING: Per-sub-task planning iteration limit ({sub_task_iter_limit_val}) reached.")
             return True
+
+        if self.budget is not None:
+            exhausted_reason = self.budget.exhausted(self)
+            if exhausted_reason:
+                print(f"WARNING: Run budget exhausted: {exhausted_reason}.")
+                return True
             
         return False
     
+    def finish_sub_task(self, sub_task_id: int | str, status: str, directives: list):
+        """Records a sub-task as done (completed or failed) with the directives it produced; a resumed run skips it."""
+        with self._state_lock:
+            self.finished_sub_tasks[str(sub_task_id)] = directives
+            if self.budget is not None:
+                self.budget.finish_sub_task(sub_task_id)
+            if directives:
+                self.add_change_directives_for_sub_task(directives)
+            if self.checkpoint is not None:
+                self.checkpoint.write_sub_task_done(self, str(sub_task_id), status, directives)
+
     def add_change_directives_for_sub_task(self, directives: list | None): # Directives can be None
         if directives and isinstance(directives, list): 
             self.collected_change_directives.append(directives)
@@ -122,6 +227,55 @@ class StateManager:
              print(f"WARNING StateManager: Attempted to add non-list directives: {directives}")
 
 
+    def record_llm_usage(self, usage) -> None:
+        record = usage.to_dict()
+        record["sub_task_id"] = str(self.current_sub_task_id) if self.current_sub_task_id is not None else "(no sub-task)"
+        with self._usage_lock:
+            self.llm_usage_records.append(record)
+
+    def get_llm_usage_summary(self) -> dict:
+        """Aggregates recorded LLM calls overall, per sub-task and per model."""
+        def new_bucket():
+            return {"calls": 0, "cached_calls": 0, "errors": 0, "early_stopped": 0, "discarded_calls": 0, "wall_time_s": 0.0,
+                    "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0, "load_time_s": 0.0, "prefill_time_s": 0.0,
+                    "ttft_s_total": 0.0, "ttft_samples": 0}
+
+        def add(bucket, rec):
+            bucket["calls"] += 1
+            bucket["cached_calls"] += 1 if rec.get("cached") else 0
+            bucket["errors"] += 1 if rec.get("error") else 0
+            bucket["early_stopped"] += 1 if rec.get("early_stopped") else 0
+            bucket["discarded_calls"] += 1 if rec.get("discarded") else 0
+            bucket["wall_time_s"] += rec.get("wall_time_s") or 0.0
+            bucket["prompt_tokens"] += rec.get("prompt_tokens") or 0
+            bucket["completion_tokens"] += rec.get("completion_tokens") or 0
+            bucket["cached_prompt_tokens"] += rec.get("cached_prompt_tokens") or 0
+            bucket["load_time_s"] += rec.get("load_time_s") or 0.0
+            bucket["prefill_time_s"] += rec.get("prompt_eval_time_s") or 0.0
+            if rec.get("time_to_first_token_s") is not None:
+                bucket["ttft_s_total"] += rec["time_to_first_token_s"]
+                bucket["ttft_samples"] += 1
+
+        def finalize(bucket):
+            samples = bucket.pop("ttft_samples")
+            ttft_total = bucket.pop("ttft_s_total")
+            bucket["avg_ttft_s"] = ttft_total / samples if samples else None
+            bucket["avg_wall_time_s"] = bucket["wall_time_s"] / bucket["calls"] if bucket["calls"] else None
+            return bucket
+
+        with self._usage_lock:
+            records = list(self.llm_usage_records)
+        totals, per_sub_task, per_model = new_bucket(), {}, {}
+        for rec in records:
+            add(totals, rec)
+            add(per_sub_task.setdefault(rec["sub_task_id"], new_bucket()), rec)
+            add(per_model.setdefault(rec.get("model") or "unknown", new_bucket()), rec)
+        return {
+            "totals": finalize(totals),
+            "per_sub_task": {k: finalize(v) for k, v in per_sub_task.items()},
+            "per_model": {k: finalize(v) for k, v in per_model.items()},
+        }
+
     def get_full_path(self, relative_or_absolute_path: str) -> Path:
         if not self.project_base_path:
             print("CRITICAL WARNING: StateManager.project_base_path is not set. Attempting to use current directory as fallback.")
@@ -137,9 +291,12 @@ class StateManager:
 
 
 class TaskDecomposer:
-    def __init__(self, llm_tool, state_manager: StateManager):
+    USE_ACTUAL_LLM_FOR_DECOMPOSITION = False # SET TO True TO ENABLE LLM DECOMPOSITION
+
+    def __init__(self, llm_tool, state_manager: StateManager, plan_cache=None):
         self.llm_tool = llm_tool
         self.state = state_manager
+        self.plan_cache = plan_cache # plan_cache.PlanCache; LLM plans for the same (or a near-duplicate) prompt and tree
 
     def decompose(self) -> dict | None:
         print("INFO: TaskDecomposer.decompose() called.")
@@ -147,9 +304,19 @@ class TaskDecomposer:
         planning_model = self.state.mode_config.get('planning_model', 'ollama/mistral:7b')
         print(f"DEBUG TaskDecomposer: Using planning model: {planning_model} for decomposition.")
         
-        USE_ACTUAL_LLM_FOR_DECOMPOSITION = False # SET TO True TO ENABLE LLM DECOMPOSITION
-
-        if not USE_ACTUAL_LLM_FOR_DECOMPOSITION:
+        store_in_plan_cache = False
+        cached_plan = None
+        if self.USE_ACTUAL_LLM_FOR_DECOMPOSITION and self.plan_cache is not None:
+            try:
+                cached_plan = self.plan_cache.get(self.state.user_prompt, planning_model)
+            except Exception as e: # Planning without the cache is slower, not wrong
+                print(f"WARNING: TaskDecomposer: Plan cache lookup failed: {e}")
+
+        if cached_plan is not None:
+            match = self.plan_cache.last_match or {}
+            print(f"INFO: TaskDecomposer: Using the cached plan (prompt similarity {match.get('similarity', 1.0)}, unchanged project); no planning call made.")
+            plan_str_for_parsing = json.dumps(cached_plan)
+        elif not self.USE_ACTUAL_LLM_FOR_DECOMPOSITION:
             print("INFO: TaskDecomposer: Using DUMMY plan generation logic.")
             overall_goal_display = self.state.user_prompt.replace('\n', ' ').replace('\r', '')
 
@@ -158,9 +325,9 @@ class TaskDecomposer:
                     "overall_goal": f"Implement theme toggle for the website, based on: {overall_goal_display}",
                     "estimated_involved_files": ["index.html", "style.css", "script.js"],
                     "sub_tasks": [
-                        {"id": "html_button_task", "description": "Add HTML for the theme toggle button in index.html.", "complexity": "simple", "status": "pending"},
-                        {"id": "css_theme_task", "description": "Define CSS for light/dark themes and style the toggle button in style.css.", "complexity": "medium", "status": "pending"},
-                        {"id": "js_logic_task", "description": "Implement JavaScript logic in script.js for theme switching and persistence.", "complexity": "medium", "status": "pending"}
+                        {"id": "html_button_task", "description": "Add HTML for the theme toggle button in index.html.", "complexity": "simple", "status": "pending", "files": ["index.html"]},
+                        {"id": "css_theme_task", "description": "Define CSS for light/dark themes and style the toggle button in style.css.", "complexity": "medium", "status": "pending", "files": ["style.css"]},
+                        {"id": "js_logic_task", "description": "Implement JavaScript logic in script.js for theme switching and persistence.", "complexity": "medium", "status": "pending", "files": ["script.js"], "depends_on": ["html_button_task"]}
                     ]
                 }
             else:
@@ -178,34 +345,31 @@ class TaskDecomposer:
             system_prompt = """You are an expert project planner. Given a user's request for code modification,
 break it down into a logical sequence of sub-tasks. Each sub-task MUST have a unique string 'id'.
 Identify any files likely to be involved for the overall goal.
-For each sub-task, estimate its complexity (simple, medium, complex).
+For each sub-task, estimate its complexity (simple, medium, complex), list the 'files' it will read or edit, and list in
+'depends_on' the ids of earlier sub-tasks whose results it needs. Sub-tasks with disjoint files and no dependency
+between them may be executed in parallel.
 Respond ONLY with a valid JSON object containing:
 {
   "overall_goal": "User's main goal summarized",
   "estimated_involved_files": ["file1.py", "file2.html"],
   "sub_tasks": [
-    {"id": "unique_alphanumeric_step_1_id", "description": "Detailed step 1", "complexity": "simple", "status": "pending"},
-    {"id": "unique_alphanumeric_step_2_id", "description": "Detailed step 2", "complexity": "medium", "status": "pending"}
+    {"id": "unique_alphanumeric_step_1_id", "description": "Detailed step 1", "complexity": "simple", "status": "pending", "files": ["file1.py"], "depends_on": []},
+    {"id": "unique_alphanumeric_step_2_id", "description": "Detailed step 2", "complexity": "medium", "status": "pending", "files": ["file2.html"], "depends_on": ["unique_alphanumeric_step_1_id"]}
   ]
 }
 Ensure the 'id' fields are unique strings. Do not include any text outside the JSON object.
 """
             user_llm_prompt = f"User request: \"{self.state.user_prompt}\"\n\nGenerate the JSON plan based on this request."
-            plan_str_for_parsing = self.llm_tool.query_llm(user_llm_prompt, planning_model, system_message=system_prompt, max_tokens=1500)
-            if not plan_str_for_parsing or plan_str_for_parsing.startswith("Error:"):
-                print(f"ERROR: TaskDecomposer LLM call failed: {plan_str_for_parsing}")
+            plan_from_llm, raw_response = self.llm_tool.query_llm_json(user_llm_prompt, planning_model, "plan", system_message=system_prompt, max_tokens=1500)
+            if plan_from_llm is None:
+                print(f"ERROR: TaskDecomposer LLM call failed or returned an invalid plan: {raw_response}")
                 return None
+            plan_str_for_parsing = json.dumps(plan_from_llm, indent=2)
+            store_in_plan_cache = self.plan_cache is not None
         
         print(f"DEBUG TaskDecomposer: Plan string to be parsed by json.loads():\n{plan_str_for_parsing}")
         try:
-            # Attempt to clean the string if it's not perfect JSON (e.g. remove markdown fences)
-            cleaned_plan_str = plan_str_for_parsing.strip()
-            if cleaned_plan_str.startswith("```json"): cleaned_plan_str = cleaned_plan_str[len("```json"):]
-            if cleaned_plan_str.startswith("```"): cleaned_plan_str = cleaned_plan_str[len("```"):]
-            if cleaned_plan_str.endswith("```"): cleaned_plan_str = cleaned_plan_str[:-len("```")]
-            cleaned_plan_str = cleaned_plan_str.strip()
-
-            plan = json.loads(cleaned_plan_str)
+            plan = json.loads(plan_str_for_parsing) # Already schema-validated JSON (see LLMTool.query_llm_json)
             if not isinstance(plan, dict) or "sub_tasks" not in plan or not isinstance(plan["sub_tasks"], list):
                 print("ERROR: TaskDecomposer: Parsed plan has invalid structure (e.g., missing 'sub_tasks' list)."); return None
             
@@ -221,167 +385,270 @@ Ensure the 'id' fields are unique strings. Do not include any text outside the J
                 seen_ids.add(task["id"])
                 task.setdefault("status", "pending")
                 task.setdefault("complexity", "unknown") # Ensure complexity exists
+            if store_in_plan_cache:
+                try:
+                    self.plan_cache.put(self.state.user_prompt, planning_model, plan)
+                except Exception as e: # A plan that cannot be cached is still a good plan
+                    print(f"WARNING: TaskDecomposer: Could not store the plan in the plan cache: {e}")
             return plan
         except json.JSONDecodeError as e:
             print(f"ERROR: TaskDecomposer failed to parse JSON plan: {e}\nContent that failed parsing:\n---\n{plan_str_for_parsing}\n---"); return None
 
 
 class ReActPlannerExecutor:
-    def __init__(self, llm_tool, state_manager: StateManager, available_tools: dict, clarification_module):
+    def __init__(self, llm_tool, state_manager: StateManager, available_tools: dict, clarification_module,
+                 scheduler_config: dict | None = None, batch_config: dict | None = None, memo_config: dict | None = None):
         self.llm_tool = llm_tool
         self.state = state_manager
         self.tools = available_tools
         self.clarification_module = clarification_module
+        self.max_parallel_sub_tasks = max(1, int((scheduler_config or {}).get("max_parallel_sub_tasks", DEFAULT_SCHEDULER_CONFIG["max_parallel_sub_tasks"])))
+        self.batch_config = {**DEFAULT_ACTION_BATCH_CONFIG, **(batch_config or {})}
+        self._stop = threading.Event() # Set when a sub-task fails hard or the run is interrupted; running sub-tasks wind down
+        self.memo = ActionMemo(memo_config, resolve_path=self.state.get_full_path) # Shared by all sub-tasks of the run
 
-    def execute_plan(self) -> list[list[dict]]: # Returns list of (groups of) directives
+    def execute_plan(self) -> list[tuple[dict, list[dict]]]: # Returns (sub-task, its directives) for sub-tasks that proposed changes
         if not self.state.plan or not self.state.plan.get("sub_tasks"):
             print("ERROR: ReActPlannerExecutor: No plan or sub-tasks to execute.")
             return []
 
-        all_sub_task_directives_groups = []
-
-        for i, sub_task in enumerate(self.state.plan["sub_tasks"]):
-            sub_task_id = sub_task.get("id", f"sub_task_index_{i}")
-            self.state.current_sub_task_id = sub_task_id
-            self.state.planning_iterations_current_sub_task = 0 
-            print(f"\n>>> Executing Sub-task ID '{self.state.current_sub_task_id}': {sub_task.get('description')} <<<")
-
-            planning_model_str = self.state.mode_config.get('planning_model', '')
-            max_iterations = self.state.mode_config.get('max_planning_iterations_ollama', 10) # Default per-sub-task iter limit
-
-            current_iteration = 0
-            sub_task_completed_successfully = False
-            directives_for_this_sub_task = []
-
-
-            while current_iteration < max_iterations and not sub_task_completed_successfully:
-                current_iteration += 1
-                print(f"\n-- Sub-task ID '{self.state.current_sub_task_id}', Iteration {current_iteration}/{max_iterations} --")
-
-                if self.state.check_api_limit_reached(planning_model_str): # Checks both OR total and sub-task iter
-                    print(f"INFO: API/Iteration limit reached for sub-task '{self.state.current_sub_task_id}'. Stopping this sub-task.")
-                    break
-                
-                thought_text, action_json_str = self.llm_tool.generate_plan_step(self.state)
-                self.state.increment_api_calls(planning_model_str)
-
-                if not action_json_str: # Error from generate_plan_step
-                    print(f"ERROR: LLM failed to generate a valid action JSON for sub-task '{self.state.current_sub_task_id}'. Thought: '{thought_text}'. Skipping iteration.")
-                    observation_data = {"status": "error", "message": "LLM failed to generate valid action JSON."}
-                    self.state.add_history(self.state.current_sub_task_id, thought_text, {"error": "LLM action_json was None"}, observation_data)
-                    continue
-                
-                try:
-                    action_data = json.loads(action_json_str)
-                    if not isinstance(action_data, dict): raise json.JSONDecodeError("Action is not a JSON object", action_json_str, 0)
-                except json.JSONDecodeError as e:
-                    print(f"ERROR: Could not parse LLM action JSON: '{action_json_str}'. Error: {e}")
-                    observation_data = {"status": "error", "message": f"Failed to parse LLM action JSON: {e}"}
-                    self.state.add_history(self.state.current_sub_task_id, thought_text, {"error": "parse failed", "raw_action": action_json_str}, observation_data)
-                    continue
-
-                tool_name_str = action_data.get("tool_name")
-                tool_args = action_data.get("arguments", {}) if isinstance(action_data.get("arguments"), dict) else {} # Ensure args is a dict
-                observation_data = {"status": "error", "message": f"Initial error: Unknown tool or action: '{tool_name_str}'"}
-
-                if tool_name_str == "finish_sub_task":
-                    print(f"INFO: Sub-task ID '{self.state.current_sub_task_id}' marked as finished by LLM.")
-                    sub_task_completed_successfully = True 
-                    task_result = action_data.get("result", {})
-                    current_status = task_result.get("status", "success") # Assume success if not specified
-                    observation_data = {"status": current_status, "message": task_result.get("message", "Sub-task completed.")}
+        sub_tasks = self.state.plan["sub_tasks"]
+        dependencies = build_dependencies(sub_tasks)
+        parallel = self.max_parallel_sub_tasks > 1 and len(sub_tasks) > 1
+        if parallel:
+            print(f"INFO: ReActPlannerExecutor: Running up to {self.max_parallel_sub_tasks} independent sub-tasks at a time.")
+        self._stop.clear()
+        directive_groups = run_dag(dependencies, lambda i: self._execute_sub_task(i, sub_tasks[i], parallel),
+                                   self.max_parallel_sub_tasks, self._stop)
+        self.state.current_sub_task_id = None
+        # Merged in plan order, whatever order the sub-tasks finished in
+        return [(sub_task, directives) for sub_task, directives in zip(sub_tasks, directive_groups) if directives]
+
+    def _call_tool(self, tool_name_str: str | None, tool_args: dict) -> dict:
+        """Runs one ToolClass.method_name call and returns its observation (errors included, never raises)."""
+        if not tool_name_str or '.' not in tool_name_str:
+            return {"status": "error", "message": f"Invalid or missing tool_name format: '{tool_name_str}' (must be ToolClass.method_name)"}
+        memoized = self.memo.lookup(tool_name_str, tool_args)
+        if memoized is not None:
+            print(f"INFO: {tool_name_str}: Reusing the result of an identical earlier call.")
+            return memoized
+        try:
+            target_tool_class_name, target_method_name = tool_name_str.split('.', 1)
+            if target_tool_class_name in self.tools:
+                tool_instance = self.tools[target_tool_class_name]
+                if hasattr(tool_instance, target_method_name):
+                    method_to_call = getattr(tool_instance, target_method_name)
+                    print(f"Attempting to execute: {tool_name_str} with args: {json.dumps(tool_args, indent=2)}")
+
+                    if isinstance(tool_instance, self.llm_tool.__class__): # If it's an LLMTool call
+                        # Always inject/override model_choice for generation, do NOT let LLM planner dictate it
+                        if "generate_code_snippet" in target_method_name or \
+                           "generate_multi_part_code_solution" in target_method_name:
+                            tool_args['model_choice'] = self.state.get_model('generation_model')
+                            print(f"INFO: Set/Overrode model_choice to '{tool_args['model_choice']}' for {target_method_name}")
+                        # For other LLMTool methods, model is usually passed or comes from planning_model in method itself
                     
-                    # Collect directives if present and task was successful
-                    if current_status == "success" and "directives" in task_result and isinstance(task_result["directives"], list):
-                        directives_for_this_sub_task.extend(task_result["directives"])
+                    result = method_to_call(**tool_args)
+                    observation_data = {"status": "success", "tool_output": result}
                     
-                    for st_idx, st_val in enumerate(self.state.plan["sub_tasks"]):
-                        if st_val.get("id") == self.state.current_sub_task_id:
-                            self.state.plan["sub_tasks"][st_idx]["status"] = "completed" if current_status == "success" else "failed"
-                            break
-                
-                elif tool_name_str == "RequestClarificationTool.request_clarification":
-                    clarification_tool_instance = self.tools.get("RequestClarificationTool")
-                    if clarification_tool_instance:
-                        question_for_user = tool_args.get("question_for_user", "I need more details to proceed.")
-                        observation_data = clarification_tool_instance.request_clarification(question_for_user=question_for_user)
-                    else: observation_data = {"status": "error", "message": "RequestClarificationTool not found."}
-
-                elif tool_name_str and '.' in tool_name_str :
-                    try:
-                        target_tool_class_name, target_method_name = tool_name_str.split('.', 1)
-                        if target_tool_class_name in self.tools:
-                            tool_instance = self.tools[target_tool_class_name]
-                            if hasattr(tool_instance, target_method_name):
-                                method_to_call = getattr(tool_instance, target_method_name)
-                                print(f"Attempting to execute: {tool_name_str} with args: {json.dumps(tool_args, indent=2)}")
-
-                                if isinstance(tool_instance, self.llm_tool.__class__): # If it's an LLMTool call
-                                    # Always inject/override model_choice for generation, do NOT let LLM planner dictate it
-                                    if "generate_code_snippet" in target_method_name or \
-                                       "generate_multi_part_code_solution" in target_method_name:
-                                        tool_args['model_choice'] = self.state.mode_config.get('generation_model')
-                                        print(f"INFO: Set/Overrode model_choice to '{tool_args['model_choice']}' for {target_method_name}")
-                                    # For other LLMTool methods, model is usually passed or comes from planning_model in method itself
-                                
-                                result = method_to_call(**tool_args)
-                                observation_data = {"status": "success", "tool_output": result}
-                                
-                                if tool_name_str == "FileSystemTool.read_file": # Special handling for read_file observation
-                                    if result is not None:
-                                        self.state.update_file_cache(tool_args.get("file_path_str"), result)
-                                        observation_data["message"] = f"File '{tool_args.get('file_path_str')}' read successfully."
-                                    else: # File not found or read error
-                                        observation_data["status"] = "error" # Mark observation as error
-                                        observation_data["message"] = f"File '{tool_args.get('file_path_str')}' not found or could not be read."
-                                        self.state.update_file_cache(tool_args.get("file_path_str"), None) # Cache the failure
-
-                                elif tool_name_str == "LLMTool.generate_multi_part_code_solution" and isinstance(result, list):
-                                    observation_data["directives_generated"] = result # For planner's context in next step
-                                elif tool_name_str == "LLMTool.generate_code_snippet" and isinstance(result, list):
-                                    observation_data["generated_snippet"] = result # For planner's context
-
-                            else: observation_data = {"status": "error", "message": f"Method '{target_method_name}' not found in tool '{target_tool_class_name}'."}
-                        else: observation_data = {"status": "error", "message": f"Tool class '{target_tool_class_name}' not found."}
-                    except Exception as e:
-                        print(f"CRITICAL ERROR executing tool {tool_name_str}: {e}")
-                        import traceback; traceback.print_exc()
-                        observation_data = {"status": "error", "message": f"Tool execution failed: {str(e)}"}
-                else: observation_data = {"status": "error", "message": f"Invalid or missing tool_name format: '{tool_name_str}' (must be ToolClass.method_name)"}
-                
+                    if tool_name_str == "FileSystemTool.read_file": # Special handling for read_file observation
+                        if result is not None:
+                            self.state.update_file_cache(tool_args.get("file_path_str"), result)
+                            observation_data["message"] = f"File '{tool_args.get('file_path_str')}' read successfully."
+                        else: # File not found or read error
+                            observation_data["status"] = "error" # Mark observation as error
+                            observation_data["message"] = f"File '{tool_args.get('file_path_str')}' not found or could not be read."
+                            self.state.update_file_cache(tool_args.get("file_path_str"), None) # Cache the failure
+
+                    else:
+                        observation_data.update(self._generation_fields(tool_name_str, result))
+
+                else: observation_data = {"status": "error", "message": f"Method '{target_method_name}' not found in tool '{target_tool_class_name}'."}
+            else: observation_data = {"status": "error", "message": f"Tool class '{target_tool_class_name}' not found."}
+        except Exception as e:
+            print(f"CRITICAL ERROR executing tool {tool_name_str}: {e}")
+            import traceback; traceback.print_exc()
+            observation_data = {"status": "error", "message": f"Tool execution failed: {str(e)}"}
+        self.memo.store(tool_name_str, tool_args, observation_data)
+        return observation_data
+
+    @staticmethod
+    def _generation_fields(tool_name_str: str, result) -> dict:
+        """Observation fields that show the planner what a generation call produced."""
+        if tool_name_str == "LLMTool.generate_multi_part_code_solution" and isinstance(result, list):
+            return {"directives_generated": result} # For planner's context in next step
+        if tool_name_str == "LLMTool.generate_code_snippet" and isinstance(result, list):
+            return {"generated_snippet": result} # For planner's context
+        return {}
+
+    def _is_llm_generation_call(self, action: dict) -> bool:
+        tool_name_str = action.get("tool_name") or ""
+        return tool_name_str.startswith("LLMTool.") and tool_name_str.split(".", 1)[1] in self.llm_tool.BATCHED_GENERATION_METHODS
+
+    def _run_action_batch(self, actions: list) -> dict:
+        """Runs a batched step's independent tool calls concurrently and returns their combined observation."""
+        print(f"INFO: Sub-task '{self.state.current_sub_task_id}': Running a batch of {len(actions)} tool calls.")
+        def run_call(action: dict) -> dict:
+            return self._call_tool(action.get("tool_name"), action.get("arguments") if isinstance(action.get("arguments"), dict) else {})
+        def run_llm_calls(llm_actions: list) -> list[dict]:
+            calls = []
+            for action in llm_actions:
+                tool_args = dict(action.get("arguments") or {}) if isinstance(action.get("arguments"), dict) else {}
+                tool_args["model_choice"] = self.state.get_model('generation_model') # Never chosen by the planner
+                calls.append((action["tool_name"].split(".", 1)[1], tool_args))
+            try:
+                results = self.llm_tool.generate_many(calls, max_concurrency=int(self.batch_config["max_concurrency"]))
+            except (TypeError, ValueError) as e: # A call with bad arguments: run them one by one so only it fails
+                print(f"WARNING: Batched LLM calls could not be issued together ({e}). Running them one at a time.")
+                return [run_call(action) for action in llm_actions]
+            return [{"status": "success", "tool_output": result, **self._generation_fields(action["tool_name"], result)}
+                    for action, result in zip(llm_actions, results)]
+        observations = run_batch(actions, self.batch_config, run_call, run_llm_calls, self._is_llm_generation_call)
+        return combine_observations(actions, observations)
+
+    def _execute_sub_task(self, i: int, sub_task: dict, own_context: bool) -> list[dict]:
+        """Runs the ReAct loop for one sub-task and returns the directives it produced."""
+        sub_task_id = sub_task.get("id", f"sub_task_index_{i}")
+        if str(sub_task_id) in self.state.finished_sub_tasks: # Done in the run being resumed
+            print(f"\n>>> Sub-task ID '{sub_task_id}' already {sub_task.get('status', 'finished')} (restored from checkpoint) <<<")
+            return self.state.finished_sub_tasks[str(sub_task_id)]
+        if own_context: # Worker thread: the sub-task id and iteration count must not leak into other sub-tasks
+            self.state.enter_sub_task_context()
+        self.state.current_sub_task_id = sub_task_id
+        # A sub-task interrupted mid-way continues after its last recorded step, with its iteration count restored
+        resumed_steps = len(self.state.get_history_for_sub_task(sub_task_id))
+        self.state.planning_iterations_current_sub_task = self.state.resumed_planning_iterations.get(str(sub_task_id), 0) if resumed_steps else 0
+        print(f"\n>>> Executing Sub-task ID '{self.state.current_sub_task_id}': {sub_task.get('description')} <<<")
+        if resumed_steps:
+            print(f"INFO: Resuming sub-task '{sub_task_id}' after {resumed_steps} recorded steps.")
+
+        self.state.use_models({}) # The mode's models unless the budget assigns a tier
+        planning_model_str = self.state.get_model('planning_model') or ''
+        max_iterations = self.state.mode_config.get('max_planning_iterations_ollama', 10) # Default per-sub-task iter limit
+
+        current_iteration = resumed_steps
+        sub_task_completed_successfully = False
+        directives_for_this_sub_task = []
+
+
+        while current_iteration < max_iterations and not sub_task_completed_successfully:
+            if self._stop.is_set(): # Another sub-task raised or the run was interrupted; a resume picks this one up again
+                print(f"INFO: Stopping sub-task '{self.state.current_sub_task_id}' early; it stays unfinished.")
+                return directives_for_this_sub_task
+            current_iteration += 1
+            print(f"\n-- Sub-task ID '{self.state.current_sub_task_id}', Iteration {current_iteration}/{max_iterations} --")
+
+            if self.state.budget is not None: # Complexity tier, moved down if this sub-task outgrows its budget share
+                self.state.use_models(self.state.budget.choose_models(self.state, sub_task_id))
+                planning_model_str = self.state.get_model('planning_model') or ''
+
+            if self.state.check_api_limit_reached(planning_model_str): # Checks both OR total and sub-task iter
+                print(f"INFO: API/Iteration limit reached for sub-task '{self.state.current_sub_task_id}'. Stopping this sub-task.")
+                break
+            
+            thought_text, action_json_str = self.llm_tool.generate_plan_step(self.state)
+            self.state.increment_api_calls(planning_model_str)
+
+            if not action_json_str: # Error from generate_plan_step
+                print(f"ERROR: LLM failed to generate a valid action JSON for sub-task '{self.state.current_sub_task_id}'. Thought: '{thought_text}'. Skipping iteration.")
+                observation_data = {"status": "error", "message": "LLM failed to generate valid action JSON."}
+                self.state.add_history(self.state.current_sub_task_id, thought_text, {"error": "LLM action_json was None"}, observation_data)
+                continue
+            
+            try:
+                action_data = json.loads(action_json_str)
+                if isinstance(action_data, list) and len(action_data) == 1: action_data = action_data[0] # A batch of one is a plain step
+                if not isinstance(action_data, (dict, list)) or not action_data:
+                    raise json.JSONDecodeError("Action is not a JSON object or a non-empty array of them", action_json_str, 0)
+            except json.JSONDecodeError as e:
+                print(f"ERROR: Could not parse LLM action JSON: '{action_json_str}'. Error: {e}")
+                observation_data = {"status": "error", "message": f"Failed to parse LLM action JSON: {e}"}
+                self.state.add_history(self.state.current_sub_task_id, thought_text, {"error": "parse failed", "raw_action": action_json_str}, observation_data)
+                continue
+
+            is_finish = isinstance(action_data, dict) and action_data.get("tool_name") == "finish_sub_task"
+            cycle_length = None if is_finish else self.memo.check_step(sub_task_id, action_data)
+            if cycle_length: # The planner is going round in circles: the repeat is not run
+                self.memo.count("tool_calls_saved", len(action_data) if isinstance(action_data, list) else 1)
+                observation_data = loop_observation(cycle_length, int(self.memo.config["cycle_repeats"]))
+                if self.memo.should_end_sub_task(sub_task_id):
+                    print(f"WARNING: Sub-task '{self.state.current_sub_task_id}' keeps repeating the same actions. Ending it early.")
+                    self.memo.count("sub_tasks_ended_early")
+                    self.memo.count("iterations_saved", max_iterations - current_iteration)
+                    observation_data["message"] += " The sub-task was ended because the loop continued."
+                    self.state.add_history(self.state.current_sub_task_id, thought_text, action_data, observation_data)
+                    break
+                print(f"WARNING: Sub-task '{self.state.current_sub_task_id}': Repeated action (cycle of {cycle_length}) not run; asking the planner to change course.")
                 self.state.add_history(self.state.current_sub_task_id, thought_text, action_data, observation_data)
-                if observation_data.get("status") == "error":
-                    print(f"WARNING: Error in iteration for sub-task '{self.state.current_sub_task_id}', observation: {observation_data.get('message')}")
+                continue
 
-            # After sub-task loop finishes (completed or max iterations)
-            if directives_for_this_sub_task: # If this sub-task produced directives
-                all_sub_task_directives_groups.append(directives_for_this_sub_task)
-            
-            if not sub_task_completed_successfully:
-                print(f"WARNING: Sub-task ID '{self.state.current_sub_task_id}' did not complete successfully within {max_iterations} iterations.")
+            if isinstance(action_data, list): # Independent tool calls, run together as one step
+                observation_data = self._run_action_batch(action_data)
+                self.state.add_history(self.state.current_sub_task_id, thought_text, action_data, observation_data)
+                if observation_data.get("status") != "success":
+                    print(f"WARNING: Batched step for sub-task '{self.state.current_sub_task_id}': {observation_data.get('message')}")
+                continue
+
+            tool_name_str = action_data.get("tool_name")
+            tool_args = action_data.get("arguments", {}) if isinstance(action_data.get("arguments"), dict) else {} # Ensure args is a dict
+
+            if tool_name_str == "finish_sub_task":
+                print(f"INFO: Sub-task ID '{self.state.current_sub_task_id}' marked as finished by LLM.")
+                sub_task_completed_successfully = True 
+                task_result = action_data.get("result", {})
+                current_status = task_result.get("status", "success") # Assume success if not specified
+                observation_data = {"status": current_status, "message": task_result.get("message", "Sub-task completed.")}
+                
+                # Collect directives if present and task was successful
+                if current_status == "success" and "directives" in task_result and isinstance(task_result["directives"], list):
+                    directives_for_this_sub_task.extend(task_result["directives"])
+                
                 for st_idx, st_val in enumerate(self.state.plan["sub_tasks"]):
                     if st_val.get("id") == self.state.current_sub_task_id:
-                        self.state.plan["sub_tasks"][st_idx]["status"] = "failed"
+                        self.state.plan["sub_tasks"][st_idx]["status"] = "completed" if current_status == "success" else "failed"
                         break
-        
-        self.state.current_sub_task_id = None
-        return all_sub_task_directives_groups
+            
+            elif tool_name_str == "RequestClarificationTool.request_clarification":
+                clarification_tool_instance = self.tools.get("RequestClarificationTool")
+                if clarification_tool_instance:
+                    question_for_user = tool_args.get("question_for_user", "I need more details to proceed.")
+                    observation_data = clarification_tool_instance.request_clarification(question_for_user=question_for_user)
+                else: observation_data = {"status": "error", "message": "RequestClarificationTool not found."}
+
+            else:
+                observation_data = self._call_tool(tool_name_str, tool_args)
+            
+            self.state.add_history(self.state.current_sub_task_id, thought_text, action_data, observation_data)
+            if observation_data.get("status") == "error":
+                print(f"WARNING: Error in iteration for sub-task '{self.state.current_sub_task_id}', observation: {observation_data.get('message')}")
+
+        # After sub-task loop finishes (completed or max iterations)
+        if not sub_task_completed_successfully:
+            print(f"WARNING: Sub-task ID '{self.state.current_sub_task_id}' did not complete successfully within {max_iterations} iterations.")
+            for st_idx, st_val in enumerate(self.state.plan["sub_tasks"]):
+                if st_val.get("id") == self.state.current_sub_task_id:
+                    self.state.plan["sub_tasks"][st_idx]["status"] = "failed"
+                    break
+        self.state.finish_sub_task(sub_task_id, sub_task.get("status", "failed"), directives_for_this_sub_task)
+        return directives_for_this_sub_task
 
 
 class ClarificationModule:
     def __init__(self, state_manager: StateManager):
         self.state = state_manager
+        self._input_lock = threading.Lock() # Sub-tasks running in parallel ask their questions one at a time
 
     def _ask_user_interaction(self, question_text: str) -> str:
         current_task_id_display = self.state.current_sub_task_id if self.state.current_sub_task_id is not None else 'N/A'
-        print(f"\n🤔 AI Clarification Request (Sub-task ID '{current_task_id_display}'):")
-        print(f"{question_text}")
-        user_response = ""
-        try:
-            user_response = input("Your response: ").strip()
-        except KeyboardInterrupt:
-            print("\nUser cancelled clarification.")
-            user_response = "User cancelled." # Or some other indicator
+        with self._input_lock:
+            print(f"\n🤔 AI Clarification Request (Sub-task ID '{current_task_id_display}'):")
+            print(f"{question_text}")
+            user_response = ""
+            try:
+                user_response = input("Your response: ").strip()
+            except KeyboardInterrupt:
+                print("\nUser cancelled clarification.")
+                user_response = "User cancelled." # Or some other indicator
         return user_response
     
     def request_clarification(self, question_for_user: str) -> dict:
@@ -5,12 +5,22 @@ import yaml # pip install PyYAML
 from pathlib import Path
 import os
 import json # For LLM action parsing
+import copy
+import threading
 
 # --- Project Imports ---
 import replacer_core
 from tools import FileSystemTool, LLMTool, CodeAnalysisTool, ChangeOrchestratorTool
 from connectors import OpenRouterConnector, OllamaConnector # Assuming these are stable
 from advanced_planner_tools import StateManager, TaskDecomposer, ReActPlannerExecutor, ClarificationModule
+from code_index import open_code_index
+from checkpoint import DEFAULT_CHECKPOINT_CONFIG, RunCheckpoint, restore_state
+from prefetch import DEFAULT_PREFETCH_CONFIG, Prefetcher, files_in_prompt
+from budget import BudgetScheduler
+from action_memo import ActionMemo
+from plan_cache import PlanCache, open_plan_cache
+from batch_runner import BatchRunner, apply_overrides
+from agent_daemon import AgentDaemon
 
 class Config:
     def __init__(self, config_path_str="config_agent.yaml"):
@@ -63,6 +73,129 @@ class Config:
             return env_val
         return default
 
+def get_typed_config_section(config_loader: Config, prefix: str, key_types: dict) -> dict:
+    # Only keys present in the config are returned; callers fill in their own defaults for the rest.
+    section = {}
+    for key, type_hint in key_types.items():
+        value = config_loader.get(f"{prefix}.{key}", default=None)
+        if value is None:
+            continue
+        if type_hint is bool:
+            value = value if isinstance(value, bool) else str(value).lower() in ['true', '1', 't', 'y', 'yes']
+        else:
+            value = type_hint(value)
+        section[key] = value
+    return section
+
+def get_http_pool_config(config_loader: Config, provider: str) -> dict:
+    return get_typed_config_section(config_loader, f"{provider}.http", {
+        "pool_connections": int, "pool_maxsize": int, "pool_block": bool, "keep_alive": bool,
+        "connect_timeout": float, "read_timeout": float,
+    })
+
+def get_resilience_config(config_loader: Config, provider: str) -> dict:
+    return get_typed_config_section(config_loader, f"resilience.{provider}", {
+        "max_retries": int, "base_delay": float, "max_delay": float, "max_retry_after": float,
+        "rate_per_second": float, "burst": int, "failure_threshold": int, "recovery_timeout": float,
+    })
+
+def get_routing_config(config_loader: Config) -> dict | None:
+    # No routing section means plain single-model calls
+    if not isinstance(config_loader.get("routing"), dict):
+        return None
+    routing_config = get_typed_config_section(config_loader, "routing", {
+        "order_fallbacks_by_latency": bool, "hedge": bool, "hedge_percentile": float, "hedge_min_delay": float,
+        "hedge_max_delay": float, "min_samples": int, "ewma_alpha": float,
+    })
+    fallbacks = config_loader.get("routing.fallbacks", default=None)
+    if isinstance(fallbacks, str):
+        fallbacks = [fallbacks]
+    routing_config["fallbacks"] = [str(m) for m in (fallbacks or [])]
+    return routing_config
+
+def get_prompt_budget_config(config_loader: Config) -> dict:
+    prompt_budget_config = get_typed_config_section(config_loader, "prompt_budget", {
+        "default_tokens": int, "history_steps": int, "max_field_chars": int,
+    })
+    per_model = config_loader.get("prompt_budget.models", default=None)
+    if isinstance(per_model, dict):
+        prompt_budget_config["models"] = {str(k): int(v) for k, v in per_model.items()}
+    return prompt_budget_config
+
+def get_prompt_cache_config(config_loader: Config) -> dict:
+    prompt_cache_config = {}
+    keep_alive = config_loader.get("prompt_cache.keep_alive", default=None)
+    if keep_alive is not None: # Ollama takes a duration string ("30m") or a number of seconds (-1 = keep loaded)
+        prompt_cache_config["keep_alive"] = keep_alive if isinstance(keep_alive, (int, float)) else str(keep_alive)
+    models = config_loader.get("prompt_cache.cache_control_models", default=None)
+    if isinstance(models, list):
+        prompt_cache_config["cache_control_models"] = [str(m) for m in models]
+    return prompt_cache_config
+
+def get_retrieval_config(config_loader: Config) -> dict:
+    retrieval_config = get_typed_config_section(config_loader, "retrieval", {
+        "enabled": bool, "index_dir": str, "embedder": str, "ollama_model": str, "dimensions": int, "top_k": int,
+        "prompt_chunk_chars": int, "chunk_lines": int, "chunk_overlap": int, "max_file_bytes": int,
+    })
+    for key in ("extensions", "exclude_dirs"):
+        value = config_loader.get(f"retrieval.{key}", default=None)
+        if isinstance(value, list):
+            retrieval_config[key] = [str(v) for v in value]
+    return retrieval_config
+
+def get_checkpoint_config(config_loader: Config) -> dict:
+    return {**DEFAULT_CHECKPOINT_CONFIG, **get_typed_config_section(config_loader, "checkpoint", {"enabled": bool, "dir": str})}
+
+def open_run_checkpoint(config_loader: Config, state_manager: StateManager, project_base_path: Path,
+                        resume_run_id: str | None, resume_records: list | None) -> RunCheckpoint | None:
+    # Restores the state of a resumed run, or starts a new checkpoint; must run before the plan is set
+    checkpoint_config = get_checkpoint_config(config_loader)
+    if resume_run_id:
+        checkpoint = RunCheckpoint.open(checkpoint_config["dir"], resume_run_id)
+        restored = restore_state(state_manager, resume_records or [], checkpoint)
+        print(f"INFO: Resumed run '{resume_run_id}': {restored['finished_sub_tasks']} finished sub-tasks, {restored['steps']} steps "
+              f"and {restored['llm_calls']} LLM calls restored from {checkpoint.path}")
+        if restored["changed_files"]:
+            print(f"WARNING: Files changed since the checkpoint (earlier observations of them may be stale): {', '.join(restored['changed_files'])}")
+    elif checkpoint_config["enabled"]:
+        try:
+            checkpoint = RunCheckpoint.create(checkpoint_config["dir"])
+            checkpoint.write_start(state_manager, project_base_path)
+        except OSError as e:
+            print(f"WARNING: Could not create run checkpoint in '{checkpoint_config['dir']}': {e}. Continuing without checkpoints.")
+            return None
+        print(f"INFO: Checkpointing run '{checkpoint.run_id}' to {checkpoint.path}")
+    else:
+        return None
+    state_manager.checkpoint = checkpoint
+    return checkpoint
+
+def get_prefetch_config(config_loader: Config) -> dict:
+    return {**DEFAULT_PREFETCH_CONFIG, **get_typed_config_section(config_loader, "prefetch", {
+        "enabled": bool, "max_files": int, "max_file_bytes": int, "wait_for_reads_s": float, "workers": int,
+    })}
+
+def get_plan_cache_config(config_loader: Config) -> dict:
+    return get_typed_config_section(config_loader, "plan_cache", {
+        "enabled": bool, "path": str, "max_entries": int, "max_age_days": float, "near_duplicate_threshold": float, "shingle_size": int,
+    })
+
+def get_budget_config(config_loader: Config) -> dict:
+    budget_config = get_typed_config_section(config_loader, "budget", {
+        "max_tokens": int, "max_cost_usd": float, "max_wall_s": float, "estimate_prompt_tokens_per_step": int,
+        "estimate_completion_tokens_per_step": int, "estimate_seconds_per_step": float,
+    })
+    tiers = config_loader.get("budget.tiers", default=None)
+    if isinstance(tiers, dict):
+        budget_config["tiers"] = {str(tier): {str(k): str(v) for k, v in (models or {}).items()} for tier, models in tiers.items()}
+    prices = config_loader.get("budget.prices", default=None)
+    if isinstance(prices, dict): # model -> [USD per 1M prompt tokens, USD per 1M completion tokens]
+        budget_config["prices"] = {str(model): [float(p) for p in price] for model, price in prices.items() if isinstance(price, list) and len(price) == 2}
+    steps = config_loader.get("budget.steps_by_complexity", default=None)
+    if isinstance(steps, dict):
+        budget_config["steps_by_complexity"] = {str(k): int(v) for k, v in steps.items()}
+    return budget_config
+
 def get_yes_no_input(prompt_message: str, default_yes: bool = True) -> bool:
     suffix = " (Y/n)" if default_yes else " (y/N)"
     while True:
@@ -75,9 +208,231 @@ def get_yes_no_input(prompt_message: str, default_yes: bool = True) -> bool:
         except EOFError: return default_yes
         except KeyboardInterrupt: print("\nInput cancelled."); return False
 
+def print_llm_usage_summary(state_manager: StateManager):
+    usage_summary = state_manager.get_llm_usage_summary()
+    totals = usage_summary["totals"]
+    if not totals["calls"]:
+        return
+    def fmt_bucket(bucket):
+        ttft = f", avg TTFT {bucket['avg_ttft_s'] * 1000:.0f} ms" if bucket["avg_ttft_s"] is not None else ""
+        prefix_cached = f" ({bucket['cached_prompt_tokens']} from provider prompt cache)" if bucket["cached_prompt_tokens"] else ""
+        prefill = f", {bucket['prefill_time_s']:.1f}s prefill" if bucket["prefill_time_s"] else ""
+        return (f"{bucket['calls']} calls ({bucket['cached_calls']} cached, {bucket['errors']} errors), "
+                f"{bucket['wall_time_s']:.1f}s wall{ttft}, {bucket['prompt_tokens']} prompt{prefix_cached} + {bucket['completion_tokens']} completion tokens, "
+                f"{bucket['load_time_s']:.1f}s model load{prefill}")
+    print("\n--- LLM Usage Summary ---")
+    print(f"Total: {fmt_bucket(totals)}")
+    for model_name, bucket in usage_summary["per_model"].items():
+        print(f"  Model '{model_name}': {fmt_bucket(bucket)}")
+    for sub_task_id, bucket in usage_summary["per_sub_task"].items():
+        print(f"  Sub-task '{sub_task_id}': {fmt_bucket(bucket)}")
+
+def print_budget_summary(state_manager: StateManager):
+    if state_manager.budget is None or not state_manager.budget.sub_tasks:
+        return
+    budget_report = state_manager.budget.report(state_manager)
+    def fmt(spend):
+        return f"{spend.get('tokens', 0):.0f} tokens, ${spend.get('cost_usd', 0):.4f}, {spend.get('wall_s', 0):.1f}s"
+    print("\n--- Budget Summary ---")
+    limits = ", ".join(f"{dim} {limit:g}" for dim, limit in budget_report["limits"].items() if limit) or "none"
+    print(f"Limits: {limits}; {budget_report['downgrades']} tier downgrade(s)"
+          + (f"; stopped: {budget_report['stopped_reason']}" if budget_report["stopped_reason"] else ""))
+    print(f"Projected: {fmt(budget_report['projected'])} | Actual: {fmt(budget_report['actual'])}")
+    for sub_task_id, entry in budget_report["per_sub_task"].items():
+        tier = entry["tier"] if entry["final_tier"] == entry["tier"] else f"{entry['tier']} -> {entry['final_tier']}"
+        print(f"  Sub-task '{sub_task_id}' ({tier}, {(entry['models'] or {}).get('planning_model')}): "
+              f"projected {fmt(entry['projected'])} | actual {fmt(entry['actual'])}")
+
+def print_plan_cache_summary(plan_cache: PlanCache | None):
+    if plan_cache is None:
+        return
+    plan_cache_stats = plan_cache.get_stats()
+    if plan_cache_stats["exact_hits"] or plan_cache_stats["near_hits"]:
+        print(f"INFO: Plan cache: Plan reused ({'exact prompt' if plan_cache_stats['exact_hits'] else 'near-duplicate prompt'}, "
+              f"similarity {plan_cache_stats['last_match']['similarity']}); {plan_cache_stats['entries']} plans cached.")
+    elif plan_cache_stats["stores"]:
+        print(f"INFO: Plan cache: New plan stored; {plan_cache_stats['entries']} plans cached.")
+
+def print_action_memo_summary(action_memo: ActionMemo):
+    memo_stats = action_memo.get_stats()
+    if memo_stats["memo_hits"] or memo_stats["loops_detected"]:
+        print(f"INFO: Action memo: {memo_stats['memo_hits']} repeated tool call(s) answered from earlier results, "
+              f"{memo_stats['loops_detected']} repeated-action loop(s) stopped, {memo_stats['sub_tasks_ended_early']} sub-task(s) ended early; "
+              f"{memo_stats['tool_calls_saved']} tool call(s) and {memo_stats['iterations_saved']} iteration(s) saved.")
+
+def write_run_report(report_path_str: str | None, state_manager: StateManager, llm_tool: LLMTool, prefetcher: Prefetcher | None = None,
+                     action_memo: ActionMemo | None = None, plan_cache: PlanCache | None = None):
+    if not report_path_str:
+        return
+    report = {
+        "user_prompt": state_manager.user_prompt,
+        "operational_mode": state_manager.operational_mode,
+        "run_id": state_manager.checkpoint.run_id if state_manager.checkpoint is not None else None,
+        "plan": state_manager.plan,
+        "llm_usage": state_manager.get_llm_usage_summary(),
+        "llm_calls": state_manager.llm_usage_records,
+        "provider_resilience": llm_tool.get_resilience_stats(),
+        "routing": llm_tool.get_routing_stats(),
+        "structured_output": llm_tool.get_structured_output_stats(),
+        "llm_cache": llm_tool.get_cache_stats(),
+        "retrieval": llm_tool.code_index.get_stats() if llm_tool.code_index is not None else None,
+        "file_cache": state_manager.file_cache.get_stats(),
+        "observation_store": state_manager.observations.get_stats(),
+        "prefetch": prefetcher.get_stats() if prefetcher is not None else None,
+        "budget": state_manager.budget.report(state_manager) if state_manager.budget is not None else None,
+        "action_memo": action_memo.get_stats() if action_memo is not None else None,
+        "plan_cache": plan_cache.get_stats() if plan_cache is not None else None,
+    }
+    report_path = Path(report_path_str)
+    try:
+        report_path.write_text(json.dumps(report, indent=2, default=str), encoding='utf-8')
+        print(f"INFO: Run report written to: {report_path.resolve()}")
+    except Exception as e:
+        print(f"WARNING: Could not write run report: {e}")
+
+def print_llm_cache_summary(llm_tool: LLMTool):
+    cache_stats = llm_tool.get_cache_stats()
+    if cache_stats and (cache_stats["hits"] or cache_stats["misses"]):
+        print(f"INFO: LLM response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+              f"({cache_stats['hit_rate']:.0%}), {cache_stats['bytes_saved']} response bytes served from cache, "
+              f"{cache_stats['entries']} entries ({cache_stats['total_bytes']} bytes), {cache_stats['evictions']} evicted.")
+
+def print_file_cache_summary(state_manager: StateManager):
+    file_cache_stats = state_manager.file_cache.get_stats()
+    if file_cache_stats["hits"] or file_cache_stats["misses"]:
+        print(f"INFO: File cache: {file_cache_stats['hits']} hits / {file_cache_stats['misses']} misses "
+              f"({file_cache_stats['hit_rate']:.0%}), {file_cache_stats['loads']} files read from disk "
+              f"({file_cache_stats['bytes_loaded']} bytes, {file_cache_stats['mmap_loads']} via mmap), "
+              f"{file_cache_stats['invalidated']} stale, {file_cache_stats['evictions']} evicted.")
+
+def print_observation_store_summary(state_manager: StateManager):
+    store_stats = state_manager.observations.get_stats()
+    if store_stats["blobs"] or store_stats["deduplicated"]:
+        print(f"INFO: Observation store: {store_stats['blobs']} results stored ({store_stats['deduplicated']} duplicates), "
+              f"{store_stats['inline_chars_replaced']} chars kept out of the history as {store_stats['handle_chars']} chars of handles, "
+              f"{store_stats['memory_bytes']} bytes in memory, {store_stats['spilled']} spilled to disk.")
+
+def print_prefetch_summary(prefetcher: Prefetcher | None):
+    if prefetcher is None:
+        return
+    prefetch_stats = prefetcher.get_stats()
+    if prefetch_stats["requested"]:
+        print(f"INFO: Prefetch: {prefetch_stats['read']}/{prefetch_stats['requested']} files read ahead "
+              f"({prefetch_stats['skipped']} too large, {prefetch_stats['failed']} missing), {prefetch_stats['analysed']} analysed, "
+              f"{prefetch_stats['indexed']} checked against the retrieval index; the first plan step waited {prefetch_stats['waited_s']:.2f}s for them.")
+
+def print_provider_resilience_summary(llm_tool: LLMTool):
+    for provider_name, stats in llm_tool.get_resilience_stats().items():
+        if not stats.get("calls"):
+            continue
+        print(f"INFO: Provider '{provider_name}': {stats['calls']} calls, {stats['retries']} retries, "
+              f"{stats['throttle_waits']} throttling waits ({stats['throttle_wait_seconds']:.1f}s), "
+              f"{stats['breaker_trips']} breaker trips, {stats['breaker_rejections']} fast-failed (breaker {stats['breaker_state']}).")
+
+def print_routing_summary(llm_tool: LLMTool):
+    stats = llm_tool.get_routing_stats()
+    if not stats or not stats["routed_calls"]:
+        return
+    print(f"INFO: Routing: {stats['routed_calls']} routed calls, {stats['fallbacks_used']} fallbacks, "
+          f"{stats['hedges_fired']} hedges fired ({stats['hedges_won']} won).")
+    for model_choice, model_stats in stats["models"].items():
+        if model_stats["ewma_latency_s"] is not None:
+            print(f"  Model '{model_choice}': EWMA latency {model_stats['ewma_latency_s']:.2f}s over {model_stats['samples']} calls, "
+                  f"{model_stats['failures']} failures.")
+
+def print_structured_output_summary(llm_tool: LLMTool):
+    stats = llm_tool.get_structured_output_stats()
+    if not stats["calls"]:
+        return
+    print(f"INFO: Structured output ({llm_tool.structured_output_mode}): {stats['calls']} JSON calls, {stats['valid_first_try']} valid first try, "
+          f"{stats['repair_asks']} repair re-asks ({stats['repaired']} repaired), {stats['failed']} failed.")
+
+def execute_plan_and_apply_changes(react_planner: ReActPlannerExecutor, state_manager: StateManager,
+                                   change_orchestrator_tool: ChangeOrchestratorTool, fs_tool: FileSystemTool,
+                                   dry_run: bool, no_backup: bool, skip_confirmation: bool, preview_path_str: str = "ai_agent_preview.md"):
+    print("\n--- Stage 2: Plan Execution ---")
+    sub_task_groups = react_planner.execute_plan()
+    all_directive_groups = [directives for _, directives in sub_task_groups]
+
+    if not all_directive_groups:
+        print("INFO: Planner did not produce any change directives after all sub-tasks. Exiting.")
+        return
+
+    print("\n--- Stage 3: Consolidating All Proposed Changes ---")
+    flat_directives = []
+    if all_directive_groups and isinstance(all_directive_groups, list):
+        for group in all_directive_groups:
+            if group and isinstance(group, list):
+                flat_directives.extend(d for d in group if isinstance(d, dict))
+    
+    if not flat_directives:
+        print("INFO: No valid changes (directives) were proposed by the agent after plan execution.")
+        return
+
+    print("Summary of proposed changes:")
+    for i, (sub_task, directive_group) in enumerate(sub_task_groups):
+        if directive_group and isinstance(directive_group, list):
+            sub_task_desc = f"Sub-task '{sub_task.get('id', i+1)}': {sub_task.get('description', 'N/A')[:50]}..."
+            print(f"  From {sub_task_desc}:")
+            for directive in directive_group:
+                if isinstance(directive, dict):
+                     print(f"    - File: {directive.get('file_path', 'N/A')}, Type: {directive.get('change_type', 'N/A')}, Code lines: {len(directive.get('code_snippet', []))}")
+
+    preview_content = ["# AI Code Agent Proposed Changes\n"]
+    for i, (sub_task, directive_group) in enumerate(sub_task_groups):
+        if directive_group and isinstance(directive_group, list):
+            sub_task_header = f"From Sub-task '{sub_task.get('id', i+1)}': {sub_task.get('description', '')}"
+
+            preview_content.append(f"\n## {sub_task_header}\n")
+            for directive in directive_group:
+                if isinstance(directive, dict):
+                    preview_content.append(f"### File: {directive.get('file_path')}\n")
+                    preview_content.append(f"Change Type: {directive.get('change_type')}\n")
+                    if directive.get('target_element_selector'):
+                         preview_content.append(f"Target Selector: {directive.get('target_element_selector')}\n")
+                    if directive.get('block_identifier'): # block_identifier could be None
+                         preview_content.append(f"Target Block Identifier: {json.dumps(directive.get('block_identifier'))}\n")
+                    
+                    code_snippet_preview = directive.get('code_snippet', [])
+                    # Ensure code_snippet_preview is a list of strings
+                    if not isinstance(code_snippet_preview, list):
+                        code_snippet_preview = str(code_snippet_preview).splitlines()
+                    code_snippet_str = "\n".join(code_snippet_preview)
+
+                    preview_content.append("```\n" + code_snippet_str + "\n```\n")
+    
+    preview_file_path = Path(preview_path_str)
+    try:
+        preview_file_path.write_text("\n".join(preview_content), encoding='utf-8')
+        print(f"\n✨ Detailed preview of all changes saved to: {preview_file_path.resolve()}")
+    except Exception as e:
+        print(f"WARNING: Could not write preview file: {e}")
+
+    if skip_confirmation or get_yes_no_input("\nAI> Proceed with applying these changes?", default_yes=not dry_run):
+        if dry_run:
+            print("\n--- Dry Run Mode: Simulating application of changes. ---")
+            # In dry run, ChangeOrchestratorTool will show diffs but not write
+            change_orchestrator_tool.apply_all_changes(
+                all_directive_groups, fs_tool, replacer_core, state_manager, no_backup
+            )
+            print("--- Dry Run Complete. No files modified. ---")
+        else:
+            print("\n--- Stage 4: Applying Changes ---")
+            final_success = change_orchestrator_tool.apply_all_changes(
+                all_directive_groups, fs_tool, replacer_core, state_manager, no_backup
+            )
+            if final_success:
+                print("✅ AI Agent successfully applied all changes.")
+            else:
+                print("❌ AI Agent encountered errors during change application. Some changes might be partial. Please review.")
+    else:
+        print("INFO: Operation cancelled by user. No changes applied.")
+    print("\n🤖 AI Agent run complete.")
+
 def run_advanced_agent(user_prompt: str, config_loader: Config, op_mode_name: str,
                        project_base_path: Path,
-                       dry_run: bool, no_backup: bool, skip_confirmation: bool):
+                       dry_run: bool, no_backup: bool, skip_confirmation: bool,
+                       resume_run_id: str | None = None, resume_records: list | None = None):
     print(f"🤖 AI Agent activated. Operational Mode: {op_mode_name.upper()}")
     print(f"User Prompt: \"{user_prompt}\"")
     print(f"Project Base Path: {project_base_path.resolve()}")
@@ -129,23 +484,53 @@ def run_advanced_agent(user_prompt: str, config_loader: Config, op_mode_name: st
             "max_tokens_generation": int(max_gen_tokens) # Ensure int
         },
         project_base_path=project_base_path,
-        dry_run=dry_run
+        dry_run=dry_run,
+        file_cache_config=get_typed_config_section(config_loader, "file_cache", {"max_bytes": int, "mmap_threshold_bytes": int}),
+        observation_store_config=get_typed_config_section(config_loader, "observation_store", {
+            "inline_max_chars": int, "max_memory_bytes": int, "spill_dir": str, "max_age_days": float,
+            "expand_recent_steps": int, "expand_max_chars": int,
+        })
     )
 
+    checkpoint = open_run_checkpoint(config_loader, state_manager, project_base_path, resume_run_id, resume_records)
+
     llm_tool_config_data = {
         "OPENROUTER_API_KEY": config_loader.get("openrouter.api_key"),
+        "OPENROUTER_BASE_URL": config_loader.get("openrouter.base_url"),
         "OPENROUTER_SITE_URL": config_loader.get("openrouter.site_url"),
         "OPENROUTER_REFERRER": config_loader.get("openrouter.app_name"),
         "OLLAMA_BASE_URL": config_loader.get("ollama.base_url", "http://localhost:11434"),
+        "OPENROUTER_HTTP": get_http_pool_config(config_loader, "openrouter"),
+        "OPENROUTER_STREAM": config_loader.get("openrouter.stream", False),
+        "OLLAMA_HTTP": get_http_pool_config(config_loader, "ollama"),
+        "OPENROUTER_RESILIENCE": get_resilience_config(config_loader, "openrouter"),
+        "OLLAMA_RESILIENCE": get_resilience_config(config_loader, "ollama"),
+        "LLM_CACHE": get_typed_config_section(config_loader, "llm_cache", {
+            "enabled": bool, "path": str, "max_bytes": int, "max_age_days": float, "max_temperature": float,
+        }),
+        "LLM_ROUTING": get_routing_config(config_loader),
+        "PROMPT_BUDGET": get_prompt_budget_config(config_loader),
+        "STRUCTURED_OUTPUT": get_typed_config_section(config_loader, "structured_output", {"mode": str, "repair_attempts": int}),
+        "PROMPT_CACHE": get_prompt_cache_config(config_loader),
         "DEFAULT_MODEL_CHOICE": config_loader.get("DEFAULT_MODEL_CHOICE", "ollama/mistral:7b"),
         "MAX_TOKENS_GENERATION": int(max_gen_tokens)
     }
     llm_tool = LLMTool(llm_tool_config_data)
-    fs_tool = FileSystemTool(project_base_path=project_base_path)
-    code_analysis_tool = CodeAnalysisTool()
+    llm_tool.usage_recorder = state_manager.record_llm_usage
+    state_manager.budget = BudgetScheduler(get_budget_config(config_loader), state_manager.mode_config)
+    llm_tool.code_index = open_code_index(project_base_path, get_retrieval_config(config_loader), llm_tool_config_data["OLLAMA_BASE_URL"])
+    fs_tool = FileSystemTool(project_base_path=project_base_path, file_cache=state_manager.file_cache)
+    code_analysis_tool = CodeAnalysisTool(code_index=llm_tool.code_index)
     change_orchestrator_tool = ChangeOrchestratorTool()
 
-    task_decomposer = TaskDecomposer(llm_tool, state_manager)
+    # Files named in the prompt are read while the task is decomposed, the plan's files as soon as there is a plan
+    prefetch_config = get_prefetch_config(config_loader)
+    prefetcher = Prefetcher(state_manager, code_analysis_tool, llm_tool.code_index, prefetch_config) if prefetch_config["enabled"] else None
+    if prefetcher is not None:
+        prefetcher.submit(files_in_prompt(user_prompt, project_base_path), "prompt")
+
+    plan_cache = open_plan_cache(project_base_path, get_plan_cache_config(config_loader))
+    task_decomposer = TaskDecomposer(llm_tool, state_manager, plan_cache)
     clarification_module = ClarificationModule(state_manager)
     
     available_tools = {
@@ -155,9 +540,19 @@ def run_advanced_agent(user_prompt: str, config_loader: Config, op_mode_name: st
         "ChangeOrchestratorTool": change_orchestrator_tool,
         "RequestClarificationTool": clarification_module
     }
-    react_planner = ReActPlannerExecutor(llm_tool, state_manager, available_tools, clarification_module)
-
-    if allow_task_decomposition:
+    react_planner = ReActPlannerExecutor(llm_tool, state_manager, available_tools, clarification_module,
+                                         scheduler_config=get_typed_config_section(config_loader, "scheduler", {"max_parallel_sub_tasks": int}),
+                                         batch_config=get_typed_config_section(config_loader, "action_batch", {
+                                             "max_calls": int, "max_llm_calls": int, "max_concurrency": int,
+                                         }),
+                                         memo_config=get_typed_config_section(config_loader, "action_memo", {
+                                             "enabled": bool, "cycle_repeats": int, "max_cycle_length": int, "max_loop_warnings": int,
+                                             "max_entries": int,
+                                         }))
+
+    if state_manager.plan is not None:
+        print("\n--- Stage 1: Skipping Task Decomposition (plan restored from checkpoint) ---")
+    elif allow_task_decomposition:
         print("\n--- Stage 1: Task Decomposition ---")
         plan = task_decomposer.decompose()
         if not plan or not plan.get("sub_tasks"):
@@ -175,94 +570,113 @@ def run_advanced_agent(user_prompt: str, config_loader: Config, op_mode_name: st
         }
         state_manager.set_plan(plan)
 
-    print("\n--- Stage 2: Plan Execution ---")
-    all_directive_groups = react_planner.execute_plan()
-
-    if not all_directive_groups:
-        print("INFO: Planner did not produce any change directives after all sub-tasks. Exiting.")
-        return
-
-    print("\n--- Stage 3: Consolidating All Proposed Changes ---")
-    flat_directives = []
-    if all_directive_groups and isinstance(all_directive_groups, list):
-        for group in all_directive_groups:
-            if group and isinstance(group, list):
-                flat_directives.extend(d for d in group if isinstance(d, dict))
-    
-    if not flat_directives:
-        print("INFO: No valid changes (directives) were proposed by the agent after plan execution.")
-        return
-
-    print("Summary of proposed changes:")
-    for i, directive_group in enumerate(all_directive_groups):
-        if directive_group and isinstance(directive_group, list):
-            # Try to get sub-task description for better summary
-            sub_task_desc = f"Step {i+1}"
-            if state_manager.plan and state_manager.plan.get("sub_tasks") and i < len(state_manager.plan["sub_tasks"]):
-                sub_task_id_ref = state_manager.plan["sub_tasks"][i].get("id")
-                sub_task_desc = f"Sub-task '{state_manager.plan['sub_tasks'][i].get('id', i+1)}': {state_manager.plan['sub_tasks'][i].get('description', 'N/A')[:50]}..."
+    state_manager.budget.plan(state_manager) # Per-sub-task tiers and projected spend
 
-            print(f"  From {sub_task_desc}:")
-            for directive in directive_group:
-                if isinstance(directive, dict):
-                     print(f"    - File: {directive.get('file_path', 'N/A')}, Type: {directive.get('change_type', 'N/A')}, Code lines: {len(directive.get('code_snippet', []))}")
+    if prefetcher is not None:
+        prefetcher.submit_plan(state_manager.plan)
+        prefetcher.wait_for_reads() # So the first plan-step prompt lists them as cached; analysis keeps running meanwhile
 
-    preview_content = ["# AI Code Agent Proposed Changes\n"]
-    for i, directive_group in enumerate(all_directive_groups):
-        if directive_group and isinstance(directive_group, list):
-            sub_task_header = f"From Sub-task/Plan Step {i+1}"
-            if state_manager.plan and state_manager.plan.get("sub_tasks") and i < len(state_manager.plan["sub_tasks"]):
-                 sub_task_header = f"From Sub-task '{state_manager.plan['sub_tasks'][i].get('id', i+1)}': {state_manager.plan['sub_tasks'][i].get('description', '')}"
+    run_finished = False
+    try:
+        execute_plan_and_apply_changes(react_planner, state_manager, change_orchestrator_tool, fs_tool,
+                                       dry_run, no_backup, skip_confirmation,
+                                       config_loader.get("telemetry.preview_path", "ai_agent_preview.md"))
+        run_finished = True
+        if checkpoint is not None:
+            checkpoint.write_finished(state_manager)
+    finally:
+        if checkpoint is not None and not run_finished:
+            print(f"INFO: Run interrupted. Continue it with: python agent.py --resume {checkpoint.run_id}")
+        print_provider_resilience_summary(llm_tool)
+        print_routing_summary(llm_tool)
+        print_structured_output_summary(llm_tool)
+        print_llm_cache_summary(llm_tool)
+        print_file_cache_summary(state_manager)
+        if prefetcher is not None:
+            prefetcher.close()
+        print_prefetch_summary(prefetcher)
+        print_observation_store_summary(state_manager)
+        print_action_memo_summary(react_planner.memo)
+        print_plan_cache_summary(plan_cache)
+        print_llm_usage_summary(state_manager)
+        print_budget_summary(state_manager)
+        write_run_report(config_loader.get("telemetry.report_path", "ai_agent_run_report.json"), state_manager, llm_tool, prefetcher,
+                         react_planner.memo, plan_cache)
+        if plan_cache is not None:
+            plan_cache.close()
+
+    # What callers that run many jobs (batch mode) record per run
+    return {
+        "run_id": checkpoint.run_id if checkpoint is not None else None,
+        "sub_tasks": {str(t.get("id")): t.get("status") for t in (state_manager.plan or {}).get("sub_tasks") or []},
+        "directives": sum(len(group) for group in state_manager.collected_change_directives),
+        "llm_usage": state_manager.get_llm_usage_summary()["totals"],
+    }
 
-            preview_content.append(f"\n## {sub_task_header}\n")
-            for directive in directive_group:
-                if isinstance(directive, dict):
-                    preview_content.append(f"### File: {directive.get('file_path')}\n")
-                    preview_content.append(f"Change Type: {directive.get('change_type')}\n")
-                    if directive.get('target_element_selector'):
-                         preview_content.append(f"Target Selector: {directive.get('target_element_selector')}\n")
-                    if directive.get('block_identifier'): # block_identifier could be None
-                         preview_content.append(f"Target Block Identifier: {json.dumps(directive.get('block_identifier'))}\n")
-                    
-                    code_snippet_preview = directive.get('code_snippet', [])
-                    # Ensure code_snippet_preview is a list of strings
-                    if not isinstance(code_snippet_preview, list):
-                        code_snippet_preview = str(code_snippet_preview).splitlines()
-                    code_snippet_str = "\n".join(code_snippet_preview)
 
-                    preview_content.append("```\n" + code_snippet_str + "\n```\n")
-    
-    preview_file_path = Path("ai_agent_preview.md")
+def run_job_spec(job: dict, config_loader: Config, args, log_dir: Path) -> dict:
+    """One --batch / daemon job through run_advanced_agent, without questions. Unset fields default to the command line."""
+    job_config = copy.copy(config_loader) # The YAML is parsed once; each job gets its own copy with its overrides
+    job_config.data = apply_overrides(config_loader.data, job.get("overrides"))
+    op_mode_name = job.get("mode") or args.mode or job_config.get("DEFAULT_OPERATIONAL_MODE", "normal")
+    mode_settings = job_config.data.setdefault("operational_modes", {}).setdefault(op_mode_name, {})
+    if job.get("planning_model") or args.planning_model:
+        mode_settings["default_planning_model"] = job.get("planning_model") or args.planning_model
+    if job.get("generation_model") or args.generation_model:
+        mode_settings["default_generation_model"] = job.get("generation_model") or args.generation_model
+    mode_settings["allow_clarification_loops"] = False # Nobody is there to answer
+    telemetry = job_config.data.setdefault("telemetry", {})
+    if "telemetry.report_path" not in (job.get("overrides") or {}) and telemetry.get("report_path") != "": # Concurrent jobs must not share the default file
+        telemetry["report_path"] = str(log_dir / f"{job['id']}.report.json")
+    if "telemetry.preview_path" not in (job.get("overrides") or {}):
+        telemetry["preview_path"] = str(log_dir / f"{job['id']}.preview.md")
+    project_base_path = Path(job.get("project_path") or args.project_path or ".").resolve()
+    if not project_base_path.is_dir():
+        raise ValueError(f"Project path '{project_base_path}' is not a directory")
+    return run_advanced_agent(job["prompt"], job_config, op_mode_name, project_base_path,
+                              bool(job.get("dry_run", args.dry_run)), bool(job.get("no_backup", args.no_backup)), True)
+
+def run_batch_jobs(args, config_loader: Config) -> dict:
+    """--batch: every job of the JSONL file through run_advanced_agent in this process, without questions."""
+    batch_config = get_typed_config_section(config_loader, "batch", {"max_concurrent_jobs": int, "results_path": str, "log_dir": str})
+    if args.batch_concurrency is not None:
+        batch_config["max_concurrent_jobs"] = args.batch_concurrency
+    if args.batch_results:
+        batch_config["results_path"] = args.batch_results
+    return BatchRunner(Path(args.batch), lambda job, log_dir: run_job_spec(job, config_loader, args, log_dir), batch_config).run()
+
+def serve_agent_daemon(args, config_loader: Config):
+    """--serve: the agent daemon (see agent_daemon.py), running jobs through run_advanced_agent in this warm process."""
+    def config_mtime_ns():
+        try:
+            return Path(args.config).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    config_lock = threading.Lock()
+    loaded = {"config": config_loader, "mtime_ns": config_mtime_ns()}
+    def current_config() -> Config: # Edits to the config file apply from the next job on
+        mtime_ns = config_mtime_ns()
+        with config_lock:
+            if mtime_ns != loaded["mtime_ns"]:
+                loaded.update(config=Config(args.config), mtime_ns=mtime_ns)
+            return loaded["config"]
+
+    daemon_config = get_typed_config_section(config_loader, "daemon", {
+        "host": str, "port": int, "max_concurrent_jobs": int, "log_dir": str, "max_finished_jobs": int, "token": str,
+    })
+    if args.serve_port is not None:
+        daemon_config["port"] = args.serve_port
     try:
-        preview_file_path.write_text("\n".join(preview_content), encoding='utf-8')
-        print(f"\n✨ Detailed preview of all changes saved to: {preview_file_path.resolve()}")
-    except Exception as e:
-        print(f"WARNING: Could not write preview file: {e}")
-
-    if skip_confirmation or get_yes_no_input("\nAI> Proceed with applying these changes?", default_yes=not dry_run):
-        if dry_run:
-            print("\n--- Dry Run Mode: Simulating application of changes. ---")
-            # In dry run, ChangeOrchestratorTool will show diffs but not write
-            change_orchestrator_tool.apply_all_changes(
-                all_directive_groups, fs_tool, replacer_core, state_manager, no_backup
-            )
-            print("--- Dry Run Complete. No files modified. ---")
-        else:
-            print("\n--- Stage 4: Applying Changes ---")
-            final_success = change_orchestrator_tool.apply_all_changes(
-                all_directive_groups, fs_tool, replacer_core, state_manager, no_backup
-            )
-            if final_success:
-                print("✅ AI Agent successfully applied all changes.")
-            else:
-                print("❌ AI Agent encountered errors during change application. Some changes might be partial. Please review.")
-    else:
-        print("INFO: Operation cancelled by user. No changes applied.")
-    print("\n🤖 AI Agent run complete.")
+        daemon = AgentDaemon(lambda job, log_dir: run_job_spec(job, current_config(), args, log_dir), daemon_config)
+    except OSError as e:
+        print(f"FATAL ERROR: Cannot start the agent daemon: {e}"); sys.exit(1)
+    daemon.serve_forever()
 
 def main():
     parser = argparse.ArgumentParser(description="Advanced AI-Powered Code Agent.")
-    parser.add_argument("user_prompt", help="Natural language instruction for the code modification.")
+    parser.add_argument("user_prompt", nargs="?", default=None,
+                        help="Natural language instruction for the code modification (taken from the checkpoint with --resume).")
     parser.add_argument("--project-path", "-p", help="Absolute or relative path to the project's root directory.", default=None)
     parser.add_argument("--config", help="Path to YAML configuration file.", default="config_agent.yaml")
     parser.add_argument("--mode", help="Operational mode (efficient, normal, max_energy). Overrides config default.", default=None)
@@ -271,10 +685,52 @@ def main():
     parser.add_argument("--yes", action="store_true", help="Auto-confirm prompts (use with caution!).")
     parser.add_argument("--planning-model", help="Override planning model for current run.", default=None)
     parser.add_argument("--generation-model", help="Override generation model for current run.", default=None)
+    parser.add_argument("--resume", metavar="RUN_ID", help="Continue an interrupted run from its last checkpoint.", default=None)
+    parser.add_argument("--batch", metavar="JOBS_JSONL", help="Run every job (one JSON object per line) of this file, without questions.", default=None)
+    parser.add_argument("--batch-concurrency", type=int, help="Jobs run at the same time in --batch mode.", default=None)
+    parser.add_argument("--batch-results", help="Results JSONL for --batch (default: <jobs file>.results.jsonl).", default=None)
+    parser.add_argument("--serve", action="store_true", help="Run as a daemon that takes jobs over a local HTTP API (see agent_client.py).")
+    parser.add_argument("--serve-port", type=int, help="Port for --serve (default: daemon.port, 8765).", default=None)
 
     args = parser.parse_args()
     config_loader = Config(args.config)
 
+    if args.serve:
+        if args.user_prompt or args.resume or args.batch:
+            parser.error("--serve takes its prompts from agent_client.py; do not also give a user_prompt, --resume or --batch")
+        try:
+            serve_agent_daemon(args, config_loader)
+        except KeyboardInterrupt: print("\n🤖 Agent daemon stopped by user (Ctrl+C).")
+        return
+
+    if args.batch:
+        if args.user_prompt or args.resume:
+            parser.error("--batch takes its prompts from the jobs file; do not also give a user_prompt or --resume")
+        if not Path(args.batch).is_file():
+            print(f"FATAL ERROR: Batch file '{args.batch}' not found. Exiting."); sys.exit(1)
+        try:
+            batch_stats = run_batch_jobs(args, config_loader)
+        except KeyboardInterrupt: print("\n🤖 Batch cancelled by user (Ctrl+C)."); sys.exit(130)
+        sys.exit(0 if not batch_stats["failed"] else 1)
+
+    resume_records = None
+    if args.resume:
+        try:
+            resume_records = RunCheckpoint.open(get_checkpoint_config(config_loader)["dir"], args.resume).read_records()
+        except (OSError, ValueError) as e:
+            print(f"FATAL ERROR: Cannot resume run '{args.resume}': {e}"); sys.exit(1)
+        start_record = next((r for r in resume_records if r.get("t") == "start"), None)
+        if start_record is None:
+            print(f"FATAL ERROR: Checkpoint of run '{args.resume}' has no start record. Exiting."); sys.exit(1)
+        if any(r.get("t") == "finished" for r in resume_records):
+            print(f"INFO: Run '{args.resume}' already finished; nothing to resume."); return
+        # The original prompt, project and mode, unless given again on the command line
+        args.user_prompt = args.user_prompt or start_record["user_prompt"]
+        args.project_path = args.project_path or start_record["project_path"]
+        args.mode = args.mode or start_record["operational_mode"]
+    elif not args.user_prompt:
+        parser.error("the user_prompt argument is required unless --resume is given")
+
     project_path_str = args.project_path
     if not project_path_str:
         print("INFO: Project path not specified via --project-path argument.")
@@ -319,7 +775,8 @@ def main():
     try:
         run_advanced_agent(
             args.user_prompt, config_loader, op_mode_name, project_base_path,
-            args.dry_run, args.no_backup, args.yes
+            args.dry_run, args.no_backup, args.yes,
+            resume_run_id=args.resume, resume_records=resume_records
         )
     except KeyboardInterrupt: print("\n🤖 Agent operation cancelled by user (Ctrl+C)."); sys.exit(130)
     except Exception as e:
@@ -0,0 +1,105 @@
+# agent_client.py
+# Thin client for the agent daemon (python agent.py --serve): sends one request as a job and prints the job's output
+# as it runs, so a request starts on a warm process instead of paying agent.py's startup. Standard library only, to
+# keep its own startup small.
+#
+# Usage:
+#   python agent_client.py "Rename get_cfg to get_config" -p ../service-a --dry-run
+#   python agent_client.py "..." -p . --yes --override budget.max_cost_usd=0.05
+#   python agent_client.py --shutdown
+# The daemon URL and token come from --daemon-url / --token, or AGENT_DAEMON_URL / AGENT_DAEMON_TOKEN.
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+DEFAULT_DAEMON_URL = "http://127.0.0.1:8765"
+
+
+def request(base_url: str, method: str, path: str, body: dict | None = None, token: str | None = None, timeout: float | None = 30):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["X-Agent-Token"] = token
+    data = json.dumps(body).encode("utf-8") if body is not None else (b"{}" if method == "POST" else None)
+    return urllib.request.urlopen(urllib.request.Request(base_url.rstrip("/") + path, data=data, headers=headers, method=method),
+                                  timeout=timeout)
+
+
+def parse_override(text: str) -> tuple[str, object]:
+    key, sep, value = text.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"'{text}' is not KEY=VALUE")
+    try:
+        return key, json.loads(value) # Numbers, booleans, lists...
+    except json.JSONDecodeError:
+        return key, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a request to the agent daemon (python agent.py --serve).")
+    parser.add_argument("user_prompt", nargs="?", default=None, help="Natural language instruction for the code modification.")
+    parser.add_argument("--project-path", "-p", help="Project root directory (default: current directory).", default=".")
+    parser.add_argument("--mode", help="Operational mode (efficient, normal, max_energy).", default=None)
+    parser.add_argument("--dry-run", action="store_true", help="Show changes without writing to file.")
+    parser.add_argument("--no-backup", action="store_true", help="Do not create backups of target files.")
+    parser.add_argument("--yes", action="store_true", help="Apply changes (the daemon cannot ask for confirmation).")
+    parser.add_argument("--planning-model", help="Override planning model for this request.", default=None)
+    parser.add_argument("--generation-model", help="Override generation model for this request.", default=None)
+    parser.add_argument("--override", metavar="KEY=VALUE", type=parse_override, action="append", default=[],
+                        help="Set a dotted config key for this request (value parsed as JSON if it can be).")
+    parser.add_argument("--daemon-url", default=os.getenv("AGENT_DAEMON_URL", DEFAULT_DAEMON_URL))
+    parser.add_argument("--token", default=os.getenv("AGENT_DAEMON_TOKEN"))
+    parser.add_argument("--shutdown", action="store_true", help="Stop the daemon once its jobs are done.")
+    args = parser.parse_args()
+
+    job_id = None
+    try:
+        if args.shutdown:
+            request(args.daemon_url, "POST", "/shutdown", token=args.token).close()
+            print(f"INFO: Agent daemon at {args.daemon_url} is stopping.")
+            return
+        if not args.user_prompt:
+            parser.error("the user_prompt argument is required unless --shutdown is given")
+        if not args.dry_run and not args.yes:
+            parser.error("the daemon applies changes without asking; pass --yes to apply them, or --dry-run to preview")
+        project_path = Path(args.project_path).resolve() # The daemon runs in its own working directory
+        if not project_path.is_dir():
+            print(f"FATAL ERROR: Project path '{project_path}' is not a valid directory. Exiting."); sys.exit(1)
+        job = {"prompt": args.user_prompt, "project_path": str(project_path), "dry_run": args.dry_run, "no_backup": args.no_backup,
+               "overrides": dict(args.override)}
+        for key in ("mode", "planning_model", "generation_model"):
+            if getattr(args, key):
+                job[key] = getattr(args, key)
+        with request(args.daemon_url, "POST", "/jobs", job, args.token) as resp:
+            job_id = json.load(resp)["id"]
+        finished = None
+        with request(args.daemon_url, "GET", f"/jobs/{job_id}/events", token=args.token, timeout=None) as resp:
+            for raw_line in resp:
+                if not raw_line.strip():
+                    continue # Keep-alive
+                event = json.loads(raw_line)
+                if event["event"] == "log":
+                    print(event["line"], flush=True)
+                elif event["event"] == "finished":
+                    finished = event
+    except urllib.error.HTTPError as e:
+        print(f"ERROR: Agent daemon answered {e.code}: {e.read().decode('utf-8', errors='replace')}"); sys.exit(1)
+    except (urllib.error.URLError, ConnectionError) as e:
+        print(f"ERROR: No agent daemon at {args.daemon_url} ({getattr(e, 'reason', e)}). Start one with: python agent.py --serve")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        if job_id is not None:
+            print(f"\nINFO: Stopped following job '{job_id}'; it keeps running in the daemon.")
+        sys.exit(130)
+
+    if finished is None:
+        print(f"ERROR: Lost the connection to the agent daemon before job '{job_id}' finished."); sys.exit(1)
+    if finished["status"] != "ok":
+        print(f"ERROR: Job '{job_id}' failed: {finished['error']} (log: {finished['log']})"); sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
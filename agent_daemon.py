@@ -0,0 +1,320 @@
+# agent_daemon.py
+# agent.py --serve: a long-running agent process with a local HTTP job API, so a request does not pay interpreter
+# startup, imports, config parsing, connector setup and cold indexes before its first LLM call. The process keeps the
+# parsed config (re-read when the file changes), the pooled connectors, the LLM response cache, the plan cache file,
+# the code indexes and the code-structure (symbol) cache warm between jobs. agent_client.py is the thin client. Jobs
+# are the same JSON objects as a line of an agent.py --batch file; they run max_concurrent_jobs at a time (one at a
+# time per project) without questions.
+#
+#   POST /jobs                   {"prompt": "...", "project_path": "/abs/path", ...} -> 202 {"id": ..., "status": "queued", ...}
+#   GET  /jobs                   every known job (without events)
+#   GET  /jobs/<id>              one job
+#   GET  /jobs/<id>/events?from=N  NDJSON stream of the job's events from index N until it finishes:
+#                                {"event": "status", "status": "queued" | "running"}, {"event": "log", "line": "..."},
+#                                {"event": "finished", "status": "ok" | "error", "summary": {...}, "error": ...}
+#   GET  /health                 {"status": "ok", "pid": ..., "uptime_s": ..., "jobs": {status: count}}
+#   POST /shutdown               stops the daemon once the queued and running jobs are done
+#
+# Only local clients are expected: it binds to 127.0.0.1 by default, POST bodies must be application/json and the
+# Host header must name this machine (so a web page cannot drive it), and with a token set every request needs
+# an X-Agent-Token header.
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from batch_runner import JOB_ID_RE, JOB_ID_RULE, RoutedOutput, check_job, job_output
+
+DEFAULT_DAEMON_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8765,
+    "max_concurrent_jobs": 2,
+    "log_dir": ".ai_agent_daemon/logs",  # Per-job output, run report and change preview
+    "max_finished_jobs": 200,            # Finished jobs (and their events) kept for GET /jobs
+    "token": None,                       # If set, clients must send it as X-Agent-Token
+}
+
+_LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+class DaemonJob:
+    def __init__(self, spec: dict):
+        self.id = str(spec.get("id") or uuid.uuid4().hex[:12])
+        self.spec = dict(spec, id=self.id)
+        self.status = "queued"
+        self.summary: dict | None = None
+        self.error: str | None = None
+        self.log_path: str | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.events: list[dict] = []
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("ok", "error")
+
+    def emit(self, event: dict):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def finish(self, status: str, summary: dict | None, error: str | None):
+        # Status and the last event change together, so a reader that sees the job done has seen every event
+        with self._cond:
+            self.status, self.summary, self.error, self.finished_at = status, summary, error, time.time()
+            self.events.append({"event": "finished", "status": status, "summary": summary, "error": error, "log": self.log_path})
+            self._cond.notify_all()
+
+    def events_since(self, index: int, timeout: float) -> tuple[list[dict], bool]:
+        """Events from index on, waiting up to timeout for a new one; and whether the job had finished."""
+        with self._cond:
+            if index >= len(self.events) and not self.done:
+                self._cond.wait(timeout)
+            return self.events[index:], self.done
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "status": self.status, "prompt": self.spec.get("prompt"), "project_path": self.spec.get("project_path"),
+                "summary": self.summary, "error": self.error, "log": self.log_path, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at,
+                "duration_s": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None}
+
+
+class _JobStream:
+    """The job's stdout while it runs: written to the job log, and every complete line sent as a 'log' event."""
+    def __init__(self, job: DaemonJob, log):
+        self.job = job
+        self.log = log
+        self._partial = ""
+
+    def write(self, text):
+        self.log.write(text)
+        self._partial += text
+        while "\n" in self._partial:
+            line, self._partial = self._partial.split("\n", 1)
+            self.job.emit({"event": "log", "line": line})
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self.log.flush()
+
+    def close(self):
+        if self._partial:
+            self.job.emit({"event": "log", "line": self._partial})
+            self._partial = ""
+
+
+class AgentDaemon:
+    def __init__(self, run_job, config: dict | None = None):
+        """run_job(job, log_dir) runs one job as submitted (it fills in the defaults) and returns its summary dict."""
+        cfg = dict(DEFAULT_DAEMON_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.run_job = run_job
+        self.log_dir = Path(cfg["log_dir"])
+        self.jobs: OrderedDict[str, DaemonJob] = OrderedDict()
+        self._lock = threading.Lock()
+        self._project_locks: dict[str, threading.Lock] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(cfg["max_concurrent_jobs"])), thread_name_prefix="daemon-job")
+        self._started_at = time.time()
+        handler = type("BoundDaemonHandler", (DaemonHandler,), {"daemon": self})
+        self.httpd = ThreadingHTTPServer((cfg["host"], int(cfg["port"])), handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def submit(self, spec: dict) -> DaemonJob:
+        check_job(spec)
+        if spec.get("id") is not None and not JOB_ID_RE.fullmatch(str(spec["id"])):
+            raise ValueError(JOB_ID_RULE)
+        job = DaemonJob(spec)
+        with self._lock:
+            if job.id in self.jobs:
+                raise ValueError(f"a job with id '{job.id}' already exists")
+            self.jobs[job.id] = job
+            self._forget_finished()
+        job.emit({"event": "status", "status": "queued"})
+        self._pool.submit(self._run, job)
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - int(self.config["max_finished_jobs"]))]:
+            del self.jobs[job_id]
+
+    def _project_lock(self, project_path) -> threading.Lock:
+        key = str(Path(project_path or ".").resolve())
+        with self._lock:
+            return self._project_locks.setdefault(key, threading.Lock())
+
+    def _run(self, job: DaemonJob):
+        status, summary, error = "error", None, "Job ended unexpectedly"
+        try:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            log_path = self.log_dir / f"{job.id}.log"
+            with open(log_path, "w", encoding="utf-8") as log, self._project_lock(job.spec.get("project_path")):
+                job.log_path = str(log_path)
+                job.status, job.started_at = "running", time.time()
+                job.emit({"event": "status", "status": "running"})
+                stream = _JobStream(job, log)
+                token = job_output.set(stream)
+                try:
+                    summary = self.run_job(job.spec, self.log_dir)
+                    status, error = "ok", None
+                except (Exception, SystemExit) as e: # A failing job must not take the daemon down
+                    error = f"{type(e).__name__}: {e}"
+                    traceback.print_exc(file=stream)
+                finally:
+                    job_output.reset(token)
+                    stream.close()
+        except OSError as e: # The log directory or file cannot be created or written
+            status, error = "error", f"{type(e).__name__}: {e}"
+        finally:
+            job.finish(status, summary, error) # Always, or the job's event streams would wait forever
+        print(f"INFO: Daemon: job '{job.id}' {job.status} in {job.finished_at - (job.started_at or job.finished_at):.1f}s"
+              + (f" ({job.error})" if job.error else "") + ".")
+
+    def job_counts(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def serve_forever(self):
+        print(f"INFO: Agent daemon listening on {self.base_url} (pid {os.getpid()}), "
+              f"{self.config['max_concurrent_jobs']} job(s) at a time, logs in {self.log_dir}")
+        original_stdout = sys.stdout
+        sys.stdout = RoutedOutput(original_stdout)
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self._pool.shutdown(wait=True)
+            self.httpd.server_close()
+            sys.stdout = original_stdout
+            print("INFO: Agent daemon stopped.")
+
+    def shutdown(self):
+        threading.Thread(target=self.httpd.shutdown, daemon=True).start() # shutdown() blocks until serve_forever returns
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    daemon: AgentDaemon = None # Set on the per-server subclass
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body):
+        raw = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _allowed(self) -> bool:
+        host = urlsplit("//" + (self.headers.get("Host") or "")).hostname or ""
+        if host not in _LOCAL_HOSTS | {str(self.daemon.config["host"])}:
+            self._send_json(403, {"error": f"Host '{host}' is not allowed"}); return False
+        token = self.daemon.config["token"]
+        if token and self.headers.get("X-Agent-Token") != str(token):
+            self._send_json(401, {"error": "Missing or wrong X-Agent-Token"}); return False
+        return True
+
+    def _job(self, job_id: str) -> DaemonJob | None:
+        with self.daemon._lock:
+            job = self.daemon.jobs.get(job_id)
+        if job is None:
+            self._send_json(404, {"error": f"Unknown job '{job_id}'"})
+        return job
+
+    def do_GET(self):
+        if not self._allowed():
+            return
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["health"]:
+            self._send_json(200, {"status": "ok", "pid": os.getpid(), "uptime_s": round(time.time() - self.daemon._started_at, 1),
+                                  "jobs": self.daemon.job_counts()})
+        elif parts == ["jobs"]:
+            with self.daemon._lock:
+                jobs = [job.to_dict() for job in self.daemon.jobs.values()]
+            self._send_json(200, {"jobs": jobs})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job is not None:
+                self._send_json(200, job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            job = self._job(parts[1])
+            if job is not None:
+                try:
+                    index = int(parse_qs(url.query).get("from", ["0"])[0])
+                except ValueError:
+                    self._send_json(400, {"error": "'from' must be an event index"}); return
+                self._stream_events(job, max(0, index))
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def _stream_events(self, job: DaemonJob, index: int):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while True:
+                events, done = job.events_since(index, timeout=15.0)
+                index += len(events)
+                if events:
+                    self._write_chunk("".join(json.dumps(e, default=str) + "\n" for e in events).encode("utf-8"))
+                elif not done:
+                    self._write_chunk(b"\n") # Keep-alive while a step waits on the LLM
+                if done:
+                    break
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client went away; the job keeps running
+
+    def do_POST(self):
+        if not self._allowed():
+            return
+        path = urlsplit(self.path).path.rstrip("/")
+        if not (self.headers.get("Content-Type") or "").startswith("application/json"):
+            self._send_json(415, {"error": "POST bodies must be application/json"}); return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "Invalid JSON body"}); return
+        if path == "/jobs":
+            try:
+                job = self.daemon.submit(body)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)}); return
+            self._send_json(202, job.to_dict())
+        elif path == "/shutdown":
+            self._send_json(200, {"status": "stopping"})
+            self.daemon.shutdown()
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
@@ -0,0 +1,167 @@
+# batch_runner.py
+# agent.py --batch <jobs.jsonl>: runs many prompts in one process, a bounded number at a time. The YAML config is read
+# once, and the jobs share the process-wide warm state: pooled connectors, the LLM response cache, the plan cache file
+# and the code indexes. Confirmation and clarification questions are off. Each line of the jobs file is a JSON object:
+#   {"id": "...", "prompt": "...", "project_path": "...", "mode": "...", "planning_model": "...", "generation_model": "...",
+#    "dry_run": true, "no_backup": false, "overrides": {"dotted.config.key": value, ...}}
+# Only "prompt" is required; the rest default to the command line. Jobs on the same project run one after another.
+# Each job's output goes to its own log, and a result line is appended to the results JSONL as soon as the job
+# finishes, with the job's LLM usage and the batch throughput so far.
+import contextvars
+import copy
+import json
+import re
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+DEFAULT_BATCH_CONFIG = {
+    "max_concurrent_jobs": 2,
+    "results_path": None,   # Default: <jobs file>.results.jsonl
+    "log_dir": None,        # Default: <jobs file>.logs/ (per-job output, run report and change preview)
+}
+
+JOB_ID_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}") # Job ids name the job's log files
+JOB_ID_RULE = "'id' must be 1-64 letters, digits, '_', '.' or '-', starting with a letter or digit"
+
+job_output = contextvars.ContextVar("job_output", default=None)
+
+
+class RoutedOutput:
+    """sys.stdout stand-in that sends each job's prints to that job's log (by context), everything else through."""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        target = job_output.get()
+        return (target or self.stream).write(text)
+
+    def writelines(self, lines):
+        target = job_output.get()
+        (target or self.stream).writelines(lines)
+
+    def flush(self):
+        target = job_output.get()
+        (target or self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def check_job(job) -> None:
+    """Raises ValueError unless job is a usable job object."""
+    if not isinstance(job, dict) or not isinstance(job.get("prompt"), str) or not job["prompt"].strip():
+        raise ValueError("a job must be a JSON object with a non-empty 'prompt'")
+    if not isinstance(job.get("overrides", {}), dict):
+        raise ValueError("'overrides' must be an object of dotted config keys")
+
+
+def read_jobs(jobs_path: Path) -> list[dict]:
+    """The jobs of a JSONL file in order; a malformed line becomes a job with an 'error' so it still gets a result."""
+    jobs = []
+    for line_no, line in enumerate(Path(jobs_path).read_text(encoding="utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            check_job(job)
+        except ValueError as e: # json.JSONDecodeError included
+            job = {"error": f"Line {line_no}: {e}"}
+        job.setdefault("id", f"job_{line_no}")
+        job["id"] = str(job["id"])
+        if not JOB_ID_RE.fullmatch(job["id"]): # "a/b" or "../x" would put the log elsewhere
+            job = {"id": f"job_{line_no}", "error": f"Line {line_no}: {JOB_ID_RULE} (got {job['id']!r})"}
+        jobs.append(job)
+    return jobs
+
+
+def apply_overrides(data: dict, overrides: dict) -> dict:
+    """A deep copy of config data with {"a.b.c": value} overrides set."""
+    data = copy.deepcopy(data)
+    for dotted_key, value in (overrides or {}).items():
+        node = data
+        parts = str(dotted_key).split(".")
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        node[parts[-1]] = value
+    return data
+
+
+class BatchRunner:
+    def __init__(self, jobs_path: Path, run_job, config: dict | None = None):
+        """run_job(job, log_dir) runs one job as read from the file (it fills in the defaults) and returns its summary dict."""
+        cfg = dict(DEFAULT_BATCH_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.jobs_path = Path(jobs_path)
+        self.results_path = Path(cfg["results_path"] or f"{self.jobs_path}.results.jsonl")
+        self.log_dir = Path(cfg["log_dir"] or f"{self.jobs_path}.logs")
+        self.run_job = run_job
+        self._lock = threading.Lock()
+        self._project_locks: dict[str, threading.Lock] = {}
+        self.stats = {"jobs": 0, "succeeded": 0, "failed": 0, "elapsed_s": 0.0, "jobs_per_minute": 0.0}
+        self._started_at = 0.0
+
+    def _project_lock(self, project_path) -> threading.Lock:
+        key = str(Path(project_path or ".").resolve())
+        with self._lock:
+            return self._project_locks.setdefault(key, threading.Lock())
+
+    def run(self) -> dict:
+        jobs = read_jobs(self.jobs_path)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.results_path.parent.mkdir(parents=True, exist_ok=True)
+        self.results_path.write_text("", encoding="utf-8") # Results of this batch only
+        workers = max(1, min(int(self.config["max_concurrent_jobs"]), len(jobs) or 1))
+        print(f"INFO: Batch: {len(jobs)} job(s) from {self.jobs_path}, {workers} at a time. "
+              f"Results: {self.results_path}, logs: {self.log_dir}")
+        self._started_at = time.perf_counter()
+        original_stdout = sys.stdout
+        sys.stdout = RoutedOutput(original_stdout)
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-job") as pool:
+                list(pool.map(lambda job: self._run_one(job, len(jobs)), jobs))
+        finally:
+            sys.stdout = original_stdout
+        print(f"INFO: Batch finished: {self.stats['succeeded']} succeeded, {self.stats['failed']} failed in "
+              f"{self.stats['elapsed_s']:.1f}s ({self.stats['jobs_per_minute']:.1f} jobs/min).")
+        return dict(self.stats)
+
+    def _run_one(self, job: dict, total: int):
+        started_at, started_wall = time.perf_counter(), time.time()
+        result = {"id": job["id"], "prompt": job.get("prompt"), "project_path": job.get("project_path"), "mode": job.get("mode"),
+                  "status": "error", "error": job.get("error"), "started_at": started_wall}
+        if result["error"] is None:
+            log_path = self.log_dir / f"{job['id']}.log"
+            try:
+                with open(log_path, "w", encoding="utf-8") as log, self._project_lock(job.get("project_path")):
+                    result["log"] = str(log_path)
+                    token = job_output.set(log)
+                    try:
+                        result["summary"] = self.run_job(job, self.log_dir)
+                        result["status"] = "ok"
+                    except (Exception, SystemExit) as e: # One failing job (even a fatal config error) must not end the batch
+                        result["error"] = f"{type(e).__name__}: {e}"
+                        traceback.print_exc(file=log)
+                    finally:
+                        job_output.reset(token)
+            except OSError as e: # The log file cannot be created or written
+                result["status"], result["error"] = "error", f"{type(e).__name__}: {e}"
+        result["duration_s"] = round(time.perf_counter() - started_at, 3)
+        with self._lock:
+            self.stats["jobs"] += 1
+            self.stats["succeeded" if result["status"] == "ok" else "failed"] += 1
+            self.stats["elapsed_s"] = time.perf_counter() - self._started_at
+            self.stats["jobs_per_minute"] = self.stats["jobs"] / self.stats["elapsed_s"] * 60 if self.stats["elapsed_s"] else 0.0
+            result["batch_progress"] = {"done": self.stats["jobs"], "total": total, "jobs_per_minute": round(self.stats["jobs_per_minute"], 2)}
+            with open(self.results_path, "a", encoding="utf-8") as f: # Written as each job completes
+                f.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            print(f"INFO: Batch: [{self.stats['jobs']}/{total}] job '{job['id']}' {result['status']} in {result['duration_s']:.1f}s"
+                  + (f" ({result['error']})" if result["error"] else "")
+                  + f"; {self.stats['jobs_per_minute']:.1f} jobs/min so far.")
@@ -0,0 +1,99 @@
+# benchmarks/bench_action_batch.py
+# Planner calls and wall time of a read-heavy sub-task when every ReAct step is one tool call (the previous behaviour)
+# versus batched steps: the planner reads all files in one step, then asks for the code of two of them in one step,
+# then finishes. Runs against the local emulator with a fixed per-call latency; both runs collect the same directives.
+#
+# Usage: python benchmarks/bench_action_batch.py [--files 6] [--first-token-ms 150]
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from advanced_planner_tools import StateManager, ReActPlannerExecutor, ClarificationModule
+from llm_emulator import EmulatorServer, ResponseScript
+from tools import CodeAnalysisTool, FileSystemTool, LLMTool
+
+PLANNER, GENERATOR = "bench-planner", "bench-generator"
+
+
+def step(thought: str, action) -> str:
+    return f"Thought: {thought}\nAction: {json.dumps(action)}"
+
+
+def read(n: int) -> dict:
+    return {"tool_name": "FileSystemTool.read_file", "arguments": {"file_path_str": f"mod_{n}.py"}}
+
+
+def generate(n: int) -> dict:
+    return {"tool_name": "LLMTool.generate_code_snippet", "arguments": {"user_request": f"Add logging to mod_{n}.py"}}
+
+
+def finish(files: int) -> str:
+    directives = [{"file_path": f"mod_{n}.py", "change_type": "append_to_file", "code_snippet": ["# logged"]} for n in range(files)]
+    return step("Done.", {"tool_name": "finish_sub_task", "result": {"status": "success", "message": "done", "directives": directives}})
+
+
+def planner_steps(files: int, batched: bool) -> list[str]:
+    if batched:
+        return [step("Read every module at once.", [read(n) for n in range(files)]),
+                step("Generate the logging code for the first two.", [generate(0), generate(1)]),
+                finish(files)]
+    return ([step(f"Read mod_{n}.py.", read(n)) for n in range(files)]
+            + [step(f"Generate the logging code for mod_{n}.py.", generate(n)) for n in range(2)]
+            + [finish(files)])
+
+
+def run(project: Path, files: int, batched: bool, first_token_ms: float) -> tuple[float, dict, list]:
+    script = ResponseScript({"rules": [{"model": PLANNER, "response": planner_steps(files, batched)},
+                                       {"model": GENERATOR, "response": "```python\nlogger.info('called')\n```"}]})
+    with EmulatorServer(config={"first_token_ms": first_token_ms}, script=script) as server:
+        llm_tool = LLMTool({"OLLAMA_BASE_URL": server.ollama_base_url, "DEFAULT_MODEL_CHOICE": f"ollama/{PLANNER}",
+                            "LLM_CACHE": {"enabled": False}})
+        mode_config = {"planning_model": f"ollama/{PLANNER}", "generation_model": f"ollama/{GENERATOR}",
+                       "max_planning_iterations_ollama": files + 4}
+        state = StateManager("Add logging to every module", "ollama_only", mode_config, project, dry_run=True)
+        state.set_plan({"overall_goal": "Add logging to every module",
+                        "sub_tasks": [{"id": "st_1", "description": "Add a logger call to each module"}]})
+        llm_tool.usage_recorder = state.record_llm_usage
+        clarification_module = ClarificationModule(state)
+        available_tools = {"FileSystemTool": FileSystemTool(project, file_cache=state.file_cache), "LLMTool": llm_tool,
+                           "CodeAnalysisTool": CodeAnalysisTool(), "RequestClarificationTool": clarification_module}
+        executor = ReActPlannerExecutor(llm_tool, state, available_tools, clarification_module)
+        started = time.perf_counter()
+        directive_groups = executor.execute_plan()
+        elapsed = time.perf_counter() - started
+    calls = {"planner": sum(1 for r in state.llm_usage_records if r["model"].endswith(PLANNER)),
+             "generation": sum(1 for r in state.llm_usage_records if r["model"].endswith(GENERATOR)),
+             "steps": len(state.get_history_for_sub_task("st_1"))}
+    return elapsed, calls, directive_groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One tool call per ReAct step vs batched steps, against the LLM emulator.")
+    parser.add_argument("--files", type=int, default=6)
+    parser.add_argument("--first-token-ms", type=float, default=150.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(io.StringIO()):
+        project = Path(work_dir)
+        for n in range(args.files):
+            (project / f"mod_{n}.py").write_text(f"def handler_{n}(event):\n    return event\n", encoding="utf-8")
+        single_s, single_calls, single_groups = run(project, args.files, False, args.first_token_ms)
+        batched_s, batched_calls, batched_groups = run(project, args.files, True, args.first_token_ms)
+
+    print(f"{args.files} files read, 2 snippets generated, first token {args.first_token_ms} ms")
+    print(f"one call per step: {single_calls['planner']} planner calls, {single_calls['generation']} generation calls, "
+          f"{single_calls['steps']} steps, {single_s * 1000:.0f} ms")
+    print(f"batched steps:     {batched_calls['planner']} planner calls, {batched_calls['generation']} generation calls, "
+          f"{batched_calls['steps']} steps, {batched_s * 1000:.0f} ms")
+    print(f"Planner calls: {single_calls['planner'] / batched_calls['planner']:.1f}x fewer; wall time {single_s / batched_s:.1f}x faster; "
+          f"same directives: {single_groups == batched_groups}")
+
+
+if __name__ == "__main__":
+    main()
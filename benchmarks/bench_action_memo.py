@@ -0,0 +1,72 @@
+# benchmarks/bench_action_memo.py
+# Planner calls, tool calls and outcome of a sub-task whose (small, emulated) planner keeps reading the same file, with
+# the action memo and loop detection off and on. The planner only changes course when an observation tells it it is
+# looping, so without loop detection it reads until the iteration limit and the sub-task fails.
+#
+# Usage: python benchmarks/bench_action_memo.py [--max-iterations 10] [--first-token-ms 100]
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from advanced_planner_tools import StateManager, ReActPlannerExecutor, ClarificationModule
+from llm_emulator import EmulatorServer, ResponseScript
+from tools import CodeAnalysisTool, FileSystemTool, LLMTool
+
+READ = "Thought: I should read app.py.\nAction: " + json.dumps({"tool_name": "FileSystemTool.read_file", "arguments": {"file_path_str": "app.py"}})
+FINISH = "Thought: I already have it.\nAction: " + json.dumps({"tool_name": "finish_sub_task", "result": {
+    "status": "success", "message": "done", "directives": [{"file_path": "app.py", "change_type": "append_to_file", "code_snippet": ["# done"]}]}})
+
+
+def run(project: Path, memo_enabled: bool, max_iterations: int, first_token_ms: float) -> dict:
+    script = ResponseScript({"rules": [{"match": "Loop detected", "response": FINISH}], "default_response": READ})
+    with EmulatorServer(config={"first_token_ms": first_token_ms}, script=script) as server:
+        llm_tool = LLMTool({"OLLAMA_BASE_URL": server.ollama_base_url, "DEFAULT_MODEL_CHOICE": "ollama/bench", "LLM_CACHE": {"enabled": False}})
+        mode_config = {"planning_model": "ollama/bench", "generation_model": "ollama/bench", "max_planning_iterations_ollama": max_iterations}
+        state = StateManager("Add a comment to app.py", "ollama_only", mode_config, project, dry_run=True)
+        state.set_plan({"overall_goal": "Add a comment to app.py", "sub_tasks": [{"id": "st_1", "description": "Add a comment to app.py"}]})
+        llm_tool.usage_recorder = state.record_llm_usage
+        clarification_module = ClarificationModule(state)
+        fs_tool = FileSystemTool(project, file_cache=state.file_cache)
+        reads = [0]
+        original_read = fs_tool.read_file
+        def counting_read(file_path_str):
+            reads[0] += 1
+            return original_read(file_path_str)
+        fs_tool.read_file = counting_read
+        available_tools = {"FileSystemTool": fs_tool, "LLMTool": llm_tool, "CodeAnalysisTool": CodeAnalysisTool(),
+                           "RequestClarificationTool": clarification_module}
+        executor = ReActPlannerExecutor(llm_tool, state, available_tools, clarification_module, memo_config={"enabled": memo_enabled})
+        started = time.perf_counter()
+        directive_groups = executor.execute_plan()
+        return {"ms": (time.perf_counter() - started) * 1000, "planner_calls": len(state.llm_usage_records), "reads": reads[0],
+                "finished": bool(directive_groups), "memo": executor.memo.get_stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A looping planner with and without the action memo / loop detection.")
+    parser.add_argument("--max-iterations", type=int, default=10)
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(io.StringIO()):
+        project = Path(work_dir)
+        (project / "app.py").write_text("def main():\n    return 0\n", encoding="utf-8")
+        off = run(project, False, args.max_iterations, args.first_token_ms)
+        on = run(project, True, args.max_iterations, args.first_token_ms)
+
+    for name, result in (("memo off", off), ("memo on", on)):
+        print(f"{name}: {result['planner_calls']} planner calls, {result['reads']} file reads, {result['ms']:.0f} ms, "
+              f"sub-task {'finished' if result['finished'] else 'failed'}")
+    print(f"memo stats: {on['memo']}")
+    print(f"{off['planner_calls'] - on['planner_calls']} planner calls and {off['reads'] - on['reads']} reads saved, "
+          f"{off['ms'] / on['ms']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_agent_pipeline.py
+# End-to-end throughput and tail latency of run_advanced_agent (decomposition -> ReAct loop -> dry-run apply)
+# against the local emulator, so results are reproducible and need no real provider.
+#
+# Usage: python benchmarks/bench_agent_pipeline.py [--runs 20] [--concurrency 1] [--first-token-ms 100] [--tokens-per-second 50]
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from agent import Config, run_advanced_agent
+from llm_emulator import EmulatorServer, ResponseScript
+
+PLAN_STEP_RESPONSE = ('Thought: Append the greeting to app.py.\n'
+                      'Action: {"tool_name": "finish_sub_task", "result": {"status": "success", "message": "done", '
+                      '"directives": [{"file_path": "app.py", "change_type": "append_to_file", "code_snippet": ["print(\\"bye\\")"]}]}}')
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full ReAct pipeline benchmark against the local LLM emulator.")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    emulator_config = {"first_token_ms": args.first_token_ms, "tokens_per_second": args.tokens_per_second, "error_rate": args.error_rate}
+    with EmulatorServer(config=emulator_config, script=ResponseScript({"default_response": PLAN_STEP_RESPONSE})) as server, \
+         tempfile.TemporaryDirectory() as work_dir:
+        project = Path(work_dir) / "project"
+        project.mkdir()
+        (project / "app.py").write_text('print("hi")\n', encoding="utf-8")
+        os.chdir(work_dir) # The agent writes its preview file to the working directory
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            config = Config(str(Path(work_dir) / "missing.yaml"))
+        config.data = {
+            "ollama": {"base_url": server.ollama_base_url},
+            "llm_cache": {"enabled": False},
+            "resilience": {"ollama": {"base_delay": 0.05}},
+            "operational_modes": {"normal": {"default_planning_model": "ollama/emulator", "default_generation_model": "ollama/emulator"}},
+        }
+
+        def one_run(_):
+            start = time.perf_counter()
+            run_advanced_agent("append a goodbye line", config, "normal", project, dry_run=True, no_backup=True, skip_confirmation=True)
+            return time.perf_counter() - start
+
+        sink = io.StringIO()
+        with contextlib.redirect_stdout(sink):
+            wall_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                durations = list(pool.map(one_run, range(args.runs)))
+            wall = time.perf_counter() - wall_start
+        emulator_stats = server.stats()
+
+    print(f"{args.runs} runs, concurrency {args.concurrency}, first token {args.first_token_ms} ms, "
+          f"{args.tokens_per_second or 'instant'} tokens/s, error rate {args.error_rate}")
+    print(f"throughput {args.runs / wall:.2f} runs/s ({args.runs / wall * 60:.0f} runs/min)")
+    print(f"per-run latency: mean {statistics.mean(durations) * 1000:.1f} ms   p50 {percentile(durations, 50) * 1000:.1f} ms   "
+          f"p95 {percentile(durations, 95) * 1000:.1f} ms   p99 {percentile(durations, 99) * 1000:.1f} ms")
+    print(f"emulator: {emulator_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_batch_mode.py
+# Throughput (jobs per minute) of a queue of small edits run as one agent.py process per job versus one
+# agent.py --batch process, sequentially and with several jobs at a time. Every job is a one-step sub-task against the
+# local emulator; the jobs are spread over a few projects (jobs on the same project run one after another).
+#
+# Usage: python benchmarks/bench_batch_mode.py [--jobs 8] [--projects 4] [--concurrency 4] [--first-token-ms 300]
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_emulator import EmulatorServer, ResponseScript
+
+AGENT = Path(__file__).resolve().parent.parent / "agent.py"
+FINISH = "Thought: Done.\nAction: " + json.dumps({"tool_name": "finish_sub_task", "result": {"status": "success", "message": "done",
+    "directives": [{"file_path": "app.py", "change_type": "append_to_file", "code_snippet": ["# reviewed"]}]}})
+
+
+def write_config(path: Path, ollama_base_url: str):
+    path.write_text("\n".join([
+        "DEFAULT_OPERATIONAL_MODE: normal",
+        f"ollama: {{base_url: \"{ollama_base_url}\"}}",
+        "llm_cache: {enabled: false}",
+        "plan_cache: {enabled: false}",
+        "retrieval: {enabled: false}",
+        "checkpoint: {enabled: false}",
+        "telemetry: {report_path: \"\"}",
+        "operational_modes:",
+        "  normal: {default_planning_model: \"ollama/emulator\", default_generation_model: \"ollama/emulator\"}",
+    ]) + "\n", encoding="utf-8")
+
+
+def run_cli(args: list[str], cwd: Path):
+    subprocess.run([sys.executable, str(AGENT), *args], cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One process per job vs agent.py --batch.")
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--projects", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir, \
+         EmulatorServer(config={"first_token_ms": args.first_token_ms}, script=ResponseScript({"default_response": FINISH})) as server:
+        work_dir = Path(work_dir)
+        config = work_dir / "config.yaml"
+        write_config(config, server.ollama_base_url)
+        projects = []
+        for n in range(args.projects):
+            project = work_dir / f"project_{n}"
+            project.mkdir()
+            (project / "app.py").write_text("def main():\n    return 0\n", encoding="utf-8")
+            projects.append(project)
+        jobs = [{"id": f"edit_{n}", "prompt": f"Review app.py for edit {n}", "project_path": str(projects[n % len(projects)])}
+                for n in range(args.jobs)]
+        jobs_file = work_dir / "jobs.jsonl"
+        jobs_file.write_text("".join(json.dumps(job) + "\n" for job in jobs), encoding="utf-8")
+
+        timings = {}
+        started = time.perf_counter()
+        for job in jobs:
+            run_cli([job["prompt"], "-p", job["project_path"], "--config", str(config), "--dry-run", "--yes"], work_dir)
+        timings["one process per job"] = time.perf_counter() - started
+        for concurrency in (1, args.concurrency):
+            started = time.perf_counter()
+            run_cli(["--batch", str(jobs_file), "--batch-concurrency", str(concurrency), "--config", str(config), "--dry-run"], work_dir)
+            timings[f"--batch, {concurrency} at a time"] = time.perf_counter() - started
+            results = [json.loads(line) for line in (work_dir / "jobs.jsonl.results.jsonl").read_text(encoding="utf-8").splitlines()]
+            failed = [r["id"] for r in results if r["status"] != "ok"]
+            if len(results) != len(jobs) or failed:
+                print(f"WARNING: --batch with {concurrency} at a time: {len(results)} results, failed: {failed}")
+
+    print(f"{args.jobs} jobs over {args.projects} projects, first token {args.first_token_ms} ms")
+    for name, seconds in timings.items():
+        print(f"{name:24s} {seconds:6.2f}s, {args.jobs / seconds * 60:6.1f} jobs/min")
+
+
+if __name__ == "__main__":
+    main()
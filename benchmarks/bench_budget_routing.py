@@ -0,0 +1,94 @@
+# benchmarks/bench_budget_routing.py
+# Cost and wall time of a plan of mostly simple sub-tasks when every sub-task runs on the mode's (hosted, priced, slower)
+# models versus complexity tiers that send simple sub-tasks to a local model, and with a cost limit too tight for the
+# complex sub-task's tier. Two emulators stand in for the providers: a fast "local" Ollama and a slower "hosted"
+# OpenRouter. Each sub-task takes two plan steps: one snippet generation, then finish.
+#
+# Usage: python benchmarks/bench_budget_routing.py [--simple 3] [--local-ms 40] [--hosted-ms 250]
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from advanced_planner_tools import StateManager, ReActPlannerExecutor, ClarificationModule
+from budget import BudgetScheduler
+from llm_emulator import EmulatorServer, ResponseScript
+from tools import CodeAnalysisTool, FileSystemTool, LLMTool
+
+LOCAL, HOSTED = "ollama/bench-local", "openrouter/bench/hosted"
+PRICES = {HOSTED: [3.0, 15.0]}
+
+
+def step(thought: str, action: dict) -> str:
+    return f"Thought: {thought}\nAction: {json.dumps(action)}"
+
+
+SCRIPT = {"rules": [
+    {"match": r"Current Sub-task ID.*generated_snippet",
+     "response": step("Done.", {"tool_name": "finish_sub_task", "result": {"status": "success", "message": "done", "directives": [
+         {"file_path": "app.py", "change_type": "append_to_file", "code_snippet": ["# done"]}]}})},
+    {"match": r"Current Sub-task ID",
+     "response": step("Generate the change.", {"tool_name": "LLMTool.generate_code_snippet", "arguments": {"user_request": "Add the change"}})},
+], "default_response": "```python\nlogger.info('changed')\n```"}
+
+
+def run(project: Path, sub_tasks: list[dict], budget_config: dict, local_ms: float, hosted_ms: float) -> tuple[float, dict]:
+    with EmulatorServer(config={"first_token_ms": local_ms}, script=ResponseScript(SCRIPT)) as local, \
+         EmulatorServer(config={"first_token_ms": hosted_ms}, script=ResponseScript(SCRIPT)) as hosted:
+        llm_tool = LLMTool({"OLLAMA_BASE_URL": local.ollama_base_url, "OPENROUTER_BASE_URL": hosted.openrouter_base_url,
+                            "OPENROUTER_API_KEY": "bench", "DEFAULT_MODEL_CHOICE": HOSTED, "LLM_CACHE": {"enabled": False}})
+        mode_config = {"planning_model": HOSTED, "generation_model": HOSTED, "max_planning_iterations_ollama": 4,
+                       "max_api_calls_openrouter": 100}
+        state = StateManager("Apply the changes", "hybrid", mode_config, project, dry_run=True)
+        state.set_plan({"overall_goal": "Apply the changes", "sub_tasks": sub_tasks})
+        llm_tool.usage_recorder = state.record_llm_usage
+        state.budget = BudgetScheduler(budget_config, mode_config)
+        state.budget.plan(state)
+        clarification_module = ClarificationModule(state)
+        available_tools = {"FileSystemTool": FileSystemTool(project, file_cache=state.file_cache), "LLMTool": llm_tool,
+                           "CodeAnalysisTool": CodeAnalysisTool(), "RequestClarificationTool": clarification_module}
+        executor = ReActPlannerExecutor(llm_tool, state, available_tools, clarification_module,
+                                        scheduler_config={"max_parallel_sub_tasks": 1})
+        started = time.perf_counter()
+        executor.execute_plan()
+        elapsed = time.perf_counter() - started
+        return elapsed, state.budget.report(state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mode models for every sub-task vs complexity tiers and a cost limit.")
+    parser.add_argument("--simple", type=int, default=3, help="Simple sub-tasks in the plan (plus one complex one)")
+    parser.add_argument("--local-ms", type=float, default=40.0)
+    parser.add_argument("--hosted-ms", type=float, default=250.0)
+    args = parser.parse_args()
+
+    sub_tasks = ([{"id": f"simple_{n}", "description": f"Rename a variable in module {n}", "complexity": "simple", "status": "pending"}
+                  for n in range(args.simple)]
+                 + [{"id": "complex_0", "description": "Restructure the request handling", "complexity": "complex", "status": "pending"}])
+    tiers = {"simple": {"planning_model": LOCAL, "generation_model": LOCAL}}
+    runs = [("mode models", {"prices": PRICES}),
+            ("tiers", {"prices": PRICES, "tiers": tiers}),
+            ("tiers + cost limit", {"prices": PRICES, "tiers": tiers, "max_cost_usd": 0.0005})]
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(io.StringIO()):
+        for name, budget_config in runs:
+            results.append((name, *run(Path(work_dir), [dict(t) for t in sub_tasks], budget_config, args.local_ms, args.hosted_ms)))
+
+    print(f"{args.simple} simple + 1 complex sub-task; local first token {args.local_ms} ms, hosted {args.hosted_ms} ms, hosted price {PRICES[HOSTED]} USD/1M")
+    for name, elapsed, report in results:
+        projected, actual = report["projected"], report["actual"]
+        print(f"{name:19s} {elapsed * 1000:6.0f} ms, cost ${actual['cost_usd']:.6f} (projected ${projected['cost_usd']:.6f}), "
+              f"{actual['tokens']:.0f} tokens (projected {projected['tokens']:.0f}), {report['downgrades']} downgrade(s)"
+              + (f", stopped: {report['stopped_reason']}" if report["stopped_reason"] else ""))
+    base_s, base_report = results[0][1], results[0][2]
+    tier_s, tier_report = results[1][1], results[1][2]
+    print(f"Tiers: {base_s / tier_s:.1f}x faster, {base_report['actual']['cost_usd'] / max(tier_report['actual']['cost_usd'], 1e-12):.1f}x cheaper")
+
+
+if __name__ == "__main__":
+    main()
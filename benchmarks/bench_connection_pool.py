@@ -0,0 +1,66 @@
+# benchmarks/bench_connection_pool.py
+# Measures per-call latency of OllamaConnector/OpenRouterConnector with a pooled keep-alive
+# session versus a fresh connection per call, against the local emulator (llm_emulator.py).
+#
+# Usage: python benchmarks/bench_connection_pool.py [--calls 200] [--delay-ms 0]
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from connectors import OllamaConnector, OpenRouterConnector
+from llm_emulator import EmulatorServer, ResponseScript
+
+
+def time_calls(connector, model: str, calls: int) -> list[float]:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        connector.generate("ping", model, max_tokens=8)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label: str, timings: list[float]):
+    timings_sorted = sorted(timings)
+    p95 = timings_sorted[int(len(timings_sorted) * 0.95) - 1]
+    print(f"{label:<32} mean {statistics.mean(timings):7.3f} ms   p50 {statistics.median(timings):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection pool benchmark against a local stub server.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Artificial server-side latency per request.")
+    args = parser.parse_args()
+
+    server = EmulatorServer(config={"first_token_ms": args.delay_ms}, script=ResponseScript({"default_response": "ok"})).start()
+    base_url = server.base_url
+
+    import builtins
+    real_print = builtins.print
+    builtins.print = lambda *a, **k: None # Silence connector INFO lines during timing
+    try:
+        results = {}
+        for keep_alive in (False, True):
+            ollama = OllamaConnector(base_url=base_url, pool_config={"keep_alive": keep_alive})
+            openrouter = OpenRouterConnector(api_key="bench", base_url=base_url, pool_config={"keep_alive": keep_alive})
+            time_calls(ollama, "stub", 5); time_calls(openrouter, "stub/model", 5) # Warm-up
+            results[("ollama", keep_alive)] = time_calls(ollama, "stub", args.calls)
+            results[("openrouter", keep_alive)] = time_calls(openrouter, "stub/model", args.calls)
+            ollama.close(); openrouter.close()
+    finally:
+        builtins.print = real_print
+        server.stop()
+
+    print(f"{args.calls} calls per configuration, server delay {args.delay_ms} ms")
+    for provider in ("ollama", "openrouter"):
+        report(f"{provider} (new connection/call)", results[(provider, False)])
+        report(f"{provider} (pooled keep-alive)", results[(provider, True)])
+        saved = statistics.mean(results[(provider, False)]) - statistics.mean(results[(provider, True)])
+        print(f"{'':<32} saved {saved:.3f} ms per call")
+
+
+if __name__ == "__main__":
+    main()
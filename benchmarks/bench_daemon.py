@@ -0,0 +1,109 @@
+# benchmarks/bench_daemon.py
+# Wall time per request for a one-step edit run as `python agent.py "..."` (a fresh process each time) versus
+# `python agent_client.py "..."` against a running `agent.py --serve` daemon. Both answer from the local emulator, so
+# the difference is the per-request setup the daemon keeps warm (interpreter and imports, config, connectors, indexes).
+#
+# Usage: python benchmarks/bench_daemon.py [--requests 5] [--first-token-ms 50]
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_emulator import EmulatorServer, ResponseScript
+
+ROOT = Path(__file__).resolve().parent.parent
+FINISH = "Thought: Done.\nAction: " + json.dumps({"tool_name": "finish_sub_task", "result": {"status": "success", "message": "done",
+    "directives": [{"file_path": "app.py", "change_type": "append_to_file", "code_snippet": ["# reviewed"]}]}})
+
+
+def write_config(path: Path, ollama_base_url: str, log_dir: Path):
+    path.write_text("\n".join([
+        "DEFAULT_OPERATIONAL_MODE: normal",
+        f"ollama: {{base_url: \"{ollama_base_url}\"}}",
+        "llm_cache: {enabled: false}",
+        "plan_cache: {enabled: false}",
+        "checkpoint: {enabled: false}",
+        "telemetry: {report_path: \"\"}",
+        f"daemon: {{log_dir: \"{log_dir.as_posix()}\"}}",
+        "operational_modes:",
+        "  normal: {default_planning_model: \"ollama/emulator\", default_generation_model: \"ollama/emulator\"}",
+    ]) + "\n", encoding="utf-8")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def timed(cmd: list[str], cwd: Path) -> tuple[float, subprocess.CompletedProcess]:
+    started = time.perf_counter()
+    result = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, check=False)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="agent.py per request vs agent_client.py against agent.py --serve.")
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--first-token-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir, \
+         EmulatorServer(config={"first_token_ms": args.first_token_ms}, script=ResponseScript({"default_response": FINISH})) as server:
+        work_dir = Path(work_dir)
+        config = work_dir / "config.yaml"
+        write_config(config, server.ollama_base_url, work_dir / "daemon_logs")
+        project = work_dir / "project"
+        project.mkdir()
+        for n in range(40): # Enough files for the retrieval index to matter
+            (project / f"module_{n}.py").write_text(f"def handler_{n}(x):\n    return x + {n}\n", encoding="utf-8")
+        (project / "app.py").write_text("def main():\n    return 0\n", encoding="utf-8")
+
+        cli_times = []
+        for n in range(args.requests):
+            seconds, result = timed([sys.executable, str(ROOT / "agent.py"), f"Review app.py ({n})", "-p", str(project),
+                                     "--config", str(config), "--dry-run", "--yes"], work_dir)
+            cli_times.append(seconds)
+
+        port = free_port()
+        daemon = subprocess.Popen([sys.executable, str(ROOT / "agent.py"), "--serve", "--serve-port", str(port), "--config", str(config)],
+                                  cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        url = f"http://127.0.0.1:{port}"
+        try:
+            started = time.perf_counter()
+            while True:
+                try:
+                    urllib.request.urlopen(f"{url}/health", timeout=1).close()
+                    break
+                except OSError:
+                    if daemon.poll() is not None or time.perf_counter() - started > 30:
+                        raise RuntimeError(f"The daemon did not start: {daemon.stdout.read()}")
+                    time.sleep(0.05)
+            client_times, client_ok = [], True
+            for n in range(args.requests):
+                seconds, result = timed([sys.executable, str(ROOT / "agent_client.py"), f"Review app.py ({n})", "-p", str(project),
+                                         "--dry-run", "--daemon-url", url], work_dir)
+                client_times.append(seconds)
+                client_ok = client_ok and result.returncode == 0 and "app.py" in result.stdout
+            subprocess.run([sys.executable, str(ROOT / "agent_client.py"), "--shutdown", "--daemon-url", url], capture_output=True, check=False)
+            daemon.wait(timeout=30)
+        finally:
+            if daemon.poll() is None:
+                daemon.kill()
+
+    print(f"{args.requests} requests, first token {args.first_token_ms} ms")
+    print(f"agent.py per request:     median {statistics.median(cli_times) * 1000:7.0f} ms, first {cli_times[0] * 1000:7.0f} ms")
+    print(f"agent_client.py + daemon: median {statistics.median(client_times) * 1000:7.0f} ms, first {client_times[0] * 1000:7.0f} ms"
+          + ("" if client_ok else "  (WARNING: a daemon request failed)"))
+    print(f"{statistics.median(cli_times) / statistics.median(client_times):.1f}x faster per request with the daemon")
+
+
+if __name__ == "__main__":
+    main()
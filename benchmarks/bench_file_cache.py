@@ -0,0 +1,54 @@
+# benchmarks/bench_file_cache.py
+# Cost of the file reads a run makes: every tool call reading and decoding the file again (the previous behaviour)
+# versus the shared FileCache, which stats the file and serves the decoded text it already has. The access pattern
+# re-reads a small working set of the project many times, the way a planner does across iterations and sub-tasks.
+#
+# Usage: python benchmarks/bench_file_cache.py [--project .] [--reads 2000] [--working-set 8]
+import argparse
+import contextlib
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from file_cache import FileCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="File cache benchmark: read_text per call vs the shared FileCache.")
+    parser.add_argument("--project", default=str(Path(__file__).resolve().parent.parent))
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--working-set", type=int, default=8)
+    args = parser.parse_args()
+
+    project = Path(args.project).resolve()
+    files = sorted(p for p in project.glob("*.py") if p.is_file())[:args.working_set]
+    rng = random.Random(7)
+    # Mix of spellings the planner uses for the same file
+    requests = [rng.choice(["{}", "./{}", str(project) + "/{}"]).format(rng.choice(files).name) for _ in range(args.reads)]
+
+    started = time.perf_counter()
+    for path_str in requests:
+        (project / path_str).resolve().read_text(encoding="utf-8")
+    uncached_s = time.perf_counter() - started
+
+    cache = FileCache(project)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path_str in requests:
+            cache.get(path_str)
+    cached_s = time.perf_counter() - started
+
+    stats = cache.get_stats()
+    print(f"{len(requests)} reads over {len(files)} files ({sum(p.stat().st_size for p in files)} bytes)")
+    print(f"read_text per call: {uncached_s * 1000:.1f} ms ({uncached_s / len(requests) * 1e6:.1f} us per read)")
+    print(f"FileCache:          {cached_s * 1000:.1f} ms ({cached_s / len(requests) * 1e6:.1f} us per read), "
+          f"{stats['entries']} entries, {stats['loads']} disk loads, hit rate {stats['hit_rate']:.1%}")
+    if cached_s:
+        print(f"Speed-up: {uncached_s / cached_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
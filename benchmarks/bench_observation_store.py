@@ -0,0 +1,72 @@
+# benchmarks/bench_observation_store.py
+# History size and planner prompt size per ReAct iteration when tool results are kept inline in the history (the
+# previous behaviour) versus stored in the observation store with handles in the history. The simulated run reads
+# files of a project (this repository by default) and analyses their structure, alternating, like a planner does.
+#
+# Usage: python benchmarks/bench_observation_store.py [--project .] [--iterations 16] [--budget 6000]
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from advanced_planner_tools import StateManager
+from tools import CodeAnalysisTool, LLMTool
+
+
+def run(project: Path, files: list[Path], iterations: int, budget: int, store_config: dict) -> list[tuple[int, int]]:
+    """(serialized history chars, planner prompt chars) after each iteration."""
+    llm_tool = LLMTool({"DEFAULT_MODEL_CHOICE": "ollama/bench", "PROMPT_BUDGET": {"default_tokens": budget}, "LLM_CACHE": {"enabled": False}})
+    system_prompt = llm_tool.plan_step_system_prompt(structured=True)
+    analysis_tool = CodeAnalysisTool()
+    state = StateManager("Add type hints to the public helpers", "ollama_only", {}, project, dry_run=True,
+                         observation_store_config=store_config)
+    state.set_plan({"overall_goal": "Add type hints to the public helpers",
+                    "sub_tasks": [{"id": "st_1", "description": "Add type hints to every public function"}]})
+    state.current_sub_task_id = "st_1"
+    per_iteration = []
+    for step in range(iterations):
+        path = files[(step // 2) % len(files)]
+        content = path.read_text(encoding="utf-8")
+        if step % 2 == 0:
+            action = {"tool_name": "FileSystemTool.read_file", "arguments": {"file_path_str": path.name}}
+            observation = {"status": "success", "tool_output": content, "message": f"File '{path.name}' read successfully."}
+        else:
+            action = {"tool_name": "CodeAnalysisTool.get_code_structure", "arguments": {"file_content": content, "file_type": "python"}}
+            observation = {"status": "success", "tool_output": analysis_tool.get_code_structure(content, "python")}
+        state.add_history("st_1", f"Step {step}: look at {path.name}.", action, observation)
+        prompt, _ = llm_tool.build_plan_step_prompt(state, "ollama/bench", system_prompt, structured=True)
+        history_chars = len(json.dumps(state.history_per_sub_task, ensure_ascii=False, default=str))
+        per_iteration.append((history_chars, len(prompt)))
+    return per_iteration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Observation store benchmark: inline tool results vs handles in the history.")
+    parser.add_argument("--project", default=str(Path(__file__).resolve().parent.parent))
+    parser.add_argument("--iterations", type=int, default=16)
+    parser.add_argument("--budget", type=int, default=6000, help="Planner prompt token budget.")
+    args = parser.parse_args()
+
+    project = Path(args.project).resolve()
+    files = sorted(project.glob("*.py"), key=lambda p: p.stat().st_size, reverse=True)[:8]
+    with tempfile.TemporaryDirectory() as spill_dir, contextlib.redirect_stdout(io.StringIO()):
+        inline = run(project, files, args.iterations, args.budget, {"inline_max_chars": 10 ** 12, "expand_recent_steps": 0})
+        stored = run(project, files, args.iterations, args.budget, {"spill_dir": spill_dir})
+
+    print(f"{'iter':>4}{'inline history':>16}{'inline prompt':>15}{'store history':>15}{'store prompt':>14}")
+    for i, ((inline_hist, inline_prompt), (store_hist, store_prompt)) in enumerate(zip(inline, stored)):
+        print(f"{i:>4}{inline_hist:>16}{inline_prompt:>15}{store_hist:>15}{store_prompt:>14}")
+    inline_prompt_total = sum(p for _, p in inline)
+    store_prompt_total = sum(p for _, p in stored)
+    print(f"History after {args.iterations} iterations: {inline[-1][0]} -> {stored[-1][0]} chars "
+          f"({100 * (1 - stored[-1][0] / inline[-1][0]):.1f}% smaller)")
+    print(f"Planner prompt chars over the run: {inline_prompt_total} -> {store_prompt_total} "
+          f"({100 * (1 - store_prompt_total / inline_prompt_total):.1f}% smaller)")
+
+
+if __name__ == "__main__":
+    main()
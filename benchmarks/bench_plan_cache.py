@@ -0,0 +1,76 @@
+# benchmarks/bench_plan_cache.py
+# Decomposition time and planning calls for a request issued repeatedly against a project: the first run (cache miss),
+# an identical re-run (CI retry), a reworded near-duplicate, and a run after a project file changed (the fingerprint
+# no longer matches, so it plans again). Runs TaskDecomposer's LLM path against the local emulator.
+#
+# Usage: python benchmarks/bench_plan_cache.py [--first-token-ms 400] [--tokens-per-second 80]
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from advanced_planner_tools import StateManager, TaskDecomposer
+from llm_emulator import EmulatorServer, ResponseScript
+from plan_cache import PlanCache
+from tools import LLMTool
+
+PLAN = {"overall_goal": "Migrate the settings loader to pathlib", "estimated_involved_files": ["settings.py", "loader.py"],
+        "sub_tasks": [{"id": "settings", "description": "Use pathlib in settings.py", "complexity": "simple", "files": ["settings.py"]},
+                      {"id": "loader", "description": "Use pathlib in loader.py", "complexity": "medium", "files": ["loader.py"],
+                       "depends_on": ["settings"]}]}
+
+RUNS = [("first run", "Migrate the settings loader to pathlib in settings.py and loader.py"),
+        ("identical re-run", "Migrate the settings loader to pathlib in settings.py and loader.py"),
+        ("near-duplicate", "Please migrate the settings loader to pathlib in settings.py and loader.py."),
+        ("after file change", "Migrate the settings loader to pathlib in settings.py and loader.py")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Task decomposition with a persistent plan cache.")
+    parser.add_argument("--first-token-ms", type=float, default=400.0)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    args = parser.parse_args()
+
+    results = []
+    script = ResponseScript({"default_response": json.dumps(PLAN)})
+    with tempfile.TemporaryDirectory() as work_dir, \
+         EmulatorServer(config={"first_token_ms": args.first_token_ms, "tokens_per_second": args.tokens_per_second}, script=script) as server, \
+         contextlib.redirect_stdout(io.StringIO()):
+        project = Path(work_dir) / "project"
+        project.mkdir()
+        for name in ("settings.py", "loader.py"):
+            (project / name).write_text("import os\n\nBASE = os.path.dirname(__file__)\n", encoding="utf-8")
+        llm_tool = LLMTool({"OLLAMA_BASE_URL": server.ollama_base_url, "DEFAULT_MODEL_CHOICE": "ollama/bench", "LLM_CACHE": {"enabled": False}})
+        mode_config = {"planning_model": "ollama/bench", "generation_model": "ollama/bench"}
+        for name, prompt in RUNS:
+            if name == "after file change":
+                settings = project / "settings.py"
+                settings.write_text(settings.read_text(encoding="utf-8") + "DEBUG = False\n", encoding="utf-8")
+                os.utime(settings, ns=(time.time_ns(), time.time_ns() + 10**9))
+            state = StateManager(prompt, "ollama_only", mode_config, project, dry_run=True)
+            plan_cache = PlanCache(project, {"path": str(Path(work_dir) / "plans.sqlite3"), # A fresh process per run
+                                               "near_duplicate_threshold": 0.8})
+            decomposer = TaskDecomposer(llm_tool, state, plan_cache)
+            decomposer.USE_ACTUAL_LLM_FOR_DECOMPOSITION = True
+            requests_before = server.stats()["requests"]
+            started = time.perf_counter()
+            plan = decomposer.decompose()
+            results.append((name, (time.perf_counter() - started) * 1000, server.stats()["requests"] - requests_before,
+                            plan is not None and [t["id"] for t in plan["sub_tasks"]] == ["settings", "loader"], plan_cache.get_stats()))
+            plan_cache.close()
+
+    for name, ms, calls, plan_ok, stats in results:
+        how = "exact hit" if stats["exact_hits"] else "near-duplicate hit" if stats["near_hits"] else "miss"
+        similarity = f", similarity {stats['last_match']['similarity']}" if stats["last_match"] else ""
+        print(f"{name:18s} {ms:7.1f} ms, {calls} planning call(s), {how}{similarity}, plan ok: {plan_ok}")
+    print(f"Cached plans: {results[0][1] / max(results[1][1], 0.001):.0f}x faster decomposition")
+
+
+if __name__ == "__main__":
+    main()
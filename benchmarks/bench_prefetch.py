@@ -0,0 +1,74 @@
+# benchmarks/bench_prefetch.py
+# Planner iterations and wall time of a run whose prompt names the files to change, with and without the speculative
+# prefetch. The emulated planner behaves like a sensible model: it reads each named file that its prompt does not list
+# in the File Cache Summary yet, one per step, and finishes once all of them are there.
+#
+# Usage: python benchmarks/bench_prefetch.py [--files 4] [--first-token-ms 150]
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from agent import Config, run_advanced_agent
+from llm_emulator import EmulatorServer, ResponseScript
+
+
+def script_for(files: list[str]) -> ResponseScript:
+    rules = [{"match": rf'^(?!.*"path":"{name.replace(".", chr(92) + ".")}")',
+              "response": f"Thought: I need {name}.\nAction: " + json.dumps({"tool_name": "FileSystemTool.read_file", "arguments": {"file_path_str": name}})}
+             for name in files]
+    finish = {"tool_name": "finish_sub_task", "result": {"status": "success", "message": "done", "directives": [
+        {"file_path": name, "change_type": "append_to_file", "code_snippet": ["# logged"]} for name in files]}}
+    return ResponseScript({"rules": rules, "default_response": "Thought: All files are cached.\nAction: " + json.dumps(finish)})
+
+
+def run(work_dir: Path, files: list[str], prefetch: bool, first_token_ms: float) -> tuple[float, int]:
+    with EmulatorServer(config={"first_token_ms": first_token_ms}, script=script_for(files)) as server:
+        with contextlib.redirect_stdout(io.StringIO()):
+            config = Config(str(work_dir / "missing.yaml"))
+        config.data = {
+            "ollama": {"base_url": server.ollama_base_url},
+            "llm_cache": {"enabled": False},
+            "checkpoint": {"enabled": False},
+            "retrieval": {"enabled": False},
+            "telemetry": {"report_path": ""},
+            "prefetch": {"enabled": prefetch},
+            "operational_modes": {"normal": {"default_planning_model": "ollama/emulator", "default_generation_model": "ollama/emulator"}},
+        }
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_advanced_agent(f"Add logging to {', '.join(files)}", config, "normal", work_dir / "project",
+                               dry_run=True, no_backup=True, skip_confirmation=True)
+        return time.perf_counter() - started, server.stats()["requests"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Planner iterations with and without speculative file prefetch.")
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--first-token-ms", type=float, default=150.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        (work_dir / "project").mkdir()
+        files = [f"mod_{n}.py" for n in range(args.files)]
+        for name in files:
+            (work_dir / "project" / name).write_text(f"def {name[:-3]}(event):\n    return event\n", encoding="utf-8")
+        os.chdir(work_dir) # The agent writes its preview file to the working directory
+        without_s, without_calls = run(work_dir, files, False, args.first_token_ms)
+        with_s, with_calls = run(work_dir, files, True, args.first_token_ms)
+
+    print(f"Prompt naming {args.files} files, first token {args.first_token_ms} ms")
+    print(f"without prefetch: {without_calls} planner calls, {without_s * 1000:.0f} ms")
+    print(f"with prefetch:    {with_calls} planner calls, {with_s * 1000:.0f} ms")
+    print(f"{without_calls - with_calls} read_file iterations saved, {without_s / with_s:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_prefix_cache.py
+# Prefill time per ReAct iteration with the prefix-cache friendly planner prompt (stable goal/sub-task/tools first,
+# then the growing history, history window moving in half-window strides) versus the previous layout (tool list last,
+# window sliding by one step per iteration). Runs against the local emulator with prompt caching enabled, so only
+# the part of each prompt after the prefix shared with a recent one is charged prefill.
+#
+# Usage: python benchmarks/bench_prefix_cache.py [--iterations 12] [--prefill-ms-per-1k-chars 40] [--budget 6000]
+import argparse
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from advanced_planner_tools import StateManager
+from connectors import LLMUsage, OllamaConnector
+from llm_emulator import EmulatorServer
+from prompt_builder import PromptBuilder, estimate_tokens, shorten_strings
+from tools import LLMTool
+
+MODEL = "bench-planner"
+FILE_BODY = "def handler(event, context):\n    payload = parse(event['body'])\n    return respond(200, payload)\n" * 8
+
+
+def legacy_plan_step_prompt(llm_tool: LLMTool, state: StateManager, system_prompt: str) -> str:
+    """The planner prompt layout used before: goal, sub-task, last N history steps, file cache, tool list."""
+    cfg = llm_tool.prompt_budget_config
+    history = state.get_history_for_sub_task(state.current_sub_task_id)[-int(cfg["history_steps"]):]
+    history_items = [shorten_strings(step, int(cfg["max_field_chars"])) for step in history]
+    file_cache_items = [{"path": fp, "length": len(content), "snippet": content[:80]} for fp, content in state.file_cache.items()]
+    builder = PromptBuilder(llm_tool.prompt_budget_for(MODEL), reserved_tokens=estimate_tokens(system_prompt))
+    builder.add_section("goal", f"Overall Goal: {state.plan.get('overall_goal', 'N/A')}", priority=0, required=True)
+    builder.add_section("sub_task", f"Current Sub-task ID '{state.current_sub_task_id}': {state.get_current_sub_task_description()}",
+                        priority=1, required=True)
+    if history_items:
+        builder.add_items_section("recent_actions", "History for this sub-task (oldest first, one JSON step per line):\n", history_items, priority=2)
+    else:
+        builder.add_section("recent_actions", "History for this sub-task: (none yet)", priority=2)
+    if file_cache_items:
+        builder.add_items_section("file_cache", "File Cache Summary (one JSON entry per line):\n", file_cache_items, priority=3)
+    else:
+        builder.add_section("file_cache", "File Cache Summary: (empty)", priority=3)
+    builder.add_section("instructions", "Available tools: [FileSystemTool.read_file, LLMTool.generate_code_snippet, LLMTool.generate_multi_part_code_solution, CodeAnalysisTool.get_code_structure, RequestClarificationTool.request_clarification, finish_sub_task]\n"
+                        "Provide your thought and action as JSON ({\"thought\": ..., \"action\": {...}}):", priority=0, required=True)
+    return builder.build()[0]
+
+
+def advance(state: StateManager, step: int):
+    """One simulated ReAct iteration: every other step reads a new file, the others analyse one."""
+    path = f"src/module_{step // 2}.py"
+    if step % 2 == 0:
+        state.update_file_cache(path, FILE_BODY)
+        action = {"tool_name": "FileSystemTool.read_file", "arguments": {"file_path_str": path}}
+        observation = {"status": "success", "content": FILE_BODY}
+    else:
+        action = {"tool_name": "CodeAnalysisTool.get_code_structure", "arguments": {"file_content": "<cached>", "file_type": "python"}}
+        observation = {"status": "success", "functions": ["handler", "parse", "respond"], "classes": []}
+    state.add_history(state.current_sub_task_id, f"Step {step}: inspect {path} before editing it.", action, observation)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Planner prompt prefix-cache benchmark against the local LLM emulator.")
+    parser.add_argument("--iterations", type=int, default=12)
+    parser.add_argument("--prefill-ms-per-1k-chars", type=float, default=40.0)
+    parser.add_argument("--first-token-ms", type=float, default=10.0)
+    parser.add_argument("--budget", type=int, default=6000, help="Planner prompt token budget.")
+    args = parser.parse_args()
+
+    emulator_config = {"first_token_ms": args.first_token_ms, "prefill_ms_per_1k_chars": args.prefill_ms_per_1k_chars,
+                       "prefix_cache_slots": 4}
+    with EmulatorServer(config=emulator_config) as server, contextlib.redirect_stdout(io.StringIO()):
+        llm_tool = LLMTool({"OLLAMA_BASE_URL": server.ollama_base_url, "DEFAULT_MODEL_CHOICE": f"ollama/{MODEL}",
+                            "PROMPT_BUDGET": {"default_tokens": args.budget}, "LLM_CACHE": {"enabled": False}})
+        system_prompt = llm_tool.plan_step_system_prompt(structured=True)
+        connector = OllamaConnector(server.ollama_base_url)
+        layouts = {
+            "legacy": lambda state: legacy_plan_step_prompt(llm_tool, state, system_prompt),
+            "stable": lambda state: llm_tool.build_plan_step_prompt(state, f"ollama/{MODEL}", system_prompt, structured=True)[0],
+        }
+        results = {}
+        for layout, build_prompt in layouts.items():
+            state = StateManager("Add structured logging to every request handler", "ollama_only", {}, Path("."), dry_run=True)
+            state.set_plan({"overall_goal": "Add structured logging to every request handler",
+                            "sub_tasks": [{"id": "st_1", "description": "Add a logger call at the top of each handler in src/"}]})
+            state.current_sub_task_id = "st_1"
+            per_iteration = []
+            for step in range(args.iterations):
+                prompt = build_prompt(state)
+                usage = LLMUsage("ollama", f"{MODEL}-{layout}")
+                connector.generate(prompt, f"{MODEL}-{layout}", system_prompt, max_tokens=32, usage=usage)
+                per_iteration.append((len(prompt) + len(system_prompt), usage.prompt_eval_time_s * 1000))
+                advance(state, step)
+            results[layout] = per_iteration
+        stats = server.stats()
+        connector.close()
+
+    print(f"{'iter':>4}{'legacy chars':>14}{'legacy prefill ms':>19}{'stable chars':>14}{'stable prefill ms':>19}")
+    for i, ((legacy_chars, legacy_ms), (stable_chars, stable_ms)) in enumerate(zip(results["legacy"], results["stable"])):
+        print(f"{i:>4}{legacy_chars:>14}{legacy_ms:>19.1f}{stable_chars:>14}{stable_ms:>19.1f}")
+    legacy_total = sum(ms for _, ms in results["legacy"])
+    stable_total = sum(ms for _, ms in results["stable"])
+    print(f"{'sum':>4}{'':>14}{legacy_total:>19.1f}{'':>14}{stable_total:>19.1f}")
+    if legacy_total:
+        print(f"Prefill time reduction: {100 * (1 - stable_total / legacy_total):.1f}% "
+              f"({(legacy_total - stable_total) / args.iterations:.1f} ms per iteration)")
+    print(f"Emulator: {stats['prefix_cached_chars']}/{stats['prompt_chars']} prompt chars served from the prefix cache")
+
+
+if __name__ == "__main__":
+    main()
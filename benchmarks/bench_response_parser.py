@@ -0,0 +1,94 @@
+# benchmarks/bench_response_parser.py
+# Compares the single-pass response_parser with the regex extraction generate_plan_step used before, over a corpus
+# of typical planner responses and adversarial ones (long, malformed, nested or truncated output).
+#
+# Usage: python benchmarks/bench_response_parser.py [--scale 2000] [--repeat 20]
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from response_parser import ResponseParser, parse_response
+
+
+def legacy_parse(response_text: str) -> dict | None:
+    """The previous generate_plan_step extraction: lazy regex, two regex repairs, json.loads."""
+    match = re.search(r"Thought:\s*(.*?)(?:\n\s*Action:\s*(\{[\s\S]*?\})\s*$|\Z)", response_text, re.DOTALL | re.IGNORECASE)
+    if not match or not match.group(2):
+        return None
+    candidate = match.group(2).strip()
+    candidate = re.sub(r'(:\s*"[^"]*?[^"\\])\s*(\}\s*)$', r'\1"\2', candidate)
+    candidate = re.sub(r'(:\s*"[^"]*?[^"\\])\s*(,\s*".*)$', r'\1"\2', candidate)
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+
+
+def build_corpus(scale: int) -> list[tuple[str, str, bool]]:
+    """(name, response, action expected) triples."""
+    read_action = {"tool_name": "FileSystemTool.read_file", "arguments": {"file_path_str": "src/app.py"}}
+    finish_action = {"tool_name": "finish_sub_task", "result": {"status": "success", "message": "Done.", "directives": [
+        {"file_path": "src/app.py", "action": "insert_after", "block_identifier": {"type": "function", "name": "hello"},
+         "code": "def bye():\n    print('bye')\n"}]}}
+    code = "def handler(event):\n    return {'status': 200, 'body': event}\n" * max(scale // 40, 1)
+    return [
+        ("read_file", f"Thought: I need the file first.\nAction: {json.dumps(read_action)}", True),
+        ("finish_nested", f"Thought: Ready to finish.\nAction: {json.dumps(finish_action, indent=2)}", True),
+        ("fenced_action", f"Thought: Finish.\nAction: ```json\n{json.dumps(finish_action)}\n```", True),
+        ("trailing_prose", f"Thought: Read.\nAction: {json.dumps(read_action)}\nI will wait for the result.", True),
+        ("python_literals", "Thought: x\nAction: {'tool_name': 'finish_sub_task', 'result': {'status': 'success', 'directives': [], 'ok': True,}}", True),
+        ("truncated_string", 'Thought: read\nAction: {"tool_name": "FileSystemTool.read_file", "arguments": {"file_path_str": "src/app.py}}', True),
+        ("cut_by_max_tokens", f"Thought: write\nAction: {json.dumps(finish_action)[:-40]}", True),
+        ("long_thought", "Thought: " + "Considering the module layout carefully. " * scale + f"\nAction: {json.dumps(read_action)}", True),
+        ("code_in_directive", "Thought: ok\nAction: " + json.dumps({"tool_name": "finish_sub_task", "result": {"status": "success", "directives": [{"code": code}]}}), True),
+        ("action_in_prose", f"Thought: My next action: read [utils.py] first.\nAction: {json.dumps(read_action)}", True),
+        ("inline_brackets", f"Thought: Compare [a, b] with {{x}} in [utils.py].\nAction: {json.dumps(read_action)}", True),
+        ("many_action_markers", "Thought: " + "\nAction: {}x" * scale, True),
+        ("unbalanced_braces", "Thought: " + "{" * scale + "\nAction: " + "{" * scale, False),
+        ("no_markers", "Sure! " * scale, False),
+    ]
+
+
+def time_it(fn, text: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def streamed_parse(text: str, chunk_size: int = 16) -> int:
+    """Feeds the response in stream-sized chunks; returns how many characters were needed to see the full action."""
+    parser = ResponseParser()
+    for i in range(0, len(text), chunk_size):
+        if parser.feed(text[i:i + chunk_size]):
+            return i + chunk_size
+    parser.finish()
+    return len(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response parser benchmark: single-pass parser vs legacy regexes.")
+    parser.add_argument("--scale", type=int, default=2000, help="Size factor for the long/adversarial responses.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'case':<22}{'chars':>9}{'legacy ms':>12}{'parser ms':>12}{'legacy ok':>11}{'parser ok':>11}{'stop at':>10}")
+    totals = [0.0, 0.0]
+    for name, text, expected in build_corpus(args.scale):
+        legacy_ok = (legacy_parse(text) is not None) == expected
+        parsed = parse_response(text)
+        parser_ok = (parsed.action is not None) == expected
+        legacy_ms = time_it(legacy_parse, text, args.repeat)
+        parser_ms = time_it(parse_response, text, args.repeat)
+        totals[0] += legacy_ms
+        totals[1] += parser_ms
+        print(f"{name:<22}{len(text):>9}{legacy_ms:>12.3f}{parser_ms:>12.3f}{str(legacy_ok):>11}{str(parser_ok):>11}{streamed_parse(text):>10}")
+    print(f"{'total':<22}{'':>9}{totals[0]:>12.3f}{totals[1]:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
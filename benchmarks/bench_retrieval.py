@@ -0,0 +1,93 @@
+# benchmarks/bench_retrieval.py
+# Context selection quality and cost: for a set of requests against a project (this repository by default), does the
+# code that answers the request make it into the prompt when the context is the first 1500 characters of the file
+# (the previous behaviour) versus the top-k chunks from code_index? Also times a full build, an incremental no-op
+# refresh and searches.
+#
+# Usage: python benchmarks/bench_retrieval.py [--project .] [--top-k 3] [--embedder hashing|ollama]
+import argparse
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from code_index import CodeIndex, build_embedder
+
+PREFIX_CHARS = 1500
+# (request, file, symbol whose code answers it) for this repository
+QUERIES = [
+    ("Make the circuit breaker stay open longer before the half-open probe", "resilience.py", "CircuitBreaker"),
+    ("Allow bursts above the token bucket rate limit", "resilience.py", "TokenBucket"),
+    ("Use a different EWMA alpha for the latency percentile used for hedging", "llm_routing.py", "LatencyTracker"),
+    ("Repair JSON that was cut off inside an unterminated string", "response_parser.py", "repair_json"),
+    ("Support minLength when validating JSON against a schema", "llm_schemas.py", "validate_json"),
+    ("Evict least recently used cached LLM responses when the cache is too large", "llm_cache.py", "ResponseCache"),
+    ("Send num_ctx in the Ollama chat payload options", "connectors.py", "build_ollama_payload"),
+    ("Find the target block by function name or custom markers", "replacer_core.py", "find_target_block"),
+    ("Show a unified diff of the modified file before writing", "replacer_core.py", "show_diff"),
+    ("Drop the oldest history entries when the prompt is over budget", "prompt_builder.py", "PromptBuilder"),
+]
+
+
+def prefix_contains(project: Path, file: str, symbol: str) -> bool:
+    text = (project / file).read_text(encoding="utf-8", errors="replace")[:PREFIX_CHARS]
+    return f"def {symbol}" in text or f"class {symbol}" in text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval index benchmark: file prefixes vs top-k chunks.")
+    parser.add_argument("--project", default=str(Path(__file__).resolve().parent.parent))
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--embedder", default="hashing")
+    parser.add_argument("--ollama-base-url", default="http://localhost:11434")
+    args = parser.parse_args()
+
+    project = Path(args.project).resolve()
+    index_dir = tempfile.mkdtemp(prefix="bench_code_index_")
+    config = {"index_dir": index_dir, "embedder": args.embedder}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            embedder = build_embedder(config, args.ollama_base_url)
+            index = CodeIndex(project, embedder, config)
+            started = time.perf_counter()
+            index.refresh()
+            build_s = time.perf_counter() - started
+            started = time.perf_counter()
+            CodeIndex(project, embedder, config).refresh()
+            refresh_s = time.perf_counter() - started
+        stats = index.get_stats()
+        print(f"Embedder {stats['embedder']}: {stats['files']} files, {stats['chunks']} chunks; "
+              f"full build {build_s * 1000:.0f} ms, reopen + no-op refresh {refresh_s * 1000:.0f} ms")
+
+        print(f"{'request':<60}{'prefix':>8}{'in file':>9}{'global':>8}{'chars':>8}")
+        totals = {"prefix": 0, "in_file": 0, "global": 0}
+        search_s, retrieved_chars = 0.0, 0
+        for request, file, symbol in QUERIES:
+            if not (project / file).exists():
+                continue
+            in_prefix = prefix_contains(project, file, symbol)
+            started = time.perf_counter()
+            file_hits = index.search(request, args.top_k, paths=[file])
+            global_hits = index.search(request, args.top_k)
+            search_s += time.perf_counter() - started
+            in_file = any(h["symbol"] == symbol for h in file_hits)
+            in_global = any(h["symbol"] == symbol and h["path"] == file for h in global_hits)
+            chars = sum(len(h["text"][:PREFIX_CHARS]) for h in file_hits)
+            retrieved_chars += chars
+            totals["prefix"] += in_prefix
+            totals["in_file"] += in_file
+            totals["global"] += in_global
+            print(f"{request[:58]:<60}{str(in_prefix):>8}{str(in_file):>9}{str(in_global):>8}{chars:>8}")
+        print(f"{'found':<60}{totals['prefix']:>8}{totals['in_file']:>9}{totals['global']:>8}")
+        print(f"Average search {search_s / (2 * len(QUERIES)) * 1000:.2f} ms; average retrieved context "
+              f"{retrieved_chars / len(QUERIES):.0f} chars per file (prefix context: {PREFIX_CHARS})")
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
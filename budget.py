@@ -0,0 +1,204 @@
+# budget.py
+# Per-run token / cost / wall-clock budget and complexity-aware model choice.
+# Each sub-task is sent to the model tier of its complexity label (simple -> small or local models, complex -> large
+# ones). The run's remaining budget is shared out over the sub-tasks that have not finished, in proportion to their
+# projected need, and re-shared before every plan step from what has actually been spent; a sub-task whose spend plus
+# projected remaining need no longer fits its share moves down a tier. Projections start from configured per-step
+# estimates and switch to the run's observed per-step averages once there are any. Hard limits stop the run's
+# sub-tasks the same way the call-count limits do.
+import threading
+import time
+
+DEFAULT_BUDGET_CONFIG = {
+    "max_tokens": 0,                         # Prompt + completion tokens for the whole run; 0 = no limit
+    "max_cost_usd": 0.0,                     # 0 = no limit
+    "max_wall_s": 0.0,                       # 0 = no limit
+    "tiers": {},                             # simple/medium/complex -> {"planning_model": ..., "generation_model": ...}
+    "prices": {},                            # model choice -> [USD per 1M prompt tokens, USD per 1M completion tokens]
+    "steps_by_complexity": {"simple": 2, "medium": 4, "complex": 6},
+    "estimate_prompt_tokens_per_step": 2500, # Projection until the run has measured its own steps
+    "estimate_completion_tokens_per_step": 300,
+    "estimate_seconds_per_step": 10.0,
+}
+
+TIER_ORDER = ("simple", "medium", "complex")
+
+
+def tier_for(complexity: str | None) -> str:
+    return complexity if complexity in TIER_ORDER else "medium"
+
+
+class BudgetScheduler:
+    def __init__(self, config: dict | None, mode_config: dict):
+        cfg = dict(DEFAULT_BUDGET_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.limits = {"tokens": float(cfg["max_tokens"] or 0), "cost_usd": float(cfg["max_cost_usd"] or 0),
+                       "wall_s": float(cfg["max_wall_s"] or 0)}
+        self.mode_models = {"planning_model": mode_config.get("planning_model"), "generation_model": mode_config.get("generation_model")}
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+        self.projected_at_start: dict | None = None
+        self.sub_tasks: dict[str, dict] = {} # id -> {"tier", "steps", "projected", "models", "finished", "downgrades"}
+        self.downgrades = 0
+        self.stopped_reason: str | None = None
+
+    @property
+    def limited(self) -> bool:
+        return any(self.limits.values())
+
+    # --- model tiers and prices ---
+
+    def models_for_tier(self, tier: str) -> dict:
+        models = dict(self.mode_models)
+        models.update({k: v for k, v in (self.config["tiers"].get(tier) or {}).items() if k in models and v})
+        return models
+
+    def cost_of(self, model: str | None, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self.config["prices"].get(model or "")
+        if not price:
+            return 0.0 # Local / unpriced models
+        return (prompt_tokens * float(price[0]) + completion_tokens * float(price[1])) / 1_000_000
+
+    # --- spend ---
+
+    def _spend(self, records: list[dict], sub_task_id: str | None = None) -> dict:
+        spend = {"tokens": 0.0, "cost_usd": 0.0, "wall_s": 0.0, "calls": 0}
+        for record in records:
+            if sub_task_id is not None and record.get("sub_task_id") != sub_task_id:
+                continue
+            prompt_tokens, completion_tokens = record.get("prompt_tokens") or 0, record.get("completion_tokens") or 0
+            spend["tokens"] += prompt_tokens + completion_tokens
+            spend["cost_usd"] += self.cost_of(record.get("model"), prompt_tokens, completion_tokens)
+            spend["wall_s"] += record.get("wall_time_s") or 0.0
+            spend["calls"] += 1
+        return spend
+
+    def _per_step(self, state_manager, records: list[dict]) -> dict:
+        """Tokens and LLM time of one plan step (its generation calls included): measured once the run has steps, else
+        the configured estimates."""
+        steps = sum(len(history) for history in list(state_manager.history_per_sub_task.values()))
+        if steps:
+            spend = self._spend(records)
+            return {"tokens": spend["tokens"] / steps, "wall_s": spend["wall_s"] / steps}
+        cfg = self.config
+        return {"tokens": float(cfg["estimate_prompt_tokens_per_step"]) + float(cfg["estimate_completion_tokens_per_step"]),
+                "wall_s": float(cfg["estimate_seconds_per_step"])}
+
+    def _project(self, steps: float, tier: str, per_step: dict) -> dict:
+        tokens = steps * per_step["tokens"]
+        completion_share = float(self.config["estimate_completion_tokens_per_step"]) / max(
+            1.0, float(self.config["estimate_prompt_tokens_per_step"]) + float(self.config["estimate_completion_tokens_per_step"]))
+        completion = tokens * completion_share
+        return {"tokens": tokens, "cost_usd": self.cost_of(self.models_for_tier(tier)["planning_model"], tokens - completion, completion),
+                "wall_s": steps * per_step["wall_s"]}
+
+    # --- scheduling ---
+
+    def plan(self, state_manager):
+        """Projects the plan's spend per sub-task (call once the plan is set)."""
+        records = self._records(state_manager)
+        per_step = self._per_step(state_manager, records)
+        totals = {"tokens": 0.0, "cost_usd": 0.0, "wall_s": 0.0}
+        with self._lock:
+            for task in (state_manager.plan or {}).get("sub_tasks") or []:
+                tier = tier_for(task.get("complexity"))
+                steps = float(self.config["steps_by_complexity"].get(tier, 4))
+                projected = self._project(steps, tier, per_step)
+                self.sub_tasks[str(task.get("id"))] = {"tier": tier, "steps": steps, "projected": projected, "models": None,
+                                                       "finished": str(task.get("id")) in state_manager.finished_sub_tasks,
+                                                       "downgrades": 0}
+                for key in totals:
+                    totals[key] += projected[key]
+            self.projected_at_start = totals
+
+    def choose_models(self, state_manager, sub_task_id) -> dict:
+        """Models for the next plan step of a sub-task: its complexity tier, moved down while its spend plus projected
+        remaining need exceeds its share of the remaining budget."""
+        key = str(sub_task_id)
+        records = self._records(state_manager)
+        with self._lock:
+            entry = self.sub_tasks.get(key)
+            if entry is None:
+                return dict(self.mode_models)
+            tier = entry["tier"]
+            if self.limited:
+                per_step = self._per_step(state_manager, records)
+                spent = self._spend(records, key)
+                share = self._share(key, records)
+                steps_done = len(state_manager.get_history_for_sub_task(key))
+                remaining_steps = max(entry["steps"] - steps_done, 1.0)
+                while TIER_ORDER.index(tier) > 0:
+                    need = self._project(remaining_steps, tier, per_step)
+                    if all(not limit or spent[dim] + need[dim] <= share[dim]
+                           for dim, limit in self.limits.items() if dim != "wall_s"):
+                        break
+                    tier = TIER_ORDER[TIER_ORDER.index(tier) - 1]
+                if tier != entry["tier"] and entry.get("current_tier") != tier:
+                    print(f"INFO: Budget: Sub-task '{key}' moves from the {entry['tier']} to the {tier} tier to stay within its share "
+                          f"({_format_spend(share)}).")
+                    entry["downgrades"] += 1
+                    self.downgrades += 1
+            entry["current_tier"] = tier
+            entry["models"] = self.models_for_tier(tier)
+            return dict(entry["models"])
+
+    def _share(self, sub_task_id: str, records: list[dict]) -> dict:
+        """What this sub-task may spend in total: what it has spent plus its weighted part of the run's remaining budget."""
+        pending = {k: v for k, v in self.sub_tasks.items() if not v["finished"]}
+        total_weight = sum(v["projected"]["tokens"] for v in pending.values()) or 1.0
+        weight = self.sub_tasks[sub_task_id]["projected"]["tokens"] / total_weight
+        spent_run, spent_sub = self._spend(records), self._spend(records, sub_task_id)
+        spent_run["wall_s"] = time.perf_counter() - self.started_at
+        return {dim: (max(limit - spent_run[dim], 0.0) * weight + spent_sub[dim]) if limit else float("inf")
+                for dim, limit in self.limits.items()}
+
+    def exhausted(self, state_manager) -> str | None:
+        """Why the run must stop (a hard limit reached), or None."""
+        spend = self._spend(self._records(state_manager))
+        spend["wall_s"] = time.perf_counter() - self.started_at
+        for dim, limit in self.limits.items():
+            if limit and spend[dim] >= limit:
+                with self._lock:
+                    self.stopped_reason = f"{dim} budget of {limit:g} reached ({spend[dim]:.4g} spent)"
+                return self.stopped_reason
+        return None
+
+    def finish_sub_task(self, sub_task_id):
+        with self._lock:
+            if str(sub_task_id) in self.sub_tasks:
+                self.sub_tasks[str(sub_task_id)]["finished"] = True
+
+    # --- reporting ---
+
+    def report(self, state_manager) -> dict:
+        records = self._records(state_manager)
+        actual = self._spend(records)
+        actual["wall_s"] = time.perf_counter() - self.started_at
+        with self._lock:
+            per_sub_task = {}
+            for key, entry in self.sub_tasks.items():
+                spent = self._spend(records, key)
+                per_sub_task[key] = {"tier": entry["tier"], "final_tier": entry.get("current_tier", entry["tier"]),
+                                     "models": entry["models"], "downgrades": entry["downgrades"],
+                                     "projected": _rounded(entry["projected"]), "actual": _rounded(spent)}
+            return {"limits": dict(self.limits), "projected": _rounded(self.projected_at_start or {}), "actual": _rounded(actual),
+                    "downgrades": self.downgrades, "stopped_reason": self.stopped_reason, "per_sub_task": per_sub_task}
+
+    @staticmethod
+    def _records(state_manager) -> list[dict]:
+        with state_manager._usage_lock:
+            return [r for r in state_manager.llm_usage_records if not r.get("cached")]
+
+
+def _rounded(spend: dict) -> dict:
+    return {k: (round(v, 6) if k == "cost_usd" else round(v, 2)) if isinstance(v, float) else v for k, v in spend.items()}
+
+
+def _format_spend(spend: dict) -> str:
+    parts = []
+    if spend.get("tokens") not in (None, float("inf")): parts.append(f"{spend['tokens']:.0f} tokens")
+    if spend.get("cost_usd") not in (None, float("inf")): parts.append(f"${spend['cost_usd']:.4f}")
+    if spend.get("wall_s") not in (None, float("inf")): parts.append(f"{spend['wall_s']:.1f}s")
+    return ", ".join(parts) or "unlimited"
@@ -0,0 +1,150 @@
+# checkpoint.py
+# Append-only JSON-lines checkpoints of a run's StateManager, so an interrupted or crashed run can be resumed
+# (agent.py --resume <run-id>) without paying again for LLM calls whose results were already recorded.
+# Each record is one line written with a single O_APPEND write and fsync'd, so the file always holds every completed
+# step; a line cut off by a crash is detected and ignored on load. Records are incremental (one history entry, the
+# LLM calls and file fingerprints that are new since the previous record), which keeps checkpointing O(step), not
+# O(run).
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_CHECKPOINT_CONFIG = {
+    "enabled": True,
+    "dir": ".ai_agent_cache/runs",  # One sub-directory per run id
+}
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+
+def new_run_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+class RunCheckpoint:
+    def __init__(self, base_dir: str | Path, run_id: str):
+        self.run_id = run_id
+        self.run_dir = Path(base_dir) / run_id
+        self.path = self.run_dir / CHECKPOINT_FILE
+        self._lock = threading.Lock()
+        self._usage_written = 0             # llm_usage_records already in the file
+        self._fingerprints_written: dict = {}
+        self.records_written = 0
+
+    @classmethod
+    def create(cls, base_dir: str | Path, run_id: str | None = None) -> "RunCheckpoint":
+        checkpoint = cls(base_dir, run_id or new_run_id())
+        checkpoint.run_dir.mkdir(parents=True, exist_ok=True)
+        return checkpoint
+
+    @classmethod
+    def open(cls, base_dir: str | Path, run_id: str) -> "RunCheckpoint":
+        checkpoint = cls(base_dir, run_id)
+        if not checkpoint.path.is_file():
+            raise FileNotFoundError(f"No checkpoint for run '{run_id}' at {checkpoint.path}")
+        with open(checkpoint.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"): # Cut off by a crash mid-write; appending after it would corrupt the next record
+                print(f"WARNING: Checkpoint: Dropping incomplete last record in {checkpoint.path}.")
+                f.truncate(data.rfind(b"\n") + 1)
+        return checkpoint
+
+    def append(self, record: dict):
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.records_written += 1
+
+    def read_records(self) -> list[dict]:
+        records = []
+        with open(self.path, "rb") as f:
+            lines = f.read().split(b"\n")
+        for line_no, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Only the last line can be incomplete (cut off mid-write); anything else is real corruption
+                if line_no < len(lines) - 1:
+                    raise ValueError(f"Corrupt checkpoint record at {self.path}:{line_no}")
+                print(f"WARNING: Checkpoint: Ignoring incomplete last record in {self.path}.")
+        return records
+
+    # --- Records written during a run ---
+
+    def write_start(self, state_manager, project_path: Path):
+        self.append({"t": "start", "run_id": self.run_id, "time": time.time(), "user_prompt": state_manager.user_prompt,
+                     "operational_mode": state_manager.operational_mode, "mode_config": state_manager.mode_config,
+                     "project_path": str(project_path), "dry_run": state_manager.dry_run})
+
+    def write_plan(self, plan: dict | None):
+        self.append({"t": "plan", "plan": plan})
+
+    def write_step(self, state_manager, sub_task_id: str, entry: dict):
+        # Blobs behind the handles in this entry must be on disk before a record refers to them
+        state_manager.observations.flush()
+        self.append({"t": "step", "sub_task": sub_task_id, "entry": entry, **self._progress(state_manager)})
+
+    def write_sub_task_done(self, state_manager, sub_task_id: str, status: str, directives: list):
+        self.append({"t": "sub_task_done", "sub_task": sub_task_id, "status": status, "directives": directives,
+                     **self._progress(state_manager)})
+
+    def write_finished(self, state_manager):
+        self.append({"t": "finished", "time": time.time(), **self._progress(state_manager)})
+
+    def _progress(self, state_manager) -> dict:
+        """Counters, plus the LLM calls and file fingerprints that changed since the previous record."""
+        with state_manager._usage_lock:
+            new_usage = state_manager.llm_usage_records[self._usage_written:]
+            self._usage_written = len(state_manager.llm_usage_records)
+        fingerprints = state_manager.file_cache.fingerprints()
+        changed = {path: fp for path, fp in fingerprints.items() if self._fingerprints_written.get(path) != fp}
+        self._fingerprints_written.update(changed)
+        return {"openrouter_calls": state_manager.openrouter_api_calls_made_total,
+                "planning_iterations": state_manager.planning_iterations_current_sub_task,
+                "usage": new_usage, "files": changed}
+
+
+def restore_state(state_manager, records: list[dict], checkpoint: RunCheckpoint | None = None) -> dict:
+    """Replays checkpoint records into a fresh StateManager. Returns a summary of what was restored.
+    If checkpoint is the writer that will continue the run, its incremental bookkeeping is brought up to date."""
+    summary = {"steps": 0, "finished_sub_tasks": 0, "llm_calls": 0, "changed_files": [], "finished": False}
+    fingerprints = {}
+    for record in records:
+        kind = record.get("t")
+        if kind == "plan":
+            state_manager.plan = record["plan"]
+        elif kind == "step":
+            state_manager.history_per_sub_task.setdefault(str(record["sub_task"]), []).append(record["entry"])
+            # Sub-tasks may have run in parallel, so each keeps the iteration count of its own last step
+            state_manager.resumed_planning_iterations[str(record["sub_task"])] = record.get("planning_iterations", 0)
+            summary["steps"] += 1
+        elif kind == "sub_task_done":
+            state_manager.finished_sub_tasks[str(record["sub_task"])] = record.get("directives") or []
+            for task in (state_manager.plan or {}).get("sub_tasks", []):
+                if str(task.get("id")) == str(record["sub_task"]):
+                    task["status"] = record["status"]
+            if record.get("directives"):
+                state_manager.collected_change_directives.append(record["directives"])
+            summary["finished_sub_tasks"] += 1
+        elif kind == "finished":
+            summary["finished"] = True
+        if kind in ("step", "sub_task_done", "finished"):
+            state_manager.openrouter_api_calls_made_total = record.get("openrouter_calls", 0)
+            state_manager.llm_usage_records.extend(record.get("usage") or [])
+            summary["llm_calls"] += len(record.get("usage") or [])
+            fingerprints.update(record.get("files") or {})
+    summary["changed_files"] = state_manager.file_cache.changed_since(fingerprints)
+    if checkpoint is not None:
+        checkpoint._usage_written = len(state_manager.llm_usage_records)
+        checkpoint._fingerprints_written = dict(fingerprints)
+    return summary
@@ -0,0 +1,426 @@
+# code_index.py
+# Local retrieval index over the target project, so prompts can carry the code that is relevant to a request instead
+# of the first N characters of each file. Files are split into chunks (top-level symbols where the language has a
+# recognizable shape, overlapping line windows otherwise), embedded by a pluggable embedder (Ollama /api/embeddings,
+# or a model-free hashing vectorizer) and stored as unit vectors in a NumPy memory-mapped matrix; search is a cosine
+# top-k over that matrix. refresh() only re-embeds files whose size/mtime and content hash changed.
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from connectors import build_http_session
+
+DEFAULT_RETRIEVAL_CONFIG = {
+    "enabled": True,
+    "index_dir": ".ai_agent_cache/code_index", # One sub-directory per project path
+    "embedder": "hashing",          # hashing (no model needed) | ollama
+    "ollama_model": "nomic-embed-text",
+    "dimensions": 1024,             # Hashing embedder only; Ollama models have their own size
+    "top_k": 6,                     # Chunks offered to the planner per sub-task
+    "prompt_chunk_chars": 600,      # Each retrieved chunk is cut to this many characters in planner prompts
+    "chunk_lines": 60,              # Window size for files without symbols, and for symbols longer than this
+    "chunk_overlap": 10,
+    "max_file_bytes": 512 * 1024,   # Larger files are not indexed
+    "extensions": [".py", ".js", ".jsx", ".ts", ".tsx", ".html", ".css", ".scss", ".md", ".json", ".yaml", ".yml",
+                   ".toml", ".java", ".go", ".rs", ".c", ".h", ".cpp", ".hpp", ".cs", ".rb", ".php", ".sh"],
+    "exclude_dirs": [".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", "env", "dist", "build",
+                     ".ai_agent_cache", ".mypy_cache", ".pytest_cache", ".tox"],
+}
+
+# Lines that start a top-level symbol, per file extension
+_JS_SYMBOL = r"^(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\*?\s+(\w+)|class\s+(\w+)|(?:const|let|var)\s+(\w+)\s*=)"
+_SYMBOL_PATTERNS = {
+    ".py": re.compile(r"^(?:async\s+def|def|class)\s+(\w+)", re.MULTILINE),
+    ".js": re.compile(_JS_SYMBOL, re.MULTILINE), ".jsx": re.compile(_JS_SYMBOL, re.MULTILINE),
+    ".ts": re.compile(_JS_SYMBOL, re.MULTILINE), ".tsx": re.compile(_JS_SYMBOL, re.MULTILINE),
+    ".go": re.compile(r"^(?:func\s+(?:\([^)]*\)\s*)?(\w+)|type\s+(\w+))", re.MULTILINE),
+    ".rs": re.compile(r"^(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:fn|struct|enum|trait|impl|mod)\s+(\w+)", re.MULTILINE),
+    ".rb": re.compile(r"^(?:def|class|module)\s+([\w.]+)", re.MULTILINE),
+}
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z0-9_]+")
+_SUBWORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+# Words too common in code to say anything about relevance
+_STOP_WORDS = frozenset("""self cls def return import from class the if else elif for in and or not none null true false is to of
+a an this var let const function new as with try except finally raise pass while be it that on at by str int""".split())
+
+
+class Chunk:
+    def __init__(self, path: str, start_line: int, end_line: int, symbol: str | None, text: str):
+        self.path = path
+        self.start_line = start_line # 1-based, inclusive
+        self.end_line = end_line
+        self.symbol = symbol
+        self.text = text
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def chunk_text(path: str, text: str, chunk_lines: int = 60, chunk_overlap: int = 10) -> list[Chunk]:
+    """Splits a file at top-level symbol boundaries (preamble before the first symbol is its own chunk); segments
+    longer than chunk_lines, and files without a symbol pattern, are cut into overlapping line windows."""
+    lines = text.splitlines()
+    if not lines:
+        return []
+    pattern = _SYMBOL_PATTERNS.get(Path(path).suffix.lower())
+    segments: list[tuple[int, int, str | None]] = [] # (start index, end index exclusive, symbol)
+    if pattern is not None:
+        starts = []
+        for m in pattern.finditer(text):
+            line_index = text.count("\n", 0, m.start())
+            starts.append((line_index, next((g for g in m.groups() if g), None)))
+        if starts and starts[0][0] > 0:
+            segments.append((0, starts[0][0], None))
+        for i, (start, symbol) in enumerate(starts):
+            end = starts[i + 1][0] if i + 1 < len(starts) else len(lines)
+            segments.append((start, end, symbol))
+    if not segments:
+        segments = [(0, len(lines), None)]
+
+    chunks = []
+    step = max(chunk_lines - chunk_overlap, 1)
+    for start, end, symbol in segments:
+        window_start = start
+        while True:
+            window_end = min(window_start + chunk_lines, end)
+            body = "\n".join(lines[window_start:window_end])
+            if body.strip():
+                chunks.append(Chunk(path, window_start + 1, window_end, symbol, body))
+            if window_end >= end:
+                break
+            window_start += step
+    return chunks
+
+
+@lru_cache(maxsize=65536)
+def _token_slot(token: str, dimensions: int) -> tuple[int, float]:
+    h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dimensions, (1.0 if h >> 63 else -1.0)
+
+
+def code_tokens(text: str) -> list[str]:
+    """Identifiers and their camelCase/snake_case parts, lower-cased, without keywords and one-letter names."""
+    tokens = []
+    for ident in _IDENTIFIER_RE.findall(text):
+        lowered = ident.lower()
+        parts = [p.lower() for piece in ident.split("_") for p in _SUBWORD_RE.findall(piece)]
+        if len(lowered) > 1 and lowered not in _STOP_WORDS:
+            tokens.append(lowered)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 1 and p not in _STOP_WORDS)
+    return tokens
+
+
+class HashingEmbedder:
+    """Feature-hashed bag of code tokens (sublinear tf, signed buckets). Needs no model and no network."""
+    def __init__(self, dimensions: int = 1024):
+        self.dimensions = int(dimensions)
+        self.name = f"hashing-{self.dimensions}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: dict[str, int] = {}
+            for token in code_tokens(text):
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                slot, sign = _token_slot(token, self.dimensions)
+                out[row, slot] += sign * (1.0 + math.log(count))
+        return normalize_rows(out)
+
+
+class OllamaEmbedder:
+    """Embeddings from an Ollama embedding model (e.g. nomic-embed-text) via /api/embeddings."""
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "nomic-embed-text"):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.name = f"ollama-{model}"
+        self.session, self.timeout = build_http_session({"read_timeout": 120})
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = []
+        for text in texts:
+            response = self.session.post(f"{self.base_url}/api/embeddings", json={"model": self.model, "prompt": text}, timeout=self.timeout)
+            response.raise_for_status()
+            vectors.append(response.json()["embedding"])
+        return normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def rank_chunks(chunks: list[Chunk], query: str, embedder, top_k: int) -> list[tuple[Chunk, float]]:
+    """Cosine top-k of ad-hoc chunks (not from an index) against a query, best first."""
+    if not chunks or not query:
+        return []
+    vectors = embedder.embed([c.text for c in chunks])
+    scores = vectors @ embedder.embed([query])[0]
+    order = np.argsort(-scores)[:top_k]
+    return [(chunks[i], float(scores[i])) for i in order]
+
+
+class CodeIndex:
+    """Persistent chunk index of one project. vectors.f32 holds one unit vector per row (memory-mapped);
+    meta.json maps rows to chunks and files to rows, with the size/mtime/hash used for incremental refreshes."""
+    def __init__(self, project_root: Path, embedder, config: dict | None = None):
+        cfg = dict(DEFAULT_RETRIEVAL_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.root = Path(project_root).resolve()
+        self.embedder = embedder
+        self.dir = Path(cfg["index_dir"]) / hashlib.sha1(str(self.root).encode("utf-8")).hexdigest()[:16]
+        self._lock = threading.Lock()
+        self.vectors: np.memmap | None = None
+        self.stats = {"files": 0, "chunks": 0, "files_embedded": 0, "files_unchanged": 0, "files_removed": 0,
+                      "chunks_embedded": 0, "refresh_time_s": 0.0, "searches": 0, "search_time_s": 0.0}
+        self._load()
+
+    # --- storage ---
+
+    def _empty_meta(self) -> dict:
+        return {"version": 1, "root": str(self.root), "embedder": self.embedder.name, "dimensions": None,
+                "capacity": 0, "files": {}, "chunks": [], "free_rows": []}
+
+    def _load(self):
+        meta_path = self.dir / "meta.json"
+        self.meta = self._empty_meta()
+        if not meta_path.exists():
+            return
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"WARNING: CodeIndex: Could not read {meta_path} ({e}); rebuilding the index.")
+            return
+        if meta.get("embedder") != self.embedder.name or meta.get("version") != 1:
+            print(f"INFO: CodeIndex: Embedder changed ({meta.get('embedder')} -> {self.embedder.name}); rebuilding the index.")
+            return
+        vectors_path = self.dir / "vectors.f32"
+        if meta["capacity"] and vectors_path.exists():
+            self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(meta["capacity"], meta["dimensions"]))
+        elif meta["capacity"]:
+            return
+        self.meta = meta
+
+    def _save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if self.vectors is not None:
+            self.vectors.flush()
+        tmp_path = self.dir / "meta.json.tmp"
+        tmp_path.write_text(json.dumps(self.meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.dir / "meta.json")
+
+    def _ensure_capacity(self, rows_needed: int, dimensions: int):
+        meta = self.meta
+        if meta["dimensions"] is not None and meta["dimensions"] != dimensions:
+            raise ValueError(f"Embedding size changed from {meta['dimensions']} to {dimensions}")
+        if rows_needed <= meta["capacity"]:
+            return
+        capacity = max(64, meta["capacity"] * 2, rows_needed)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.dir / "vectors.f32.tmp"
+        grown = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(capacity, dimensions))
+        if self.vectors is not None:
+            grown[:meta["capacity"]] = self.vectors[:]
+        grown.flush()
+        del grown
+        self.vectors = None # Release the old mapping before replacing its file
+        os.replace(tmp_path, self.dir / "vectors.f32")
+        self.vectors = np.memmap(self.dir / "vectors.f32", dtype=np.float32, mode="r+", shape=(capacity, dimensions))
+        meta["free_rows"].extend(range(len(meta["chunks"]), capacity))
+        meta["chunks"].extend([None] * (capacity - len(meta["chunks"])))
+        meta["capacity"], meta["dimensions"] = capacity, dimensions
+
+    # --- indexing ---
+
+    def relative_path(self, file_path: str | Path) -> str:
+        path = Path(file_path)
+        if path.is_absolute():
+            try:
+                return path.resolve().relative_to(self.root).as_posix()
+            except ValueError:
+                return path.as_posix()
+        return Path(os.path.normpath(path)).as_posix()
+
+    def _iter_files(self):
+        extensions = {e.lower() for e in self.config["extensions"]}
+        excluded = set(self.config["exclude_dirs"])
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if d not in excluded and not d.startswith("."))
+            for filename in sorted(filenames):
+                if Path(filename).suffix.lower() in extensions:
+                    yield Path(dirpath) / filename
+
+    def refresh(self, paths: list[str] | None = None) -> dict:
+        """Brings the index up to date with the files on disk (or just `paths`). Returns counts for this refresh."""
+        started_at = time.perf_counter()
+        counts = {"embedded": 0, "unchanged": 0, "removed": 0, "chunks": 0}
+        with self._lock:
+            files = self.meta["files"]
+            candidates = [self.root / p for p in paths] if paths is not None else list(self._iter_files())
+            seen, pending = set(), []
+            for path in candidates:
+                rel = self.relative_path(path)
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue # Deleted: handled below for full refreshes, ignored for explicit paths
+                seen.add(rel)
+                entry = files.get(rel)
+                if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                    counts["unchanged"] += 1
+                    continue
+                if st.st_size > int(self.config["max_file_bytes"]):
+                    continue
+                try:
+                    data = path.read_bytes()
+                except OSError as e:
+                    print(f"WARNING: CodeIndex: Could not read {path}: {e}")
+                    continue
+                digest = hashlib.sha1(data).hexdigest()
+                if entry and entry["sha1"] == digest: # Touched but not changed
+                    entry["mtime_ns"], entry["size"] = st.st_mtime_ns, st.st_size
+                    counts["unchanged"] += 1
+                    continue
+                if b"\0" in data[:4096]:
+                    continue # Binary
+                chunks = chunk_text(rel, data.decode("utf-8", errors="replace"), int(self.config["chunk_lines"]), int(self.config["chunk_overlap"]))
+                pending.append((rel, st, digest, chunks))
+            removed = [rel for rel in files if rel not in seen] if paths is None else \
+                      [rel for rel in (self.relative_path(p) for p in paths) if rel in files and rel not in seen]
+            for rel in removed:
+                self._release_rows(files.pop(rel)["rows"])
+            counts["removed"] = len(removed)
+
+            texts = [f"{c.path}\n{c.symbol or ''}\n{c.text}" for _, _, _, chunks in pending for c in chunks]
+            vectors = self.embedder.embed(texts) if texts else None
+            offset = 0
+            for rel, st, digest, chunks in pending:
+                if rel in files:
+                    self._release_rows(files[rel]["rows"])
+                rows = []
+                if chunks:
+                    self._ensure_capacity(len(self.meta["chunks"]) - len(self.meta["free_rows"]) + len(chunks), vectors.shape[1])
+                    for chunk in chunks:
+                        row = self.meta["free_rows"].pop()
+                        self.vectors[row] = vectors[offset]
+                        self.meta["chunks"][row] = chunk.to_dict()
+                        rows.append(row)
+                        offset += 1
+                files[rel] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha1": digest, "rows": rows}
+                counts["embedded"] += 1
+                counts["chunks"] += len(chunks)
+            if pending or removed or paths is None:
+                self._save()
+            elapsed = time.perf_counter() - started_at
+            self.stats["files"] = len(files)
+            self.stats["chunks"] = len(self.meta["chunks"]) - len(self.meta["free_rows"])
+            self.stats["files_embedded"] += counts["embedded"]
+            self.stats["files_unchanged"] += counts["unchanged"]
+            self.stats["files_removed"] += counts["removed"]
+            self.stats["chunks_embedded"] += counts["chunks"]
+            self.stats["refresh_time_s"] += elapsed
+        print(f"INFO: CodeIndex: {self.stats['files']} files / {self.stats['chunks']} chunks indexed "
+              f"({counts['embedded']} re-embedded, {counts['unchanged']} unchanged, {counts['removed']} removed) in {elapsed:.2f}s.")
+        return counts
+
+    def _release_rows(self, rows: list[int]):
+        for row in rows:
+            self.meta["chunks"][row] = None
+        self.meta["free_rows"].extend(rows)
+
+    # --- search ---
+
+    def search(self, query: str, top_k: int | None = None, paths: list[str] | None = None) -> list[dict]:
+        """Best-matching chunks for the query (optionally only from `paths`), best first. Each hit is the chunk dict
+        plus its cosine 'score'."""
+        top_k = int(top_k or self.config["top_k"])
+        if not query or top_k <= 0:
+            return []
+        started_at = time.perf_counter()
+        query_vector = self.embedder.embed([query])[0]
+        with self._lock:
+            meta = self.meta
+            if self.vectors is None:
+                return []
+            if paths is not None:
+                rows = [row for p in paths for row in meta["files"].get(self.relative_path(p), {}).get("rows", [])]
+            else:
+                rows = [row for entry in meta["files"].values() for row in entry["rows"]]
+            if not rows:
+                return []
+            rows_array = np.asarray(rows, dtype=np.int64)
+            scores = self.vectors[rows_array] @ query_vector
+            k = min(top_k, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            hits = [dict(meta["chunks"][rows[i]], score=round(float(scores[i]), 4)) for i in best]
+            self.stats["searches"] += 1
+            self.stats["search_time_s"] += time.perf_counter() - started_at
+        return hits
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, embedder=self.embedder.name, index_dir=str(self.dir))
+
+
+def build_embedder(config: dict, ollama_base_url: str | None = None):
+    """The configured embedder; an unreachable Ollama embedding model falls back to the hashing embedder."""
+    if str(config.get("embedder", "hashing")).lower() == "ollama":
+        embedder = OllamaEmbedder(ollama_base_url or "http://localhost:11434", config.get("ollama_model", DEFAULT_RETRIEVAL_CONFIG["ollama_model"]))
+        try:
+            embedder.embed(["ping"])
+            return embedder
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print(f"WARNING: CodeIndex: Ollama embedding model '{embedder.model}' unavailable ({e}); using the hashing embedder.")
+    return HashingEmbedder(int(config.get("dimensions", DEFAULT_RETRIEVAL_CONFIG["dimensions"])))
+
+
+_index_registry: dict[str, CodeIndex] = {}
+_index_registry_lock = threading.Lock()
+
+
+def open_code_index(project_root: Path, retrieval_config: dict | None = None, ollama_base_url: str | None = None) -> CodeIndex | None:
+    """Opens (or creates) the index for a project and refreshes it; None when retrieval is disabled. Runs in the same
+    process (batch jobs) share one CodeIndex per project and config, so later runs only refresh what changed."""
+    cfg = dict(DEFAULT_RETRIEVAL_CONFIG)
+    if retrieval_config:
+        cfg.update({k: v for k, v in retrieval_config.items() if v is not None})
+    if not cfg["enabled"]:
+        return None
+    registry_key = json.dumps([str(Path(project_root).resolve()), cfg, ollama_base_url], sort_keys=True, default=str)
+    with _index_registry_lock:
+        index = _index_registry.get(registry_key)
+        if index is None:
+            index = CodeIndex(project_root, build_embedder(cfg, ollama_base_url), cfg)
+    try:
+        index.refresh()
+    except (OSError, ValueError, requests.exceptions.RequestException) as e:
+        print(f"ERROR: CodeIndex: Indexing {project_root} failed: {e}. Continuing without retrieval.")
+        return None
+    with _index_registry_lock:
+        _index_registry.setdefault(registry_key, index)
+    return index
+
+
+def format_code_hits(hits: list[dict], max_chars: int | None = None) -> str:
+    """Hits as '--- path:start-end (symbol) ---' headed blocks, each cut to max_chars."""
+    blocks = []
+    for hit in hits:
+        text = hit["text"] if not max_chars or len(hit["text"]) <= max_chars else hit["text"][:max_chars] + "\n..."
+        symbol = f" ({hit['symbol']})" if hit.get("symbol") else ""
+        blocks.append(f"--- {hit['path']}:{hit['start_line']}-{hit['end_line']}{symbol} ---\n{text}")
+    return "\n".join(blocks)
@@ -1,41 +1,329 @@
 # connectors.py
 import requests
+from requests.adapters import HTTPAdapter
+import aiohttp
+import asyncio
 import json
 import os
+import threading
+import time
+from typing import Callable, Iterator
+from resilience import CircuitOpenError, get_provider_resilience
+
+# Defaults for the per-connector HTTP connection pool. Every key can be overridden
+# from config_agent.yaml (openrouter.http.* / ollama.http.*).
+DEFAULT_HTTP_POOL_CONFIG = {
+    "pool_connections": 4,   # Number of distinct host pools kept by the session
+    "pool_maxsize": 10,      # Max idle keep-alive connections kept per host
+    "pool_block": False,     # If True, never open more than pool_maxsize connections per host (callers wait instead)
+    "keep_alive": True,      # If False, send 'Connection: close' so every call gets a fresh connection
+    "connect_timeout": 10,   # Seconds to establish the TCP/TLS connection
+    "read_timeout": 180,     # Seconds to wait for response bytes
+}
+
+# Provider-side prompt caching (config_agent.yaml: prompt_cache.*). Prompts keep a byte-stable prefix (system prompt,
+# goal, sub-task, tool list) so the provider can skip prefill for it: Ollama reuses the KV cache of the previous
+# request to a loaded model for the longest matching prefix, OpenRouter providers cache marked prefixes.
+DEFAULT_PROMPT_CACHE_CONFIG = {
+    "keep_alive": "30m",  # Ollama: how long the model (and its KV cache) stays loaded after a request; None = server default
+    "cache_control_models": ["anthropic/", "google/gemini"], # OpenRouter model prefixes that need explicit cache_control breakpoints
+}
+
+
+def build_http_session(pool_config: dict | None = None) -> tuple[requests.Session, tuple[float, float]]:
+    """Creates a requests.Session with a mounted, sized connection pool. Returns (session, (connect, read) timeout)."""
+    cfg = dict(DEFAULT_HTTP_POOL_CONFIG)
+    if pool_config:
+        cfg.update({k: v for k, v in pool_config.items() if v is not None})
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=int(cfg["pool_connections"]),
+        pool_maxsize=int(cfg["pool_maxsize"]),
+        pool_block=bool(cfg["pool_block"]),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not cfg["keep_alive"]:
+        session.headers["Connection"] = "close"
+    return session, (float(cfg["connect_timeout"]), float(cfg["read_timeout"]))
+
+
+def build_chat_messages(prompt: str, system_message: str = None, stable_prefix_chars: int | None = None,
+                        cache_control: bool = False) -> list[dict]:
+    """cache_control: mark the system message and the first stable_prefix_chars of the prompt as cacheable
+    (Anthropic-style content parts). Without it the messages are plain strings."""
+    messages = []
+    if not cache_control:
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    ephemeral = {"type": "ephemeral"}
+    if system_message:
+        messages.append({"role": "system", "content": [{"type": "text", "text": system_message, "cache_control": ephemeral}]})
+    if stable_prefix_chars and 0 < stable_prefix_chars < len(prompt):
+        user_parts = [{"type": "text", "text": prompt[:stable_prefix_chars], "cache_control": ephemeral},
+                      {"type": "text", "text": prompt[stable_prefix_chars:]}]
+    else:
+        user_parts = [{"type": "text", "text": prompt}]
+    messages.append({"role": "user", "content": user_parts})
+    return messages
+
+
+def build_openrouter_headers(api_key: str, site_url: str = None, app_name: str = None) -> dict:
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    if site_url:
+        headers["HTTP-Referer"] = site_url
+    if app_name:
+        headers["X-Title"] = app_name
+    return headers
+
+
+def build_openrouter_payload(prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5, stream=False,
+                             response_format: dict | str | None = None, stable_prefix_chars: int | None = None,
+                             cache_control: bool = False) -> dict:
+    """response_format: "json" for any JSON object, or {"name": ..., "schema": {...}} for a JSON schema.
+    cache_control / stable_prefix_chars: prompt caching breakpoints, see build_chat_messages."""
+    payload = {
+        "model": model, # e.g., "mistralai/mistral-7b-instruct-v0.2"
+        "messages": build_chat_messages(prompt, system_message, stable_prefix_chars, cache_control),
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    if stream:
+        payload["stream"] = True
+    if response_format == "json":
+        payload["response_format"] = {"type": "json_object"}
+    elif response_format:
+        payload["response_format"] = {"type": "json_schema", "json_schema": {
+            "name": response_format.get("name", "response"), "strict": False, "schema": response_format["schema"]}}
+    return payload
+
+
+class StreamStats:
+    """Timing for one streamed completion: time-to-first-token and generation rate.
+    Providers that report token counts in their final frame fill completion_tokens; otherwise chunks are counted."""
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_chunk_at: float | None = None
+        self.finished_at: float | None = None
+        self.chunks = 0
+        self.chars = 0
+        self.completion_tokens: int | None = None
+        self.provider_metrics: dict = {} # Raw usage/timing fields from the provider's final frame
+        self.early_stopped = False
+
+    def record_chunk(self, chunk: str):
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+        self.chunks += 1
+        self.chars += len(chunk)
+
+    def finish(self):
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+
+    @property
+    def time_to_first_token(self) -> float | None:
+        return None if self.first_chunk_at is None else self.first_chunk_at - self.started_at
+
+    @property
+    def tokens_per_second(self) -> float | None:
+        if self.first_chunk_at is None:
+            return None
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        tokens = self.completion_tokens if self.completion_tokens is not None else self.chunks
+        elapsed = end - self.first_chunk_at
+        return tokens / elapsed if elapsed > 0 else None
+
+    def summary(self) -> str:
+        ttft = self.time_to_first_token
+        tps = self.tokens_per_second
+        return (f"TTFT {ttft * 1000:.0f} ms" if ttft is not None else "TTFT n/a") + \
+               (f", {tps:.1f} tokens/s" if tps is not None else "") + f", {self.chunks} chunks"
+
+
+class LLMUsage:
+    """Usage and latency of one LLM call. Connectors fill it in when passed to generate(); LLMTool records it."""
+    def __init__(self, provider: str = "", model: str = ""):
+        self.provider = provider
+        self.model = model
+        self.wall_time_s: float = 0.0
+        self.time_to_first_token_s: float | None = None
+        self.tokens_per_second: float | None = None
+        self.prompt_tokens: int | None = None
+        self.cached_prompt_tokens: int | None = None # OpenRouter: prompt tokens served from the provider's prompt cache
+        self.completion_tokens: int | None = None
+        self.load_time_s: float | None = None        # Ollama: model load time
+        self.prompt_eval_time_s: float | None = None # Ollama: prefill time
+        self.eval_time_s: float | None = None        # Ollama: generation time
+        self.streamed = False
+        self.early_stopped = False
+        self.cached = False
+        self.error: str | None = None
+        self.route = "primary"   # "primary", "fallback" or "hedge" (see llm_routing)
+        self.discarded = False   # A hedged/fallback sibling answered first; this response was not used
+
+    def apply_provider_metrics(self, metrics: dict):
+        """Accepts either OpenRouter's 'usage' block or Ollama's final-frame timing fields."""
+        if not isinstance(metrics, dict):
+            return
+        if "prompt_tokens" in metrics or "completion_tokens" in metrics: # OpenRouter / OpenAI shape
+            self.prompt_tokens = metrics.get("prompt_tokens", self.prompt_tokens)
+            self.completion_tokens = metrics.get("completion_tokens", self.completion_tokens)
+            details = metrics.get("prompt_tokens_details")
+            if isinstance(details, dict) and details.get("cached_tokens") is not None:
+                self.cached_prompt_tokens = details["cached_tokens"]
+            return
+        ns = 1e-9 # Ollama durations are nanoseconds
+        if metrics.get("prompt_eval_count") is not None: self.prompt_tokens = metrics["prompt_eval_count"]
+        if metrics.get("eval_count") is not None: self.completion_tokens = metrics["eval_count"]
+        if metrics.get("load_duration") is not None: self.load_time_s = metrics["load_duration"] * ns
+        if metrics.get("prompt_eval_duration") is not None: self.prompt_eval_time_s = metrics["prompt_eval_duration"] * ns
+        if metrics.get("eval_duration") is not None:
+            self.eval_time_s = metrics["eval_duration"] * ns
+            if self.completion_tokens and self.eval_time_s > 0:
+                self.tokens_per_second = self.completion_tokens / self.eval_time_s
+
+    def apply_stream_stats(self, stats: StreamStats):
+        self.streamed = True
+        self.early_stopped = stats.early_stopped
+        self.time_to_first_token_s = stats.time_to_first_token
+        self.apply_provider_metrics(stats.provider_metrics)
+        if self.completion_tokens is None:
+            self.completion_tokens = stats.completion_tokens
+        if self.tokens_per_second is None:
+            self.tokens_per_second = stats.tokens_per_second
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def build_ollama_payload(prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5, stream=False,
+                         response_format: dict | str | None = None, keep_alive: str | int | None = None) -> dict:
+    """response_format: "json" or {"name": ..., "schema": {...}}; sent as Ollama's `format` (JSON mode / JSON schema).
+    keep_alive: how long Ollama keeps the model loaded afterwards (e.g. "30m"); its KV cache lives as long as the model."""
+    payload = {
+        "model": model,
+        "messages": build_chat_messages(prompt, system_message),
+        "stream": stream,
+        "options": {
+            "num_predict": max_tokens if max_tokens > 0 else -1, # -1 for until eos for some models
+            "temperature": temperature
+        }
+    }
+    if response_format:
+        payload["format"] = "json" if response_format == "json" else response_format["schema"]
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    return payload
+
+
+def _prompt_cache_settings(prompt_cache_config: dict | None) -> dict:
+    cfg = dict(DEFAULT_PROMPT_CACHE_CONFIG)
+    if prompt_cache_config:
+        cfg.update({k: v for k, v in prompt_cache_config.items() if v is not None})
+    cfg["cache_control_models"] = tuple(str(m) for m in (cfg["cache_control_models"] or []))
+    return cfg
+
+
+def wants_cache_control(model: str, prompt_cache: dict) -> bool:
+    """OpenAI/DeepSeek-style providers cache prefixes automatically; Anthropic and Gemini need explicit breakpoints."""
+    return model.startswith(prompt_cache["cache_control_models"]) if prompt_cache["cache_control_models"] else False
+
+
+def _collect_stream(stream_iter: Iterator[str], stop_when: Callable[[str], bool] | None, provider_label: str,
+                    stats: StreamStats | None = None) -> str:
+    chunks = []
+    try:
+        for chunk in stream_iter:
+            chunks.append(chunk)
+            if stop_when is not None and stop_when(chunk):
+                print(f"INFO: {provider_label} stream stopped early by caller after {len(chunks)} chunks.")
+                if stats is not None: stats.early_stopped = True
+                break
+    finally:
+        stream_iter.close()
+    return "".join(chunks)
+
 
 class OpenRouterConnector:
-    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1", site_url: str = None, app_name: str = "AICodeAgent"):
+    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1", site_url: str = None, app_name: str = "AICodeAgent",
+                 pool_config: dict | None = None, resilience_config: dict | None = None, prompt_cache_config: dict | None = None):
         if not api_key:
             raise ValueError("OpenRouter API key is required.")
         self.api_key = api_key
         self.base_url = base_url
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        if site_url:
-            self.headers["HTTP-Referer"] = site_url
-        if app_name:
-            self.headers["X-Title"] = app_name
+        self.headers = build_openrouter_headers(api_key, site_url, app_name)
+        self.session, self.timeout = build_http_session(pool_config)
+        self.prompt_cache = _prompt_cache_settings(prompt_cache_config)
+        self.resilience = get_provider_resilience(f"openrouter@{base_url}", resilience_config)
 
-    def generate(self, prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5) -> str:
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
-        
-        data = {
-            "model": model, # e.g., "mistralai/mistral-7b-instruct-v0.2"
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-        }
+    def close(self):
+        self.session.close()
+
+    def stream_generate(self, prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5,
+                        stats: StreamStats | None = None, response_format: dict | str | None = None,
+                        stable_prefix_chars: int | None = None) -> Iterator[str]:
+        """Yields content deltas from OpenRouter's server-sent events as they arrive. Closing the generator closes
+        the connection. Request errors are raised to the caller; an error frame raises requests.HTTPError."""
+        data = build_openrouter_payload(prompt, model, system_message, max_tokens, temperature, stream=True, response_format=response_format,
+                                        stable_prefix_chars=stable_prefix_chars, cache_control=wants_cache_control(model, self.prompt_cache))
+        with self.resilience.execute(lambda: self.session.post(f"{self.base_url}/chat/completions", headers=self.headers, json=data, timeout=self.timeout, stream=True)) as response:
+            response.raise_for_status()
+            for raw_line in response.iter_lines(chunk_size=None, decode_unicode=False):
+                if not raw_line or raw_line.startswith(b":"): # Blank separators and keep-alive comments (": OPENROUTER PROCESSING")
+                    continue
+                if not raw_line.startswith(b"data:"):
+                    continue
+                frame = raw_line[len(b"data:"):].strip()
+                if frame == b"[DONE]":
+                    break
+                try:
+                    event = json.loads(frame)
+                except json.JSONDecodeError:
+                    print(f"WARNING: OpenRouter stream - could not decode SSE frame: {frame[:200]}")
+                    continue
+                if "error" in event:
+                    raise requests.exceptions.HTTPError(f"Stream error frame: {event['error']}", response=response)
+                if stats is not None and isinstance(event.get("usage"), dict):
+                    stats.provider_metrics = event["usage"]
+                    stats.completion_tokens = event["usage"].get("completion_tokens")
+                for choice in event.get("choices") or []:
+                    chunk = (choice.get("delta") or {}).get("content") or ""
+                    if chunk:
+                        if stats is not None: stats.record_chunk(chunk)
+                        yield chunk
+        if stats is not None: stats.finish()
+
+    def generate(self, prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5, stream=False,
+                 stop_when: Callable[[str], bool] | None = None, usage: LLMUsage | None = None,
+                 response_format: dict | str | None = None, stable_prefix_chars: int | None = None) -> str:
+        """stream=True uses SSE; stop_when (streaming only) is called with every new chunk and returning True ends the stream.
+        If usage is given it is filled with timing and token counts for this call.
+        stable_prefix_chars: length of the prompt prefix that stays identical across calls (prompt-cache breakpoint)."""
+        started_at = time.perf_counter()
         try:
             print(f"INFO: Querying OpenRouter model: {model}...")
-            response = requests.post(f"{self.base_url}/chat/completions", headers=self.headers, json=data, timeout=180)
+            if stream or stop_when is not None:
+                stats = StreamStats()
+                content = _collect_stream(self.stream_generate(prompt, model, system_message, max_tokens, temperature, stats=stats, response_format=response_format,
+                                                               stable_prefix_chars=stable_prefix_chars), stop_when, "OpenRouter", stats)
+                stats.finish()
+                if usage is not None: usage.apply_stream_stats(stats)
+                print(f"INFO: OpenRouter response received ({stats.summary()}).")
+                return content
+            data = build_openrouter_payload(prompt, model, system_message, max_tokens, temperature, response_format=response_format,
+                                            stable_prefix_chars=stable_prefix_chars, cache_control=wants_cache_control(model, self.prompt_cache))
+            response = self.resilience.execute(lambda: self.session.post(f"{self.base_url}/chat/completions", headers=self.headers, json=data, timeout=self.timeout))
             response.raise_for_status()
             response_json = response.json()
             content = response_json.get("choices", [{}])[0].get("message", {}).get("content", "")
+            if usage is not None: usage.apply_provider_metrics(response_json.get("usage"))
             print(f"INFO: OpenRouter response received.")
             return content
         except requests.exceptions.RequestException as e:
@@ -43,56 +331,287 @@ class OpenRouterConnector:
             if hasattr(e, 'response') and e.response is not None:
                 err_msg += f" - Status: {e.response.status_code} - Body: {e.response.text[:500]}"
             print(err_msg)
+            if usage is not None: usage.error = str(e)
             return f"Error: OpenRouter request failed. {e}"
         except (KeyError, IndexError) as e:
             print(f"ERROR: Could not parse OpenRouter response: {e} - Response: {response_json if 'response_json' in locals() else 'No JSON response'}")
+            if usage is not None: usage.error = f"Invalid response: {e}"
             return "Error: Invalid response from OpenRouter."
+        finally:
+            if usage is not None: usage.wall_time_s = time.perf_counter() - started_at
 
 
 class OllamaConnector:
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(self, base_url: str = "http://localhost:11434", pool_config: dict | None = None, resilience_config: dict | None = None,
+                 prompt_cache_config: dict | None = None):
         self.base_url = base_url.rstrip('/')
+        # Local models can take a long time to load and generate, so the default read timeout is longer.
+        self.session, self.timeout = build_http_session({"read_timeout": 300, **(pool_config or {})})
+        self.prompt_cache = _prompt_cache_settings(prompt_cache_config)
+        self.resilience = get_provider_resilience(f"ollama@{self.base_url}", resilience_config)
 
-    def generate(self, prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5, stream=False) -> str:
+    def close(self):
+        self.session.close()
+
+    def stream_generate(self, prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5,
+                        stats: StreamStats | None = None, response_format: dict | str | None = None,
+                        stable_prefix_chars: int | None = None) -> Iterator[str]:
+        """Yields content chunks as Ollama streams them. Closing the generator (or breaking out of the loop)
+        drops the HTTP connection, which makes Ollama stop generating. Request errors are raised to the caller.
+        stable_prefix_chars is accepted for symmetry: Ollama reuses any matching prefix without a hint."""
         api_url = f"{self.base_url}/api/chat"
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": prompt})
+        payload = build_ollama_payload(prompt, model, system_message, max_tokens, temperature, stream=True, response_format=response_format,
+                                       keep_alive=self.prompt_cache["keep_alive"])
+        with self.resilience.execute(lambda: self.session.post(api_url, json=payload, timeout=self.timeout, stream=True)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"WARNING: Ollama stream - could not decode JSON line: {line}")
+                    continue
+                chunk = data.get("message", {}).get("content", "")
+                if chunk:
+                    if stats is not None: stats.record_chunk(chunk)
+                    yield chunk
+                if data.get("done"):
+                    if stats is not None:
+                        stats.provider_metrics = {k: v for k, v in data.items() if k != "message"}
+                        stats.completion_tokens = data.get("eval_count")
+                    break
+        if stats is not None: stats.finish()
 
-        payload = {
-            "model": model,
-            "messages": messages,
-            "stream": stream,
-            "options": {
-                "num_predict": max_tokens if max_tokens > 0 else -1, # -1 for until eos for some models
-                "temperature": temperature
-            }
-        }
+    def generate(self, prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5, stream=False,
+                 stop_when: Callable[[str], bool] | None = None, usage: LLMUsage | None = None,
+                 response_format: dict | str | None = None, stable_prefix_chars: int | None = None) -> str:
+        """stop_when (streaming only) is called with every new chunk; returning True closes the stream early.
+        If usage is given it is filled with timing and token counts for this call."""
+        api_url = f"{self.base_url}/api/chat"
+        started_at = time.perf_counter()
         try:
             print(f"INFO: Querying Ollama model: {model} at {self.base_url}...")
-            response = requests.post(api_url, json=payload, timeout=300) # Longer timeout for local
-            response.raise_for_status()
-            
-            full_response_content = ""
-            if stream:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            full_response_content += data.get("message", {}).get("content", "")
-                            if data.get("done"):
-                                break
-                        except json.JSONDecodeError:
-                            print(f"WARNING: Ollama stream - could not decode JSON line: {line}")
+            if stream or stop_when is not None:
+                stats = StreamStats()
+                full_response_content = _collect_stream(self.stream_generate(prompt, model, system_message, max_tokens, temperature, stats=stats, response_format=response_format), stop_when, "Ollama", stats)
+                stats.finish()
+                if usage is not None: usage.apply_stream_stats(stats)
+                print(f"INFO: Ollama stream finished ({stats.summary()}).")
             else:
-                full_response_content = response.json().get("message", {}).get("content", "")
+                payload = build_ollama_payload(prompt, model, system_message, max_tokens, temperature, stream=False, response_format=response_format,
+                                               keep_alive=self.prompt_cache["keep_alive"])
+                response = self.resilience.execute(lambda: self.session.post(api_url, json=payload, timeout=self.timeout))
+                response.raise_for_status()
+                response_json = response.json()
+                full_response_content = response_json.get("message", {}).get("content", "")
+                if usage is not None: usage.apply_provider_metrics(response_json)
             
             print(f"INFO: Ollama response received.")
             return full_response_content
         except requests.exceptions.RequestException as e:
             print(f"ERROR: Ollama API request failed: {e}. Is Ollama running at {self.base_url} and model '{model}' pulled/available?")
+            if usage is not None: usage.error = str(e)
             return f"Error: Ollama request failed. {e}"
         except (KeyError, IndexError) as e:
             print(f"ERROR: Could not parse Ollama response: {e}")
-            return "Error: Invalid response from Ollama."
\ No newline at end of file
+            if usage is not None: usage.error = f"Invalid response: {e}"
+            return "Error: Invalid response from Ollama."
+        finally:
+            if usage is not None: usage.wall_time_s = time.perf_counter() - started_at
+
+
+# --- Asyncio connectors (aiohttp) ---
+# Same request/response shapes and "Error: ..." string convention as the synchronous connectors,
+# but many calls can be in flight from a single thread. An aiohttp session is bound to the event
+# loop it was created in, so each connector lazily (re)creates its session for the running loop.
+
+ASYNC_RETRYABLE_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+class _AsyncSessionMixin:
+    def _init_async_session(self, pool_config: dict | None, default_read_timeout: float):
+        cfg = dict(DEFAULT_HTTP_POOL_CONFIG)
+        cfg["read_timeout"] = default_read_timeout
+        if pool_config:
+            cfg.update({k: v for k, v in pool_config.items() if v is not None})
+        self.pool_config = cfg
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            cfg = self.pool_config
+            connector = aiohttp.TCPConnector(
+                limit=0 if not cfg["pool_block"] else int(cfg["pool_maxsize"]) * int(cfg["pool_connections"]),
+                limit_per_host=int(cfg["pool_maxsize"]) if cfg["pool_block"] else 0,
+                force_close=not cfg["keep_alive"],
+            )
+            timeout = aiohttp.ClientTimeout(sock_connect=float(cfg["connect_timeout"]), sock_read=float(cfg["read_timeout"]))
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+
+class AsyncOpenRouterConnector(_AsyncSessionMixin):
+    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1", site_url: str = None, app_name: str = "AICodeAgent",
+                 pool_config: dict | None = None, resilience_config: dict | None = None, prompt_cache_config: dict | None = None):
+        if not api_key:
+            raise ValueError("OpenRouter API key is required.")
+        self.api_key = api_key
+        self.base_url = base_url
+        self.headers = build_openrouter_headers(api_key, site_url, app_name)
+        self._init_async_session(pool_config, default_read_timeout=180)
+        self.prompt_cache = _prompt_cache_settings(prompt_cache_config)
+        self.resilience = get_provider_resilience(f"openrouter@{base_url}", resilience_config)
+
+    async def generate(self, prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5,
+                       usage: LLMUsage | None = None, response_format: dict | str | None = None,
+                       stable_prefix_chars: int | None = None) -> str:
+        data = build_openrouter_payload(prompt, model, system_message, max_tokens, temperature, response_format=response_format,
+                                        stable_prefix_chars=stable_prefix_chars, cache_control=wants_cache_control(model, self.prompt_cache))
+        response_json = None
+        started_at = time.perf_counter()
+        try:
+            print(f"INFO: Querying OpenRouter model (async): {model}...")
+            response = await self.resilience.execute_async(
+                lambda: self._get_session().post(f"{self.base_url}/chat/completions", headers=self.headers, json=data),
+                retry_on=ASYNC_RETRYABLE_ERRORS)
+            async with response:
+                if response.status >= 400:
+                    body = await response.text()
+                    print(f"ERROR: OpenRouter API request failed: HTTP {response.status} - Body: {body[:500]}")
+                    if usage is not None: usage.error = f"HTTP {response.status}"
+                    return f"Error: OpenRouter request failed. HTTP {response.status}"
+                response_json = await response.json(content_type=None)
+            content = response_json.get("choices", [{}])[0].get("message", {}).get("content", "")
+            if usage is not None: usage.apply_provider_metrics(response_json.get("usage"))
+            print(f"INFO: OpenRouter response received.")
+            return content
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            print(f"ERROR: OpenRouter API request failed: {e!r}")
+            if usage is not None: usage.error = repr(e)
+            return f"Error: OpenRouter request failed. {e!r}"
+        except (KeyError, IndexError, json.JSONDecodeError) as e:
+            print(f"ERROR: Could not parse OpenRouter response: {e} - Response: {response_json if response_json is not None else 'No JSON response'}")
+            if usage is not None: usage.error = f"Invalid response: {e}"
+            return "Error: Invalid response from OpenRouter."
+        finally:
+            if usage is not None: usage.wall_time_s = time.perf_counter() - started_at
+
+
+class AsyncOllamaConnector(_AsyncSessionMixin):
+    def __init__(self, base_url: str = "http://localhost:11434", pool_config: dict | None = None, resilience_config: dict | None = None,
+                 prompt_cache_config: dict | None = None):
+        self.base_url = base_url.rstrip('/')
+        self._init_async_session(pool_config, default_read_timeout=300)
+        self.prompt_cache = _prompt_cache_settings(prompt_cache_config)
+        self.resilience = get_provider_resilience(f"ollama@{self.base_url}", resilience_config)
+
+    async def generate(self, prompt: str, model: str, system_message: str = None, max_tokens=2048, temperature=0.5, stream=False,
+                       usage: LLMUsage | None = None, response_format: dict | str | None = None,
+                       stable_prefix_chars: int | None = None) -> str:
+        api_url = f"{self.base_url}/api/chat"
+        payload = build_ollama_payload(prompt, model, system_message, max_tokens, temperature, stream, response_format=response_format,
+                                       keep_alive=self.prompt_cache["keep_alive"])
+        started_at = time.perf_counter()
+        try:
+            print(f"INFO: Querying Ollama model (async): {model} at {self.base_url}...")
+            response = await self.resilience.execute_async(
+                lambda: self._get_session().post(api_url, json=payload), retry_on=ASYNC_RETRYABLE_ERRORS)
+            async with response:
+                if response.status >= 400:
+                    body = await response.text()
+                    print(f"ERROR: Ollama API request failed: HTTP {response.status} - Body: {body[:500]}")
+                    if usage is not None: usage.error = f"HTTP {response.status}"
+                    return f"Error: Ollama request failed. HTTP {response.status}"
+                if stream:
+                    stats = StreamStats()
+                    chunks = []
+                    async for line in response.content:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            data = json.loads(line)
+                        except json.JSONDecodeError:
+                            print(f"WARNING: Ollama stream - could not decode JSON line: {line}")
+                            continue
+                        chunk = data.get("message", {}).get("content", "")
+                        if chunk:
+                            stats.record_chunk(chunk)
+                            chunks.append(chunk)
+                        if data.get("done"):
+                            stats.provider_metrics = {k: v for k, v in data.items() if k != "message"}
+                            break
+                    stats.finish()
+                    if usage is not None: usage.apply_stream_stats(stats)
+                    content = "".join(chunks)
+                else:
+                    response_json = await response.json(content_type=None)
+                    content = response_json.get("message", {}).get("content", "")
+                    if usage is not None: usage.apply_provider_metrics(response_json)
+            print(f"INFO: Ollama response received.")
+            return content
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            print(f"ERROR: Ollama API request failed: {e!r}. Is Ollama running at {self.base_url} and model '{model}' pulled/available?")
+            if usage is not None: usage.error = repr(e)
+            return f"Error: Ollama request failed. {e!r}"
+        except (KeyError, IndexError, json.JSONDecodeError) as e:
+            print(f"ERROR: Could not parse Ollama response: {e}")
+            if usage is not None: usage.error = f"Invalid response: {e}"
+            return "Error: Invalid response from Ollama."
+        finally:
+            if usage is not None: usage.wall_time_s = time.perf_counter() - started_at
+
+
+# --- Process-wide connector registry ---
+# Connectors (and therefore their keep-alive pools) are shared by every LLMTool in the process,
+# so consecutive agent runs in the same interpreter reuse warm connections.
+_connector_registry: dict[tuple, OpenRouterConnector | OllamaConnector] = {}
+_connector_registry_lock = threading.Lock()
+
+
+def _pool_key(pool_config: dict | None) -> tuple:
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in (pool_config or {}).items()))
+
+
+def get_openrouter_connector(api_key: str, base_url: str = "https://openrouter.ai/api/v1", site_url: str = None,
+                             app_name: str = "AICodeAgent", pool_config: dict | None = None,
+                             resilience_config: dict | None = None, prompt_cache_config: dict | None = None) -> OpenRouterConnector:
+    key = ("openrouter", api_key, base_url, site_url, app_name, _pool_key(pool_config), _pool_key(resilience_config),
+           _pool_key(prompt_cache_config))
+    with _connector_registry_lock:
+        connector = _connector_registry.get(key)
+        if connector is None:
+            connector = OpenRouterConnector(api_key=api_key, base_url=base_url, site_url=site_url, app_name=app_name,
+                                            pool_config=pool_config, resilience_config=resilience_config,
+                                            prompt_cache_config=prompt_cache_config)
+            _connector_registry[key] = connector
+        return connector
+
+
+def get_ollama_connector(base_url: str = "http://localhost:11434", pool_config: dict | None = None,
+                         resilience_config: dict | None = None, prompt_cache_config: dict | None = None) -> OllamaConnector:
+    key = ("ollama", base_url.rstrip('/'), _pool_key(pool_config), _pool_key(resilience_config), _pool_key(prompt_cache_config))
+    with _connector_registry_lock:
+        connector = _connector_registry.get(key)
+        if connector is None:
+            connector = OllamaConnector(base_url=base_url, pool_config=pool_config, resilience_config=resilience_config,
+                                        prompt_cache_config=prompt_cache_config)
+            _connector_registry[key] = connector
+        return connector
+
+
+def close_all_connectors():
+    with _connector_registry_lock:
+        for connector in _connector_registry.values():
+            connector.close()
+        _connector_registry.clear()
@@ -0,0 +1,243 @@
+# file_cache.py
+# Bounded, validated cache of project file contents shared by the planner and the tools.
+# Keys are canonical resolved paths, so "./a.py", "a.py" and "/abs/project/a.py" are one entry. Every lookup stats the
+# file: an unchanged (size, mtime) is trusted, a changed one is settled by comparing a SHA-1 of the bytes, so a touch
+# does not force a re-decode and an edit behind our back is never served stale. Contents are loaded on first use,
+# large files through mmap (hashed and decoded straight from the mapping, with no intermediate bytes copy), and the
+# total is capped in bytes with LRU eviction.
+import hashlib
+import mmap
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_FILE_CACHE_CONFIG = {
+    "max_bytes": 64 * 1024 * 1024,          # Total size of cached file contents (bytes on disk)
+    "mmap_threshold_bytes": 1024 * 1024,    # Files at least this large are read through mmap
+}
+
+# A file modified this soon after we looked at it may change again within the same mtime tick, so its stat is not
+# trusted on its own until the window has passed
+_RACY_WINDOW_NS = 1_000_000_000
+
+
+class _Entry:
+    __slots__ = ("text", "size", "mtime_ns", "sha1", "checked_ns", "order", "pinned")
+
+    def __init__(self, text: str | None, size: int, mtime_ns: int | None, sha1: str | None, order: int, pinned: bool = False):
+        self.text = text            # None: the file could not be read
+        self.size = size
+        self.mtime_ns = mtime_ns    # None: the entry is not backed by a file on disk
+        self.sha1 = sha1
+        self.checked_ns = time.time_ns()
+        self.order = order          # First-insertion order, kept stable for prompt summaries
+        self.pinned = pinned        # In-memory content that cannot be reloaded from disk is never evicted
+
+
+def _decode(buffer) -> str:
+    text = str(buffer, "utf-8")
+    if "\r" in text: # Same newline handling as Path.read_text
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+class FileCache:
+    def __init__(self, base_path: Path | None, config: dict | None = None):
+        cfg = dict(DEFAULT_FILE_CACHE_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.base_path = Path(base_path).resolve() if base_path else Path(".").resolve()
+        self.max_bytes = int(cfg["max_bytes"])
+        self.mmap_threshold = int(cfg["mmap_threshold_bytes"])
+        self._entries: "OrderedDict[Path, _Entry]" = OrderedDict() # LRU order, most recently used last
+        self._bytes = 0
+        self._next_order = 0
+        self._resolved: dict[str, Path] = {} # Path spelling -> canonical path (resolve() costs several syscalls)
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "invalidated": 0, "evictions": 0, "loads": 0,
+                      "mmap_loads": 0, "bytes_loaded": 0, "bytes_served": 0}
+
+    def resolve(self, path_str: str | Path) -> Path:
+        key = str(path_str)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            path = Path(path_str)
+            resolved = path.resolve() if path.is_absolute() else (self.base_path / path).resolve()
+            self._resolved[key] = resolved
+        return resolved
+
+    def display_path(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.base_path).as_posix()
+        except ValueError:
+            return str(path)
+
+    def get(self, path_str: str | Path) -> str | None:
+        """The current text of the file (loaded or re-validated as needed), or None if it does not exist or cannot be read."""
+        path = self.resolve(path_str)
+        with self._lock:
+            entry = self._entries.get(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if entry is not None:
+                if self._is_fresh(path, entry, st):
+                    self._entries.move_to_end(path)
+                    self.stats["hits"] += 1
+                    if entry.text is not None:
+                        self.stats["bytes_served"] += entry.size
+                    return entry.text
+                self.stats["invalidated"] += 1
+            self.stats["misses"] += 1
+            if st is None or not stat.S_ISREG(st.st_mode):
+                self._store(path, None, 0, None, None)
+                return None
+            return self._load(path, st)
+
+    def put(self, path_str: str | Path, content: str | None):
+        """Records content known to be the file's current text (e.g. just written), or None for a failed read."""
+        path = self.resolve(path_str)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.text is content: # The read path already stored this very string
+                self._entries.move_to_end(path)
+                return
+            if content is None:
+                self._store(path, None, 0, None, None)
+                return
+            data = content.encode("utf-8")
+            try:
+                st = path.stat()
+                mtime_ns = st.st_mtime_ns if st.st_size == len(data) else None
+            except OSError:
+                mtime_ns = None
+            # Content with no matching file on disk (a dry run, or a write with different newlines) is kept in memory
+            self._store(path, content, len(data), mtime_ns, hashlib.sha1(data).hexdigest(), pinned=mtime_ns is None)
+
+    def invalidate(self, path_str: str | Path):
+        with self._lock:
+            entry = self._entries.pop(self.resolve(path_str), None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def __contains__(self, path_str) -> bool:
+        return self.resolve(path_str) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def items(self) -> list[tuple[str, str | None]]:
+        """(project-relative path, text or None) for every cached entry in first-read order, without touching the disk."""
+        with self._lock:
+            ordered = sorted(self._entries.items(), key=lambda kv: kv[1].order)
+        return [(self.display_path(path), entry.text) for path, entry in ordered]
+
+    def fingerprints(self) -> dict[str, list]:
+        """{project-relative path: [size, mtime_ns, sha1]} for every cached entry backed by a file on disk."""
+        with self._lock:
+            return {self.display_path(path): [entry.size, entry.mtime_ns, entry.sha1]
+                    for path, entry in self._entries.items() if entry.mtime_ns is not None}
+
+    def changed_since(self, fingerprints: dict[str, list]) -> list[str]:
+        """Paths (as given) whose file no longer matches a fingerprint from fingerprints(): missing or different content."""
+        changed = []
+        for path_str, (size, mtime_ns, sha1) in fingerprints.items():
+            path = self.resolve(path_str)
+            try:
+                st = os.stat(path)
+                same = st.st_size == size and (st.st_mtime_ns == mtime_ns or self._hash_file(path, st.st_size) == sha1)
+            except OSError:
+                same = False
+            if not same:
+                changed.append(path_str)
+        return changed
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes,
+                        hit_rate=self.stats["hits"] / lookups if lookups else 0.0)
+
+    def _is_fresh(self, path: Path, entry: _Entry, st) -> bool:
+        if entry.mtime_ns is None:
+            # Failed read: fresh while the file is still missing. In-memory content: fresh until a file appears
+            return st is None or (entry.text is not None and self._same_content(path, entry, st))
+        if st is None:
+            return False
+        if st.st_size == entry.size and st.st_mtime_ns == entry.mtime_ns and entry.mtime_ns < entry.checked_ns - _RACY_WINDOW_NS:
+            return True
+        return self._same_content(path, entry, st)
+
+    def _same_content(self, path: Path, entry: _Entry, st) -> bool:
+        if st.st_size != entry.size:
+            return False
+        try:
+            sha1 = self._hash_file(path, st.st_size)
+        except OSError:
+            return False
+        if sha1 != entry.sha1:
+            return False
+        entry.mtime_ns, entry.checked_ns, entry.pinned = st.st_mtime_ns, time.time_ns(), False
+        self.stats["revalidated"] += 1
+        return True
+
+    def _hash_file(self, path: Path, size: int) -> str:
+        with open(path, "rb") as f:
+            if size >= self.mmap_threshold and size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return hashlib.sha1(mapped).hexdigest()
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def _load(self, path: Path, st) -> str | None:
+        try:
+            with open(path, "rb") as f:
+                if st.st_size >= self.mmap_threshold and st.st_size > 0:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        sha1 = hashlib.sha1(mapped).hexdigest()
+                        with memoryview(mapped) as view: # Must be released before the mapping is closed
+                            text = _decode(view)
+                        size = len(mapped)
+                    self.stats["mmap_loads"] += 1
+                else:
+                    data = f.read()
+                    sha1, text, size = hashlib.sha1(data).hexdigest(), _decode(data), len(data)
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            print(f"ERROR: FileCache: Could not read file {path}: {e}")
+            self._store(path, None, 0, None, None)
+            return None
+        self.stats["loads"] += 1
+        self.stats["bytes_loaded"] += size
+        self.stats["bytes_served"] += size
+        self._store(path, text, size, mtime_ns, sha1)
+        return text
+
+    def _store(self, path: Path, text: str | None, size: int, mtime_ns: int | None, sha1: str | None, pinned: bool = False):
+        old = self._entries.pop(path, None)
+        if old is not None:
+            self._bytes -= old.size
+            order = old.order
+        else:
+            order, self._next_order = self._next_order, self._next_order + 1
+        if size > self.max_bytes and not pinned:
+            return # Served to the caller but too large to keep
+        self._entries[path] = _Entry(text, size, mtime_ns, sha1, order, pinned)
+        self._bytes += size
+        self._evict(keep=path)
+
+    def _evict(self, keep: Path):
+        if self._bytes <= self.max_bytes:
+            return
+        for path in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            entry = self._entries[path]
+            if path == keep or entry.pinned or entry.size == 0:
+                continue
+            del self._entries[path]
+            self._bytes -= entry.size
+            self.stats["evictions"] += 1
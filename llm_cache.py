@@ -0,0 +1,142 @@
+# llm_cache.py
+# Persistent, content-addressed cache of LLM responses.
+# Entries are keyed by a SHA-256 of (provider, model, system message, prompt, temperature, max_tokens) and stored in
+# SQLite (WAL mode), which gives safe concurrent access from several threads and agent processes. Size and age limits
+# are enforced with LRU eviction on last access time.
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_CONFIG = {
+    "enabled": True,
+    "path": ".ai_agent_cache/llm_responses.sqlite3",
+    "max_bytes": 100 * 1024 * 1024,   # Total size of cached responses
+    "max_age_days": 30.0,             # Entries older than this are treated as misses and purged
+    "max_temperature": 0.5,           # Calls sampled above this temperature are not cached (non-deterministic)
+}
+
+
+def make_cache_key(provider: str, model: str, system_message: str | None, prompt: str, temperature: float, max_tokens: int | None,
+                   response_format: dict | str | None = None) -> str:
+    key_parts = [provider, model, system_message or "", prompt, round(float(temperature), 4), max_tokens]
+    if response_format: # Only added when set, so keys for plain-text calls are unchanged
+        key_parts.append(response_format)
+    material = json.dumps(key_parts, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str | Path, max_bytes: int = DEFAULT_CACHE_CONFIG["max_bytes"],
+                 max_age_days: float = DEFAULT_CACHE_CONFIG["max_age_days"],
+                 max_temperature: float | None = DEFAULT_CACHE_CONFIG["max_temperature"]):
+        self.path = Path(path)
+        self.max_bytes = int(max_bytes)
+        self.max_age_seconds = float(max_age_days) * 86400 if max_age_days else None
+        self.max_temperature = max_temperature
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, provider TEXT, model TEXT, response TEXT NOT NULL,
+            size INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bytes_saved": 0}
+
+    def is_cacheable(self, temperature: float) -> bool:
+        return self.max_temperature is None or float(temperature) <= float(self.max_temperature)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, size, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            response, size, created_at = row
+            if self.max_age_seconds is not None and now - created_at > self.max_age_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.stats["misses"] += 1
+                self.stats["evictions"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+            self.stats["bytes_saved"] += size
+            return response
+
+    def put(self, key: str, response: str, provider: str = "", model: str = ""):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, provider, model, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, provider, model, response, size, now, now))
+                self.stats["stores"] += 1
+                self._evict_locked(now)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict_locked(self, now: float):
+        if self.max_age_seconds is not None:
+            cur = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_seconds,))
+            self.stats["evictions"] += max(cur.rowcount, 0)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Least recently used first until we are back under the byte limit
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = entries
+        stats["total_bytes"] = total
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache_registry: dict[str, ResponseCache] = {} # Keyed by path and limits
+_cache_registry_lock = threading.Lock()
+
+
+def get_response_cache(cache_config: dict | None) -> ResponseCache | None:
+    """Returns the process-wide ResponseCache for the configured path and limits, or None if caching is disabled. Runs with
+    other limits (a batch job's overrides, a reloaded daemon config) get their own instance on the same file."""
+    cfg = dict(DEFAULT_CACHE_CONFIG)
+    if cache_config:
+        cfg.update({k: v for k, v in cache_config.items() if v is not None})
+    if not cfg["enabled"]:
+        return None
+    registry_key = json.dumps([str(Path(cfg["path"]).resolve()), cfg["max_bytes"], cfg["max_age_days"], cfg["max_temperature"]],
+                              default=str)
+    with _cache_registry_lock:
+        cache = _cache_registry.get(registry_key)
+        if cache is None:
+            try:
+                cache = ResponseCache(cfg["path"], cfg["max_bytes"], cfg["max_age_days"], cfg["max_temperature"])
+            except (sqlite3.Error, OSError) as e:
+                print(f"WARNING: LLM response cache disabled, could not open '{cfg['path']}': {e}")
+                return None
+            _cache_registry[registry_key] = cache
+        return cache
@@ -0,0 +1,433 @@
+# llm_emulator.py
+# Local stand-in for Ollama (/api/chat) and OpenRouter (/chat/completions) used for offline runs, benchmarks
+# and load tests. It speaks both request/response shapes (including Ollama NDJSON streaming and OpenRouter SSE),
+# answers from a script or from recorded responses, and can inject latency, a token rate, errors and a
+# concurrency limit. With prefix_cache_slots set it also models provider prompt caching / Ollama KV reuse: prefill
+# is only charged for the part of a prompt after the longest prefix shared with a recent prompt to the same model.
+#
+# Usage:
+#   python llm_emulator.py --port 11435 --script responses.json --first-token-ms 150 --tokens-per-second 40
+#   # then point the agent at it:
+#   #   ollama.base_url: "http://127.0.0.1:11435"
+#   #   openrouter.base_url: "http://127.0.0.1:11435/api/v1"
+#
+# Script file (JSON):
+#   {"default_response": "...",
+#    "sequence": ["first answer", "second answer"],                  # used in order (cycled) when no rule matches
+#    "rules": [{"match": "regex on last user message", "model": "optional exact model", "response": "..." or [...]}]}
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+DEFAULT_RESPONSE = ('Thought: The emulator has no scripted answer for this request, so finish the sub-task.\n'
+                    'Action: {"tool_name": "finish_sub_task", "result": {"status": "success", "message": "Emulator default response.", "directives": []}}')
+
+DEFAULT_EMULATOR_CONFIG = {
+    "load_ms": 0.0,               # Reported as Ollama load_duration and added once per model (first request)
+    "first_token_ms": 0.0,        # Latency before the first token (prefill)
+    "prefill_ms_per_1k_chars": 0.0, # Extra prefill latency proportional to prompt size
+    "latency_jitter_ms": 0.0,     # Uniform +/- jitter added to first_token_ms
+    "tokens_per_second": 0.0,     # Generation rate; 0 = emit everything at once
+    "error_rate": 0.0,            # Fraction of requests answered with an injected error
+    "error_status": 503,          # HTTP status used for injected errors
+    "rate_limit_rate": 0.0,       # Fraction of requests answered with 429 + Retry-After
+    "retry_after_s": 1.0,
+    "drop_rate": 0.0,             # Fraction of requests where the connection is closed without a response
+    "max_concurrency": 0,         # Max requests generating at once; 0 = unlimited
+    "max_queue": 0,               # Requests allowed to wait for a slot; beyond this the emulator answers 503 (0 = unbounded)
+    "prefix_cache_slots": 0,      # Recent prompts remembered per loaded model for prefix reuse (0 = no prompt caching)
+}
+
+TOKEN_RE = re.compile(r"\s*\S+\s*|\s+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Whitespace-delimited pseudo tokens; joining them returns the original text."""
+    return TOKEN_RE.findall(text) if text else []
+
+
+def message_text(content) -> str:
+    """Plain text of a message's content: a string, or a list of content parts ({"type": "text", "text": ...})."""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+def normalize_messages(messages: list[dict]) -> list[dict]:
+    """Content parts (e.g. with cache_control breakpoints) flattened to strings, so scripts and recordings match
+    the same request however it was marked up."""
+    return [dict(m, content=message_text(m.get("content"))) if isinstance(m.get("content"), list) else m for m in messages]
+
+
+def request_key(model: str, messages: list[dict]) -> str:
+    material = json.dumps([model, messages], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseScript:
+    def __init__(self, script: dict | None = None, recorded_path: str | None = None):
+        script = script or {}
+        self.default_response = script.get("default_response", DEFAULT_RESPONSE)
+        self.sequence = list(script.get("sequence", []))
+        self.rules = []
+        for rule in script.get("rules", []):
+            responses = rule["response"] if isinstance(rule["response"], list) else [rule["response"]]
+            self.rules.append({"pattern": re.compile(rule.get("match", ""), re.DOTALL), "model": rule.get("model"),
+                               "responses": responses, "next": 0})
+        self._sequence_next = 0
+        self._lock = threading.Lock()
+        self.recorded: dict[str, str] = {}
+        self.recorded_path = Path(recorded_path) if recorded_path else None
+        if self.recorded_path and self.recorded_path.exists():
+            for line in self.recorded_path.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recorded[entry["key"]] = entry["response"]
+
+    @classmethod
+    def from_file(cls, path: str | None, recorded_path: str | None = None) -> "ResponseScript":
+        script = json.loads(Path(path).read_text(encoding="utf-8")) if path else None
+        return cls(script, recorded_path)
+
+    def select(self, model: str, messages: list[dict]) -> str | None:
+        """Recorded response for this exact request, else the first matching rule, else the sequence, else the default."""
+        recorded = self.recorded.get(request_key(model, messages))
+        if recorded is not None:
+            return recorded
+        last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        with self._lock:
+            for rule in self.rules:
+                if rule["model"] and rule["model"] != model:
+                    continue
+                if rule["pattern"].search(last_user):
+                    response = rule["responses"][rule["next"] % len(rule["responses"])]
+                    rule["next"] += 1
+                    return response
+            if self.sequence:
+                response = self.sequence[self._sequence_next % len(self.sequence)]
+                self._sequence_next += 1
+                return response
+        return self.default_response
+
+    def record(self, model: str, messages: list[dict], response: str):
+        key = request_key(model, messages)
+        with self._lock:
+            self.recorded[key] = response
+            if self.recorded_path:
+                self.recorded_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.recorded_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "model": model, "response": response}, ensure_ascii=False) + "\n")
+
+
+class EmulatorState:
+    def __init__(self, config: dict | None = None, script: ResponseScript | None = None,
+                 record_upstream: str | None = None, record_api_key: str | None = None):
+        self.config = dict(DEFAULT_EMULATOR_CONFIG)
+        if config:
+            self.config.update({k: v for k, v in config.items() if v is not None})
+        self.script = script or ResponseScript()
+        self.record_upstream = record_upstream.rstrip("/") if record_upstream else None
+        self.record_api_key = record_api_key
+        max_concurrency = int(self.config["max_concurrency"])
+        self.slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self.loaded_models: set[str] = set()
+        self.prompt_prefixes: dict[str, list[str]] = {} # model -> recent prompts, most recent last
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.stats = {"requests": 0, "completed": 0, "injected_errors": 0, "rate_limited": 0, "dropped": 0,
+                      "rejected_queue_full": 0, "in_flight": 0, "max_in_flight": 0, "tokens_out": 0,
+                      "prompt_chars": 0, "prefix_cached_chars": 0, "upstream_requests": 0, "upstream_errors": 0}
+
+    def bump(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+            if key == "in_flight":
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def cached_prefix_chars(self, model: str, prompt_text: str) -> int:
+        """Length of the longest prefix prompt_text shares with a remembered prompt to this model; remembers it."""
+        slots = int(self.config["prefix_cache_slots"])
+        if slots <= 0:
+            return 0
+        with self.lock:
+            recent = self.prompt_prefixes.setdefault(model, [])
+            shared = max((len(os.path.commonprefix([prompt_text, p])) for p in recent), default=0)
+            recent.append(prompt_text)
+            del recent[:-slots]
+        return shared
+
+    def unload(self, model: str):
+        with self.lock:
+            self.loaded_models.discard(model)
+            self.prompt_prefixes.pop(model, None)
+
+    def upstream_response(self, provider: str, body: dict) -> str | None:
+        """Record mode: forward a non-streaming copy of the request to the real provider and return its content."""
+        if not self.record_upstream:
+            return None
+        forward = dict(body, stream=False)
+        if provider == "ollama":
+            r = requests.post(f"{self.record_upstream}/api/chat", json=forward, timeout=600)
+            r.raise_for_status()
+            return r.json().get("message", {}).get("content", "")
+        headers = {"Authorization": f"Bearer {self.record_api_key}"} if self.record_api_key else {}
+        r = requests.post(f"{self.record_upstream}/chat/completions", json=forward, headers=headers, timeout=600)
+        r.raise_for_status()
+        return r.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state: EmulatorState = None # Set on the per-server subclass
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, extra_headers: dict | None = None):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (extra_headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/emulator/stats":
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats))
+        elif self.path.rstrip("/") == "/api/tags":
+            self._send_json(200, {"models": [{"name": m} for m in sorted(self.state.loaded_models)]})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "Invalid JSON body"}); return
+        if path == "/api/chat":
+            provider = "ollama"
+        elif path.endswith("/chat/completions"):
+            provider = "openrouter"
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"}); return
+
+        state, cfg = self.state, self.state.config
+        state.bump("requests")
+        roll = random.random()
+        if roll < cfg["drop_rate"]:
+            state.bump("dropped")
+            self.close_connection = True
+            self.connection.close(); return
+        roll -= cfg["drop_rate"]
+        if roll < cfg["rate_limit_rate"]:
+            state.bump("rate_limited")
+            self._send_json(429, {"error": {"message": "Rate limited by emulator", "code": 429}}, {"Retry-After": str(cfg["retry_after_s"])}); return
+        roll -= cfg["rate_limit_rate"]
+        if roll < cfg["error_rate"]:
+            state.bump("injected_errors")
+            self._send_json(int(cfg["error_status"]), {"error": {"message": "Injected error", "code": int(cfg["error_status"])}}); return
+
+        if state.slots is not None:
+            with state.lock:
+                queue_full = cfg["max_queue"] and state.waiting >= int(cfg["max_queue"])
+                if not queue_full: state.waiting += 1
+            if queue_full:
+                state.bump("rejected_queue_full")
+                self._send_json(503, {"error": {"message": "Emulator queue full", "code": 503}}); return
+            state.slots.acquire()
+            with state.lock: state.waiting -= 1
+        state.bump("in_flight")
+        try:
+            self._generate(provider, body)
+            state.bump("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            pass # Client closed the stream early (e.g. early-stop hook)
+        finally:
+            state.bump("in_flight", -1)
+            if state.slots is not None: state.slots.release()
+
+    def _generate(self, provider: str, body: dict):
+        state, cfg = self.state, self.state.config
+        model = body.get("model", "emulator")
+        messages = normalize_messages(body.get("messages", []))
+        stream = bool(body.get("stream", provider == "ollama")) # Ollama streams unless told otherwise
+        if provider == "ollama":
+            max_tokens = int(body.get("options", {}).get("num_predict", -1))
+        else:
+            max_tokens = int(body.get("max_tokens") or -1)
+
+        content = None
+        if state.record_upstream and request_key(model, messages) not in state.script.recorded: # Known requests are replayed
+            try:
+                content = state.upstream_response(provider, body)
+            except (requests.RequestException, ValueError) as e: # ValueError: upstream answer is not JSON
+                state.bump("upstream_errors")
+                self._send_json(502, {"error": {"message": f"Upstream request failed: {e}", "code": 502}}); return
+            state.bump("upstream_requests")
+            state.script.record(model, messages, content)
+        if content is None:
+            content = state.script.select(model, messages)
+        tokens = tokenize(content)
+        if max_tokens > 0:
+            tokens = tokens[:max_tokens]
+        prompt_text = "\n".join(str(m.get("content", "")) for m in messages)
+        prompt_chars = len(prompt_text)
+        prompt_tokens = max(1, prompt_chars // 4)
+
+        start = time.perf_counter()
+        load_s = 0.0
+        with state.lock:
+            if model not in state.loaded_models:
+                state.loaded_models.add(model)
+                state.prompt_prefixes.pop(model, None) # A freshly loaded model has an empty KV cache
+                load_s = cfg["load_ms"] / 1000.0
+        cached_chars = state.cached_prefix_chars(model, prompt_text)
+        state.bump("prompt_chars", prompt_chars)
+        state.bump("prefix_cached_chars", cached_chars)
+        prefill_s = (cfg["first_token_ms"] + cfg["prefill_ms_per_1k_chars"] * (prompt_chars - cached_chars) / 1000.0
+                     + random.uniform(-1, 1) * cfg["latency_jitter_ms"]) / 1000.0
+        time.sleep(max(0.0, load_s + prefill_s))
+        prefill_done = time.perf_counter()
+        per_token_s = 1.0 / cfg["tokens_per_second"] if cfg["tokens_per_second"] > 0 else 0.0
+        state.bump("tokens_out", len(tokens))
+
+        cached_tokens = cached_chars // 4
+        if provider == "ollama" and body.get("keep_alive") in (0, "0", "0s"):
+            state.unload(model) # keep_alive 0: unload (and drop the KV cache) once this request is answered
+
+        if not stream:
+            time.sleep(per_token_s * len(tokens))
+            self._send_json(200, self._final_body(provider, model, "".join(tokens), prompt_tokens, len(tokens), start, load_s, prefill_done,
+                                                  cached_tokens))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if provider == "ollama" else "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if provider == "openrouter":
+            self._write_chunk(b": OPENROUTER PROCESSING\n\n")
+        for token in tokens:
+            if per_token_s: time.sleep(per_token_s)
+            if provider == "ollama":
+                frame = {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+                self._write_chunk((json.dumps(frame) + "\n").encode("utf-8"))
+            else:
+                frame = {"model": model, "choices": [{"index": 0, "delta": {"content": token}}]}
+                self._write_chunk(f"data: {json.dumps(frame)}\n\n".encode("utf-8"))
+        final = self._final_body(provider, model, "", prompt_tokens, len(tokens), start, load_s, prefill_done, cached_tokens)
+        if provider == "ollama":
+            self._write_chunk((json.dumps(final) + "\n").encode("utf-8"))
+        else:
+            final["choices"] = [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            self._write_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _final_body(provider: str, model: str, content: str, prompt_tokens: int, completion_tokens: int,
+                    start: float, load_s: float, prefill_done: float, cached_tokens: int = 0) -> dict:
+        end = time.perf_counter()
+        if provider == "ollama":
+            # Like llama.cpp, only the tokens after the reused KV-cache prefix count as evaluated
+            return {"model": model, "message": {"role": "assistant", "content": content}, "done": True, "done_reason": "stop",
+                    "total_duration": int((end - start) * 1e9), "load_duration": int(load_s * 1e9),
+                    "prompt_eval_count": max(1, prompt_tokens - cached_tokens), "prompt_eval_duration": int(max(0.0, prefill_done - start - load_s) * 1e9),
+                    "eval_count": completion_tokens, "eval_duration": int((end - prefill_done) * 1e9)}
+        return {"id": f"gen-emulator-{int(start * 1e6)}", "model": model, "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens,
+                          "prompt_tokens_details": {"cached_tokens": cached_tokens}}}
+
+
+class EmulatorServer:
+    """Runs the emulator on a background thread. Use as a context manager or call start()/stop()."""
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: dict | None = None, script: ResponseScript | None = None,
+                 record_upstream: str | None = None, record_api_key: str | None = None):
+        self.state = EmulatorState(config, script, record_upstream, record_api_key)
+        handler = type("BoundEmulatorHandler", (EmulatorHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def ollama_base_url(self) -> str:
+        return self.base_url
+
+    @property
+    def openrouter_base_url(self) -> str:
+        return f"{self.base_url}/api/v1"
+
+    def start(self) -> "EmulatorServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> dict:
+        with self.state.lock:
+            return dict(self.state.stats)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Ollama/OpenRouter emulator for offline runs and load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--script", help="JSON script with default_response / sequence / rules.", default=None)
+    parser.add_argument("--recorded", help="JSONL file of recorded responses to replay (and append to in record mode).", default=None)
+    parser.add_argument("--record-upstream", help="Forward unknown requests to this real provider base URL and record the answers.", default=None)
+    parser.add_argument("--record-api-key", help="API key sent to the upstream provider in record mode.", default=None)
+    for key, default in DEFAULT_EMULATOR_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in DEFAULT_EMULATOR_CONFIG}
+    server = EmulatorServer(args.host, args.port, config, ResponseScript.from_file(args.script, args.recorded),
+                            args.record_upstream, args.record_api_key)
+    print(f"INFO: LLM emulator listening on {server.base_url}")
+    print(f"INFO:   Ollama base_url:     {server.ollama_base_url}")
+    print(f"INFO:   OpenRouter base_url: {server.openrouter_base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nINFO: Emulator stopped.")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
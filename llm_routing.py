@@ -0,0 +1,112 @@
+# llm_routing.py
+# Fallback and hedged-request routing across models/providers for LLMTool.query_llm.
+# Each model keeps an exponentially weighted moving average (and variance) of its call latency; the hedge delay for a
+# model is an estimated latency percentile derived from those, and fallbacks can optionally be ordered fastest-first.
+import threading
+from statistics import NormalDist
+
+DEFAULT_ROUTING_CONFIG = {
+    "fallbacks": [],                    # Model choices tried in order after the requested model fails
+    "order_fallbacks_by_latency": False, # Try the fallback with the lowest EWMA latency first
+    "hedge": False,                     # Fire the next backend if the current one has not answered in time
+    "hedge_percentile": 0.95,           # ... where "in time" is this latency percentile of the current model
+    "hedge_min_delay": 1.0,             # Seconds; lower bound for the hedge delay
+    "hedge_max_delay": 30.0,            # Seconds; upper bound, and the delay used until enough samples exist
+    "min_samples": 3,                   # Latency samples needed before the percentile estimate is trusted
+    "ewma_alpha": 0.2,                  # Weight of the newest sample in the moving averages
+}
+
+
+class LatencyTracker:
+    """EWMA mean/variance of one model's successful call latency, plus an EWMA failure rate."""
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = float(alpha)
+        self.mean: float | None = None
+        self.variance = 0.0
+        self.samples = 0
+        self.failures = 0
+        self.failure_rate = 0.0
+
+    def record_success(self, seconds: float):
+        self.samples += 1
+        self.failure_rate *= (1 - self.alpha)
+        if self.mean is None:
+            self.mean = seconds
+            return
+        diff = seconds - self.mean
+        incr = self.alpha * diff
+        self.mean += incr
+        self.variance = (1 - self.alpha) * (self.variance + diff * incr)
+
+    def record_failure(self):
+        self.failures += 1
+        self.failure_rate = self.failure_rate * (1 - self.alpha) + self.alpha
+
+    def percentile(self, p: float) -> float | None:
+        if self.mean is None:
+            return None
+        z = NormalDist().inv_cdf(min(max(p, 0.5), 0.999))
+        return self.mean + z * self.variance ** 0.5
+
+
+class RoutingPolicy:
+    def __init__(self, config: dict | None = None):
+        cfg = dict(DEFAULT_ROUTING_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        cfg["fallbacks"] = [str(m) for m in (cfg["fallbacks"] or [])]
+        self.config = cfg
+        self._trackers: dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self.counters = {"routed_calls": 0, "fallbacks_used": 0, "hedges_fired": 0, "hedges_won": 0}
+
+    @property
+    def hedge_enabled(self) -> bool:
+        return bool(self.config["hedge"])
+
+    def _tracker(self, model_choice: str) -> LatencyTracker:
+        tracker = self._trackers.get(model_choice)
+        if tracker is None:
+            tracker = self._trackers[model_choice] = LatencyTracker(self.config["ewma_alpha"])
+        return tracker
+
+    def route_for(self, model_choice: str) -> list[str]:
+        """The requested model followed by the configured fallbacks (without duplicates)."""
+        fallbacks = [m for m in self.config["fallbacks"] if m != model_choice]
+        if self.config["order_fallbacks_by_latency"]:
+            with self._lock:
+                # Unmeasured models sort last, keeping their configured order; frequent failures are penalized
+                def expected_latency(m):
+                    t = self._trackers.get(m)
+                    return float("inf") if t is None or t.mean is None else t.mean * (1 + t.failure_rate)
+                fallbacks.sort(key=expected_latency)
+        return [model_choice] + list(dict.fromkeys(fallbacks))
+
+    def hedge_delay(self, model_choice: str) -> float:
+        cfg = self.config
+        with self._lock:
+            tracker = self._trackers.get(model_choice)
+            estimate = tracker.percentile(float(cfg["hedge_percentile"])) if tracker and tracker.samples >= int(cfg["min_samples"]) else None
+        if estimate is None:
+            return float(cfg["hedge_max_delay"])
+        return min(max(estimate, float(cfg["hedge_min_delay"])), float(cfg["hedge_max_delay"]))
+
+    def record_result(self, model_choice: str, seconds: float, ok: bool):
+        with self._lock:
+            tracker = self._tracker(model_choice)
+            if ok: tracker.record_success(seconds)
+            else: tracker.record_failure()
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["models"] = {
+                m: {"ewma_latency_s": t.mean, "p_hedge_s": t.percentile(float(self.config["hedge_percentile"])),
+                    "samples": t.samples, "failures": t.failures, "ewma_failure_rate": t.failure_rate}
+                for m, t in self._trackers.items()
+            }
+        return stats
@@ -0,0 +1,192 @@
+# llm_schemas.py
+# JSON schemas for every structured answer the agent asks an LLM for, plus a small local validator.
+# The same schema is sent to the provider (Ollama `format`, OpenRouter `response_format`) and checked locally,
+# so malformed output is caught immediately instead of surfacing as a failed ReAct iteration later.
+import json
+
+from response_parser import parse_response, repair_json
+
+BLOCK_IDENTIFIER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": ["custom_markers", "custom_marker", "function_name", "class_name"]},
+        "name": {"type": "string"},
+        "start_marker_regex": {"type": "string"},
+        "end_marker_regex": {"type": "string"},
+        "inclusive_markers": {"type": "boolean"},
+        "definition_line_only": {"type": "boolean"},
+    },
+    "required": ["type"],
+}
+
+CHANGE_DIRECTIVE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "file_path": {"type": "string"},
+        "change_type": {"type": "string", "enum": ["create_or_replace_file", "append_to_file", "prepend_to_file", "replace_block",
+                                                   "insert_after_element", "insert_before_element"]},
+        "code_snippet": {"type": "array", "items": {"type": "string"}},
+        "block_identifier": {"anyOf": [BLOCK_IDENTIFIER_SCHEMA, {"type": "null"}]},
+        "target_element_selector": {"type": ["string", "null"]},
+        "indentation_handling": {"type": "string"},
+    },
+    "required": ["file_path", "change_type", "code_snippet"],
+}
+
+CHANGE_DIRECTIVES_SCHEMA = {
+    "type": "object",
+    "properties": {"directives": {"type": "array", "items": CHANGE_DIRECTIVE_SCHEMA}},
+    "required": ["directives"],
+}
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_goal": {"type": "string"},
+        "estimated_involved_files": {"type": "array", "items": {"type": "string"}},
+        "sub_tasks": {"type": "array", "minItems": 1, "items": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "string"},
+                "description": {"type": "string"},
+                "complexity": {"type": "string", "enum": ["simple", "medium", "complex", "unknown"]},
+                "status": {"type": "string"},
+                "depends_on": {"type": "array", "items": {"type": "string"}}, # Ids of sub-tasks that must finish first
+                "files": {"type": "array", "items": {"type": "string"}},      # Files the sub-task reads or edits
+            },
+            "required": ["id", "description"],
+        }},
+    },
+    "required": ["overall_goal", "sub_tasks"],
+}
+
+ACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tool_name": {"type": "string"},
+        "arguments": {"type": "object"},
+        "result": {
+            "type": "object",
+            "properties": {
+                "status": {"type": "string", "enum": ["success", "failure"]},
+                "message": {"type": "string"},
+                "directives": {"type": "array", "items": CHANGE_DIRECTIVE_SCHEMA},
+            },
+        },
+    },
+    "required": ["tool_name"],
+}
+
+PLAN_STEP_SCHEMA = {
+    "type": "object",
+    # One action, or several independent tool calls run together as one step (see action_batch)
+    "properties": {"thought": {"type": "string"}, "action": {"anyOf": [ACTION_SCHEMA, {"type": "array", "minItems": 1, "items": ACTION_SCHEMA}]}},
+    "required": ["thought", "action"],
+}
+
+SCHEMAS = {
+    "plan": PLAN_SCHEMA,
+    "action": ACTION_SCHEMA,
+    "plan_step": PLAN_STEP_SCHEMA,
+    "block_identifier": BLOCK_IDENTIFIER_SCHEMA,
+    "change_directive": CHANGE_DIRECTIVE_SCHEMA,
+    "change_directives": CHANGE_DIRECTIVES_SCHEMA,
+}
+
+_JSON_TYPES = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def get_schema(name: str) -> dict:
+    if name not in SCHEMAS:
+        raise KeyError(f"Unknown LLM output schema '{name}'. Known: {', '.join(SCHEMAS)}")
+    return SCHEMAS[name]
+
+
+def validate_json(instance, schema: dict, path: str = "$") -> list[str]:
+    """Validates against the JSON Schema subset used above (type, enum, properties, required, items, minItems,
+    anyOf). Returns a list of human-readable problems; empty means valid."""
+    if "anyOf" in schema:
+        if any(not validate_json(instance, option, path) for option in schema["anyOf"]):
+            return []
+        return [f"{path}: does not match any allowed shape"]
+    errors = []
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_JSON_TYPES[t](instance) for t in types):
+            return [f"{path}: expected {' or '.join(types)}, got {type(instance).__name__}"]
+    if "enum" in schema and instance not in schema["enum"]:
+        errors.append(f"{path}: {instance!r} is not one of {schema['enum']}")
+    if isinstance(instance, dict):
+        for key in schema.get("required", []):
+            if key not in instance:
+                errors.append(f"{path}: missing required field '{key}'")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in instance:
+                errors.extend(validate_json(instance[key], sub_schema, f"{path}.{key}"))
+    if isinstance(instance, list):
+        if len(instance) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(instance):
+                errors.extend(validate_json(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def extract_json(text: str):
+    """The JSON value in a model reply: the whole reply, a fenced block, or the first {...}/[...] (repaired if needed).
+    Raises ValueError if nothing parses."""
+    stripped = (text or "").strip()
+    candidates = [stripped]
+    candidates.extend(content.strip() for _, content in parse_response(stripped).code_blocks)
+    starts = [i for i in (stripped.find("{"), stripped.find("[")) if i != -1]
+    if starts:
+        candidates.append(stripped[min(starts):])
+    decoder = json.JSONDecoder(strict=False)
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return decoder.raw_decode(candidate)[0] # Ignores trailing prose after the value
+        except json.JSONDecodeError:
+            pass
+        try:
+            return json.loads(repair_json(candidate)[0], strict=False)
+        except json.JSONDecodeError:
+            pass
+    raise ValueError("No parseable JSON in the response")
+
+
+def _plan_step_from_prose(text: str) -> dict | None:
+    """Models (or providers) that ignore the requested format may still answer "Thought: ... Action: {...}"."""
+    parsed = parse_response(text)
+    if parsed.action is None:
+        return None
+    return {"thought": parsed.thought or "", "action": parsed.action}
+
+
+# Alternative readings of a reply, tried when the JSON reading does not validate
+_PROSE_PARSERS = {"plan_step": _plan_step_from_prose}
+
+
+def parse_and_validate(text: str, schema_name: str) -> tuple[object | None, list[str]]:
+    """(value, []) when the reply holds JSON matching the named schema, else (None, problems)."""
+    schema = get_schema(schema_name)
+    try:
+        value = extract_json(text)
+        errors = validate_json(value, schema)
+    except ValueError as e:
+        errors = [str(e)]
+    if errors and schema_name in _PROSE_PARSERS:
+        prose_value = _PROSE_PARSERS[schema_name](text)
+        if prose_value is not None and not validate_json(prose_value, schema):
+            return prose_value, []
+    return (value, []) if not errors else (None, errors)
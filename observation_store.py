@@ -0,0 +1,203 @@
+# observation_store.py
+# Content-addressed store for large tool results (file contents, code structures, generated directives).
+# ReAct history entries keep a small handle plus a one-line summary instead of the value itself; the value lives here,
+# in memory up to a byte cap and spilled to disk (one JSON file per SHA-256) beyond it. Identical results, such as the
+# same file read twice, are stored once. Prompt builders resolve a handle only when its content fits their budget.
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_OBSERVATION_STORE_CONFIG = {
+    "inline_max_chars": 300,              # History fields up to this size (as JSON) stay inline
+    "max_memory_bytes": 8 * 1024 * 1024,  # Blobs beyond this are spilled to disk, least recently used first
+    "spill_dir": ".ai_agent_cache/observations",
+    "max_age_days": 7.0,                  # Spilled blobs older than this are deleted when a store is opened
+    "expand_recent_steps": 1,             # Planner prompts show the content of handles from this many latest steps
+    "expand_max_chars": 1500,             # ... each cut to this many characters
+}
+
+HANDLE_KEY = "$obs"
+
+
+def is_handle(value) -> bool:
+    return isinstance(value, dict) and HANDLE_KEY in value
+
+
+def summarize(value, max_chars: int = 120) -> str:
+    """One line describing a value without reproducing it: size plus the first line of text, or the shape of a dict/list."""
+    if isinstance(value, str):
+        first_line = next((line.strip() for line in value.splitlines() if line.strip()), "")
+        if len(first_line) > max_chars:
+            first_line = first_line[:max_chars] + "..."
+        return f"text, {value.count(chr(10)) + 1} lines, {len(value)} chars; starts: {first_line}"
+    if isinstance(value, dict):
+        parts = []
+        for key, item in value.items():
+            if isinstance(item, (list, dict)):
+                parts.append(f"{key} ({type(item).__name__} of {len(item)})")
+            elif isinstance(item, str) and len(item) > 40:
+                parts.append(f"{key} (text, {len(item)} chars)")
+            else:
+                parts.append(f"{key}={item!r}")
+        text = "object: " + ", ".join(parts)
+    elif isinstance(value, list):
+        text = f"list of {len(value)} items" + (f"; first: {json.dumps(value[0], ensure_ascii=False, default=str)}" if value else "")
+    else:
+        text = repr(value)
+    return text if len(text) <= max_chars + 40 else text[:max_chars + 40] + "..."
+
+
+def iter_handles(obj):
+    """Every handle inside a JSON-like object, depth first in document order."""
+    if is_handle(obj):
+        yield obj
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            yield from iter_handles(value)
+    elif isinstance(obj, list):
+        for value in obj:
+            yield from iter_handles(value)
+
+
+def format_observation(handle: dict, value, max_chars: int) -> str:
+    """Prompt text for a resolved handle: text values verbatim, anything else as compact JSON, cut to max_chars."""
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+    if len(text) > max_chars:
+        keep = max(max_chars // 2, 1)
+        text = f"{text[:keep]}...[{len(text) - 2 * keep} chars elided]...{text[-keep:]}"
+    return f"[{HANDLE_KEY} {handle[HANDLE_KEY]}]\n{text}"
+
+
+class ObservationStore:
+    def __init__(self, config: dict | None = None):
+        cfg = dict(DEFAULT_OBSERVATION_STORE_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.inline_max_chars = int(cfg["inline_max_chars"])
+        self.max_memory_bytes = int(cfg["max_memory_bytes"])
+        self.spill_dir = Path(cfg["spill_dir"]) if cfg["spill_dir"] else None
+        self._blobs: "OrderedDict[str, str]" = OrderedDict() # blob id -> JSON text, least recently used first
+        self._on_disk: set[str] = set()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"blobs": 0, "deduplicated": 0, "inline_chars_replaced": 0, "handle_chars": 0, "spilled": 0, "disk_reads": 0}
+        if self.spill_dir is not None:
+            self._prune_spill_dir(float(cfg["max_age_days"] or 0))
+
+    def put(self, value) -> dict:
+        """Stores value and returns its handle: {"$obs": id, "summary": ..., "chars": size of the value as JSON}."""
+        text = json.dumps(value, ensure_ascii=False, default=str)
+        blob_id = hashlib.sha256(text.encode("utf-8")).hexdigest()[:20]
+        with self._lock:
+            if blob_id in self._blobs or blob_id in self._on_disk:
+                self.stats["deduplicated"] += 1
+                if blob_id in self._blobs:
+                    self._blobs.move_to_end(blob_id)
+            else:
+                self._blobs[blob_id] = text
+                self._memory_bytes += len(text)
+                self.stats["blobs"] += 1
+                self._spill_over_cap()
+        return {HANDLE_KEY: blob_id, "summary": summarize(value), "chars": len(text)}
+
+    def get(self, handle: dict | str):
+        """The stored value for a handle (or blob id). Raises KeyError if it is unknown or its spill file is gone."""
+        blob_id = handle[HANDLE_KEY] if isinstance(handle, dict) else handle
+        with self._lock:
+            text = self._blobs.get(blob_id)
+            if text is not None:
+                self._blobs.move_to_end(blob_id)
+        if text is None:
+            path = self._blob_path(blob_id)
+            try:
+                text = path.read_text(encoding="utf-8") if path is not None else None
+            except OSError:
+                text = None
+            if text is None:
+                raise KeyError(f"Unknown observation handle '{blob_id}'")
+            with self._lock:
+                self.stats["disk_reads"] += 1
+        return json.loads(text)
+
+    def compact(self, record: dict | None) -> dict | None:
+        """Copy of a dict with each top-level value whose JSON is longer than inline_max_chars replaced by a handle."""
+        if not isinstance(record, dict):
+            return record
+        compacted = {}
+        for key, value in record.items():
+            if is_handle(value) or isinstance(value, (bool, int, float)) or value is None:
+                compacted[key] = value
+                continue
+            size = len(value) if isinstance(value, str) else len(json.dumps(value, ensure_ascii=False, default=str))
+            if size <= self.inline_max_chars:
+                compacted[key] = value
+                continue
+            handle = self.put(value)
+            with self._lock:
+                self.stats["inline_chars_replaced"] += size
+                self.stats["handle_chars"] += len(json.dumps(handle, ensure_ascii=False))
+            compacted[key] = handle
+        return compacted
+
+    def flush(self):
+        """Writes every in-memory blob to the spill directory (e.g. before a checkpoint), keeping the memory copies."""
+        with self._lock:
+            pending = [(blob_id, text) for blob_id, text in self._blobs.items() if blob_id not in self._on_disk]
+        for blob_id, text in pending:
+            if self._write_blob(blob_id, text):
+                with self._lock:
+                    self._on_disk.add(blob_id)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, memory_blobs=len(self._blobs), memory_bytes=self._memory_bytes,
+                        max_memory_bytes=self.max_memory_bytes, spill_dir=str(self.spill_dir) if self.spill_dir else None)
+
+    def _spill_over_cap(self):
+        # Called with the lock held
+        while self._memory_bytes > self.max_memory_bytes and len(self._blobs) > 1:
+            blob_id, text = next(iter(self._blobs.items()))
+            if blob_id not in self._on_disk:
+                if not self._write_blob(blob_id, text):
+                    return # No usable spill directory: keep everything in memory
+                self._on_disk.add(blob_id)
+                self.stats["spilled"] += 1
+            del self._blobs[blob_id]
+            self._memory_bytes -= len(text)
+
+    def _blob_path(self, blob_id: str) -> Path | None:
+        return self.spill_dir / blob_id[:2] / f"{blob_id}.json" if self.spill_dir is not None else None
+
+    def _write_blob(self, blob_id: str, text: str) -> bool:
+        path = self._blob_path(blob_id)
+        if path is None:
+            return False
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                os.utime(path) # Same content (content-addressed); keep it clear of age-based pruning
+            else:
+                tmp_path = path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+                tmp_path.write_text(text, encoding="utf-8")
+                os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print(f"WARNING: ObservationStore: Could not spill observation to {path}: {e}. Keeping it in memory.")
+            self.spill_dir = None
+            return False
+
+    def _prune_spill_dir(self, max_age_days: float):
+        if max_age_days <= 0 or not self.spill_dir.is_dir():
+            return
+        cutoff = time.time() - max_age_days * 86400
+        for path in self.spill_dir.glob("*/*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
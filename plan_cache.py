@@ -0,0 +1,200 @@
+# plan_cache.py
+# Persistent cache of TaskDecomposer plans, so re-issuing a request against an unchanged tree (a CI retry, a teammate
+# running the same migration) skips the planning LLM call. Entries are keyed by the normalised prompt, the planning
+# model and a cheap project fingerprint (relative path, size and mtime of every source file). A prompt that is not
+# an exact match can reuse a plan made for a near-duplicate prompt only when near_duplicate_threshold is set below 1.0
+# (same model and tree; Jaccard similarity of word shingles at or above the threshold; never when the differing words
+# include a number, path or identifier, as in "60 seconds" vs "10 seconds"). Cached plans are validated against the current PLAN_SCHEMA
+# before use, so plans stored by an older version are dropped instead of being run. SQLite (WAL), like llm_cache,
+# with a TTL and LRU eviction down to max_entries.
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from code_index import DEFAULT_RETRIEVAL_CONFIG
+from llm_schemas import PLAN_SCHEMA, validate_json
+
+DEFAULT_PLAN_CACHE_CONFIG = {
+    "enabled": True,
+    "path": ".ai_agent_cache/plans.sqlite3",
+    "max_entries": 500,
+    "max_age_days": 14.0,               # Older plans are misses and purged
+    "near_duplicate_threshold": 1.0,    # Shingle similarity for reusing another prompt's plan; 1.0 = exact prompts only
+    "shingle_size": 3,                  # Words per shingle
+}
+
+_WORD_RE = re.compile(r"[a-z0-9_./-]+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lower case words (paths and identifiers kept whole), punctuation and spacing dropped."""
+    words = (word.strip("./-") for word in _WORD_RE.findall((prompt or "").lower())) # "loader.py." at a sentence end
+    return " ".join(word for word in words if word)
+
+
+def shingles(normalized_prompt: str, size: int) -> set[str]:
+    words = normalized_prompt.split()
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def differing_words(a: str, b: str) -> list[str]:
+    """Words in only one of two normalised prompts."""
+    return sorted(set(a.split()) ^ set(b.split()))
+
+
+def is_specific_word(word: str) -> bool:
+    """Numbers, paths and identifiers: a prompt differing in one of these asks for something else."""
+    return any(c.isdigit() or c in "./_-" for c in word)
+
+
+def project_fingerprint(project_root: Path, extensions=None, exclude_dirs=None) -> str:
+    """SHA-256 of (relative path, size, mtime) of the project's source files; stat only, no file contents read."""
+    extensions = {e.lower() for e in (extensions or DEFAULT_RETRIEVAL_CONFIG["extensions"])}
+    excluded = set(exclude_dirs or DEFAULT_RETRIEVAL_CONFIG["exclude_dirs"])
+    root = Path(project_root).resolve()
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in excluded and not d.startswith("."))
+        for filename in sorted(filenames):
+            if Path(filename).suffix.lower() not in extensions:
+                continue
+            path = Path(dirpath) / filename
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            digest.update(f"{path.relative_to(root).as_posix()}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PlanCache:
+    def __init__(self, project_root: Path, config: dict | None = None):
+        cfg = dict(DEFAULT_PLAN_CACHE_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.project_root = Path(project_root)
+        self.path = Path(cfg["path"])
+        self.max_age_seconds = float(cfg["max_age_days"]) * 86400 if cfg["max_age_days"] else None
+        self._project_fp: str | None = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS plans (
+            key TEXT PRIMARY KEY, model TEXT NOT NULL, project_fp TEXT NOT NULL, prompt TEXT NOT NULL, shingles TEXT NOT NULL,
+            plan TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_scope ON plans(model, project_fp)")
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "invalid": 0, "stores": 0, "evictions": 0}
+        self.last_match: dict | None = None # How the last get() was answered, for the run report
+
+    def project_fp(self) -> str:
+        # Taken once per run, before any change is applied, so get() and put() agree on the tree they saw
+        if self._project_fp is None:
+            self._project_fp = project_fingerprint(self.project_root)
+        return self._project_fp
+
+    def _key(self, prompt_norm: str, model: str, project_fp: str) -> str:
+        return hashlib.sha256(json.dumps([prompt_norm, model, project_fp], separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, model: str) -> dict | None:
+        """A valid cached plan for this prompt (or a near-duplicate of it), model and project state, or None."""
+        prompt_norm, project_fp, now = normalize_prompt(prompt), self.project_fp(), time.time()
+        with self._lock:
+            if self.max_age_seconds is not None:
+                cur = self._conn.execute("DELETE FROM plans WHERE created_at < ?", (now - self.max_age_seconds,))
+                self.stats["evictions"] += max(cur.rowcount, 0)
+            candidates = []
+            row = self._conn.execute("SELECT key, prompt, plan FROM plans WHERE key = ?", (self._key(prompt_norm, model, project_fp),)).fetchone()
+            if row is not None:
+                candidates.append((1.0, row[0], row[1], row[2]))
+            threshold = float(self.config["near_duplicate_threshold"])
+            if not candidates and threshold < 1.0:
+                wanted = shingles(prompt_norm, int(self.config["shingle_size"]))
+                for key, other_prompt, other_shingles, plan_text in self._conn.execute(
+                        "SELECT key, prompt, shingles, plan FROM plans WHERE model = ? AND project_fp = ?", (model, project_fp)):
+                    similarity = jaccard(wanted, set(json.loads(other_shingles)))
+                    if similarity >= threshold and not any(is_specific_word(w) for w in differing_words(prompt_norm, other_prompt)):
+                        candidates.append((similarity, key, other_prompt, plan_text))
+                candidates.sort(key=lambda c: c[0], reverse=True)
+            for similarity, key, other_prompt, plan_text in candidates:
+                try:
+                    plan = json.loads(plan_text)
+                    errors = validate_json(plan, PLAN_SCHEMA)
+                except json.JSONDecodeError as e:
+                    errors = [str(e)]
+                if errors: # Stored by a version with a different plan shape
+                    self._conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+                    self.stats["invalid"] += 1
+                    print(f"INFO: Plan cache: Dropped a cached plan that no longer matches the plan schema: {errors[0]}")
+                    continue
+                self._conn.execute("UPDATE plans SET last_access = ? WHERE key = ?", (now, key))
+                differing = differing_words(prompt_norm, other_prompt)
+                self.stats["near_hits" if other_prompt != prompt_norm else "exact_hits"] += 1
+                self.last_match = {"similarity": round(similarity, 3), "cached_prompt": other_prompt, "differing_words": differing}
+                if other_prompt != prompt_norm:
+                    print(f"INFO: Plan cache: Reusing the plan of a near-duplicate prompt (similarity {similarity:.3f}); "
+                          f"differing words: {', '.join(differing) or '(word order only)'}")
+                return plan
+            self.stats["misses"] += 1
+            self.last_match = None
+            return None
+
+    def put(self, prompt: str, model: str, plan: dict):
+        prompt_norm, now = normalize_prompt(prompt), time.time()
+        row = (self._key(prompt_norm, model, self.project_fp()), model, self.project_fp(), prompt_norm,
+               json.dumps(sorted(shingles(prompt_norm, int(self.config["shingle_size"])))),
+               json.dumps(plan, ensure_ascii=False), now, now)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO plans (key, model, project_fp, prompt, shingles, plan, created_at, last_access) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+                self.stats["stores"] += 1
+                # Least recently used first, down to max_entries
+                excess = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0] - int(self.config["max_entries"])
+                if excess > 0:
+                    cur = self._conn.execute("DELETE FROM plans WHERE key IN (SELECT key FROM plans ORDER BY last_access ASC LIMIT ?)", (excess,))
+                    self.stats["evictions"] += max(cur.rowcount, 0)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+            stats = dict(self.stats)
+        stats["entries"] = entries
+        stats["last_match"] = self.last_match
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_plan_cache(project_root: Path, config: dict | None) -> PlanCache | None:
+    """A PlanCache for the project, or None if disabled or the cache file cannot be opened."""
+    cfg = dict(DEFAULT_PLAN_CACHE_CONFIG)
+    if config:
+        cfg.update({k: v for k, v in config.items() if v is not None})
+    if not cfg["enabled"]:
+        return None
+    try:
+        return PlanCache(project_root, cfg)
+    except (sqlite3.Error, OSError) as e:
+        print(f"WARNING: Plan cache disabled, could not open '{cfg['path']}': {e}")
+        return None
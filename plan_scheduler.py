@@ -0,0 +1,95 @@
+# plan_scheduler.py
+# Runs the sub-tasks of a plan as a dependency graph instead of a fixed sequence. A sub-task waits for the sub-tasks
+# named in its "depends_on" and for every earlier sub-task that touches one of the same "files"; a sub-task that does
+# not declare its files may touch anything, so it is ordered against all earlier sub-tasks (a plan without "files" runs
+# exactly as before, one sub-task after the other). Independent sub-tasks run concurrently on a small worker pool.
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_SCHEDULER_CONFIG = {
+    "max_parallel_sub_tasks": 3,  # 1 runs the sub-tasks one at a time, in dependency order
+}
+
+
+def _normalize_file(path) -> str:
+    return os.path.normpath(str(path).strip()).replace("\\", "/").lower()
+
+
+def build_dependencies(sub_tasks: list[dict]) -> list[set[int]]:
+    """For each sub-task (by index), the indices of the sub-tasks that must finish before it starts.
+    Unknown ids in depends_on are ignored with a warning; a cyclic plan falls back to plan order."""
+    index_by_id = {str(task.get("id")): i for i, task in enumerate(sub_tasks)}
+    files = []
+    for task in sub_tasks:
+        declared = task.get("files")
+        files.append({_normalize_file(f) for f in declared if str(f).strip()} if isinstance(declared, list) and declared else None)
+
+    dependencies = []
+    for i, task in enumerate(sub_tasks):
+        deps = set()
+        for dep_id in task.get("depends_on") or []:
+            j = index_by_id.get(str(dep_id))
+            if j is None:
+                print(f"WARNING: PlanScheduler: Sub-task '{task.get('id')}' depends on unknown sub-task '{dep_id}'. Ignoring it.")
+            elif j != i:
+                deps.add(j)
+        for j in range(i):
+            # Two sub-tasks editing the same file must not interleave; plan order decides which goes first
+            if files[i] is None or files[j] is None or files[i] & files[j]:
+                deps.add(j)
+        dependencies.append(deps)
+
+    if len(topological_order(dependencies)) < len(sub_tasks):
+        print("WARNING: PlanScheduler: The plan's depends_on form a cycle. Running the sub-tasks in plan order.")
+        return [{i - 1} if i else set() for i in range(len(sub_tasks))]
+    return dependencies
+
+
+def topological_order(dependencies: list[set[int]]) -> list[int]:
+    """Indices in dependency order, the lowest ready index first (plan order when dependencies only point back).
+    Shorter than the input if there is a cycle."""
+    remaining = [set(deps) for deps in dependencies]
+    order, done = [], set()
+    while True:
+        ready = [i for i, deps in enumerate(remaining) if i not in done and deps <= done]
+        if not ready:
+            return order
+        order.append(ready[0])
+        done.add(ready[0])
+
+
+def run_dag(dependencies: list[set[int]], run_one, max_workers: int, stop_event: threading.Event | None = None) -> list:
+    """Calls run_one(index) for every index once its dependencies have returned, with up to max_workers at a time.
+    Returns the results in index order. Each call runs in its own copy of the caller's context. If a call raises (or
+    the caller is interrupted), no further calls are started, stop_event is set so running calls can exit early, and
+    the exception is re-raised."""
+    results = [None] * len(dependencies)
+    if max_workers <= 1 or len(dependencies) <= 1:
+        for i in topological_order(dependencies):
+            results[i] = run_one(i)
+        return results
+
+    done, started, running = set(), set(), {}
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sub-task")
+    try:
+        while len(done) < len(dependencies):
+            for i, deps in enumerate(dependencies):
+                if i not in started and deps <= done and len(running) < max_workers:
+                    started.add(i)
+                    running[pool.submit(contextvars.copy_context().run, run_one, i)] = i
+            if not running: # Only possible with a cycle, which build_dependencies rules out
+                raise RuntimeError("PlanScheduler: No runnable sub-task left; the dependency graph has a cycle.")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                results[i] = future.result()
+                done.add(i)
+    except BaseException:
+        if stop_event is not None:
+            stop_event.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+    return results
@@ -0,0 +1,150 @@
+# prefetch.py
+# Speculative prefetch of the files a run is likely to need: files named in the user prompt (as soon as the run
+# starts, alongside task decomposition) and the plan's estimated_involved_files and per-sub-task files (as soon as the
+# plan exists). Each file is read into the shared FileCache on a small worker pool, then analysed (CodeAnalysisTool's
+# structure cache) and refreshed in the retrieval index in the background, so the first planner prompt already lists
+# the files as cached and the planner can skip straight to generation instead of spending iterations on read_file.
+import contextvars
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+DEFAULT_PREFETCH_CONFIG = {
+    "enabled": True,
+    "max_files": 12,                  # Files prefetched per run
+    "max_file_bytes": 512 * 1024,     # Larger files are left to an explicit read
+    "wait_for_reads_s": 2.0,          # How long the first plan step waits for pending reads (analysis never blocks it)
+    "workers": 4,
+}
+
+FILE_TYPES = {".py": "python", ".html": "html", ".htm": "html", ".css": "css", ".js": "javascript", ".ts": "typescript",
+              ".json": "json", ".md": "markdown", ".yaml": "yaml", ".yml": "yaml"}
+
+# Path-like words with an extension: "index.html", "src/app.py", "./static/style.css"
+_PATH_RE = re.compile(r"(?<![\w/.-])(?:\.{0,2}/)?[\w-]+(?:/[\w.-]+)*\.[A-Za-z0-9]{1,8}\b")
+
+
+def file_type_for(path: str) -> str:
+    return FILE_TYPES.get(Path(path).suffix.lower(), Path(path).suffix.lower().lstrip(".") or "text")
+
+
+def files_in_prompt(prompt: str, project_root: Path) -> list[str]:
+    """Path-like words of the prompt that name an existing file inside the project, in order of appearance."""
+    root = Path(project_root).resolve()
+    found = []
+    for match in _PATH_RE.finditer(prompt or ""):
+        candidate = match.group(0)
+        try:
+            path = (root / candidate).resolve()
+            path.relative_to(root)
+        except (OSError, ValueError):
+            continue
+        if path.is_file() and candidate not in found:
+            found.append(candidate)
+    return found
+
+
+class Prefetcher:
+    def __init__(self, state_manager, code_analysis_tool=None, code_index=None, config: dict | None = None):
+        cfg = dict(DEFAULT_PREFETCH_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.state = state_manager
+        self.code_analysis_tool = code_analysis_tool
+        self.code_index = code_index
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(cfg["workers"])), thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._requested: dict = {}     # Canonical path -> path as requested
+        self._reads: list = []         # Futures of pending file reads
+        self._followups: list = []     # Futures of analysis / index refreshes
+        self.stats = {"requested": 0, "read": 0, "skipped": 0, "failed": 0, "analysed": 0, "indexed": 0,
+                      "read_time_s": 0.0, "waited_s": 0.0}
+
+    def submit(self, paths: list[str], source: str):
+        """Starts prefetching paths (relative to the project) that were not requested before, up to max_files per run."""
+        new_paths = []
+        with self._lock:
+            for path_str in paths or []:
+                if not isinstance(path_str, str) or not path_str.strip():
+                    continue
+                canonical = self.state.file_cache.resolve(path_str.strip())
+                if canonical in self._requested or len(self._requested) >= int(self.config["max_files"]):
+                    continue
+                self._requested[canonical] = path_str.strip()
+                new_paths.append(path_str.strip())
+            self.stats["requested"] = len(self._requested)
+            for path_str in new_paths:
+                # In the submitter's context, so the work is attributed (and logged) like the run that asked for it
+                self._reads.append(self._pool.submit(contextvars.copy_context().run, self._read, path_str))
+        if new_paths:
+            print(f"INFO: Prefetch: Reading {len(new_paths)} file(s) from the {source} in the background: {', '.join(new_paths)}")
+
+    def submit_plan(self, plan: dict | None):
+        if not plan:
+            return
+        paths = list(plan.get("estimated_involved_files") or [])
+        for sub_task in plan.get("sub_tasks") or []:
+            paths.extend(f for f in (sub_task.get("files") or []) if f not in paths)
+        self.submit(paths, "plan")
+
+    def wait_for_reads(self, timeout: float | None = None) -> bool:
+        """Blocks until the reads submitted so far are cached (or timeout). True if none is left pending."""
+        timeout = float(self.config["wait_for_reads_s"]) if timeout is None else timeout
+        with self._lock:
+            pending = [f for f in self._reads if not f.done()]
+        if not pending:
+            return True
+        started_at = time.perf_counter()
+        _, not_done = wait(pending, timeout=timeout)
+        with self._lock:
+            self.stats["waited_s"] += time.perf_counter() - started_at
+        if not_done:
+            print(f"INFO: Prefetch: {len(not_done)} file read(s) still pending after {timeout:.1f}s; not waiting for them.")
+        return not not_done
+
+    def close(self, wait_for_all: bool = False):
+        self._pool.shutdown(wait=wait_for_all, cancel_futures=not wait_for_all)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def _count(self, key: str, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _read(self, path_str: str):
+        started_at = time.perf_counter()
+        path = self.state.file_cache.resolve(path_str)
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            self._count("failed")
+            return
+        if size > int(self.config["max_file_bytes"]):
+            self._count("skipped")
+            return
+        content = self.state.get_file_from_cache(path_str)
+        self._count("read_time_s", time.perf_counter() - started_at)
+        if content is None:
+            self._count("failed")
+            return
+        self._count("read")
+        # Analysis and indexing must not hold up the reads the first plan step is waiting for
+        with self._lock:
+            self._followups.append(self._pool.submit(contextvars.copy_context().run, self._analyse, path_str, content))
+
+    def _analyse(self, path_str: str, content: str):
+        try:
+            if self.code_analysis_tool is not None:
+                self.code_analysis_tool.get_code_structure(content, file_type_for(path_str))
+                self._count("analysed")
+            if self.code_index is not None:
+                self.code_index.refresh([self.code_index.relative_path(self.state.file_cache.resolve(path_str))])
+                self._count("indexed")
+        except Exception as e: # Speculative work: a failure only loses the head start
+            print(f"WARNING: Prefetch: Could not analyse {path_str}: {e}")
@@ -0,0 +1,153 @@
+# prompt_builder.py
+# Token-budgeted prompt assembly. Sections are filled in priority order against a token budget using a fast local
+# estimator; what does not fit is truncated or elided with an explicit marker, and the builder reports how many
+# (estimated) tokens each section ended up using. Sections marked stable (identical from call to call) should come
+# first: the report says how long that byte-stable prefix is, so providers can reuse their cached prefill for it.
+import json
+import re
+
+DEFAULT_PROMPT_BUDGET_CONFIG = {
+    "default_tokens": 3000,  # Total input budget (system + user prompt) when no per-model budget is configured
+    "models": {},            # e.g. {"ollama/mistral:7b": 2048, "openrouter/anthropic/claude-3-haiku": 8000}
+    "history_steps": 6,      # Most recent ReAct steps offered to the planner; the budget decides how many fit
+    "max_field_chars": 600,  # Longer strings inside history entries (tool outputs, code) are cut to this
+}
+
+# Word pieces of up to 8 characters plus single punctuation marks: close to BPE token counts for English and code,
+# without needing a tokenizer for every provider.
+_TOKEN_PIECE_RE = re.compile(r"\w{1,8}|[^\w\s]")
+MIN_SECTION_TOKENS = 12 # Below this a truncated section is not worth including; it is elided instead
+
+
+def estimate_tokens(text: str | None) -> int:
+    return len(_TOKEN_PIECE_RE.findall(text)) if text else 0
+
+
+def compact_json(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def shorten_strings(obj, max_chars: int):
+    """Copy of a JSON-like object with every string longer than max_chars cut down (head and tail kept)."""
+    if isinstance(obj, str):
+        if len(obj) <= max_chars:
+            return obj
+        keep = max(max_chars // 2, 1)
+        return f"{obj[:keep]}...[{len(obj) - 2 * keep} chars elided]...{obj[-keep:]}"
+    if isinstance(obj, dict):
+        return {k: shorten_strings(v, max_chars) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [shorten_strings(v, max_chars) for v in obj]
+    return obj
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens, keeping the head and marking the elided remainder."""
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    pieces = list(_TOKEN_PIECE_RE.finditer(text))
+    keep = max(max_tokens - 6, 0) # Room for the marker itself
+    cut_at = pieces[keep].start() if keep < len(pieces) else len(text)
+    return f"{text[:cut_at].rstrip()}...[{total - keep} tokens elided]"
+
+
+class PromptSection:
+    def __init__(self, name: str, text: str, priority: int, required: bool = False,
+                 items: list[str] | None = None, header: str = "", newest_last: bool = True, stable: bool = False):
+        self.name = name
+        self.text = text
+        self.priority = priority # Lower number = filled first
+        self.required = required # Required sections are truncated but never dropped
+        self.items = items       # Item sections drop whole items instead of cutting text
+        self.header = header
+        self.newest_last = newest_last
+        self.stable = stable     # Same text on every call in a sequence (e.g. all plan steps of one sub-task)
+        self.original_tokens = estimate_tokens(text)
+        self.rendered = ""
+        self.tokens = 0
+        self.truncated = False
+
+
+class PromptBuilder:
+    def __init__(self, budget_tokens: int, reserved_tokens: int = 0):
+        """reserved_tokens: budget already spent elsewhere (e.g. the system message)."""
+        self.budget_tokens = int(budget_tokens)
+        self.reserved_tokens = int(reserved_tokens)
+        self.sections: list[PromptSection] = []
+
+    def add_section(self, name: str, text: str, priority: int, required: bool = False, stable: bool = False) -> PromptSection:
+        section = PromptSection(name, text, priority, required, stable=stable)
+        self.sections.append(section)
+        return section
+
+    def add_items_section(self, name: str, header: str, items: list, priority: int, render=compact_json,
+                          newest_last: bool = True, stable: bool = False) -> PromptSection:
+        """A section made of whole items (history steps, cache entries). When the budget is short, the oldest items
+        are dropped first and replaced by an elision marker, so every included item stays intact."""
+        rendered = [render(item) for item in items]
+        section = PromptSection(name, header + "\n".join(rendered), priority, items=rendered, header=header, newest_last=newest_last,
+                                stable=stable)
+        self.sections.append(section)
+        return section
+
+    def _fit_items(self, section: PromptSection, allowance: int) -> str:
+        kept, used = [], estimate_tokens(section.header) + 8 # + elision marker
+        ordered = reversed(section.items) if section.newest_last else iter(section.items)
+        for item in ordered:
+            cost = estimate_tokens(item) + 1
+            if used + cost > allowance:
+                break
+            kept.append(item)
+            used += cost
+        if section.newest_last:
+            kept.reverse()
+        if not kept:
+            return f"{section.header}[{len(section.items)} entries elided]" if used <= allowance else ""
+        dropped = len(section.items) - len(kept)
+        marker = [f"[{dropped} older entries elided]"] if dropped and section.newest_last else []
+        trailer = [f"[{dropped} more entries elided]"] if dropped and not section.newest_last else []
+        return section.header + "\n".join(marker + kept + trailer)
+
+    def build(self, separator: str = "\n") -> tuple[str, dict]:
+        """Returns (prompt, report). Sections keep the order they were added in; the budget is handed out by priority."""
+        remaining = self.budget_tokens - self.reserved_tokens - len(self.sections) # separators
+        for section in sorted(self.sections, key=lambda s: s.priority):
+            allowance = max(remaining, 0)
+            if section.original_tokens <= allowance:
+                section.rendered = section.text
+            elif section.items is not None:
+                section.rendered = self._fit_items(section, allowance)
+                section.truncated = True
+            elif allowance >= MIN_SECTION_TOKENS or section.required:
+                section.rendered = truncate_to_tokens(section.text, max(allowance, MIN_SECTION_TOKENS))
+                section.truncated = True
+            else:
+                section.rendered = ""
+                section.truncated = True
+            section.tokens = estimate_tokens(section.rendered)
+            remaining -= section.tokens
+        rendered = [s for s in self.sections if s.rendered]
+        prompt = separator.join(s.rendered for s in rendered)
+        # Leading run of stable sections that were not cut (a truncated section depends on what else competed for budget)
+        stable_prefix_chars = 0
+        for section in rendered:
+            if not section.stable or section.truncated:
+                break
+            stable_prefix_chars += len(section.rendered) + len(separator)
+        report = {
+            "budget_tokens": self.budget_tokens,
+            "reserved_tokens": self.reserved_tokens,
+            "prompt_tokens": estimate_tokens(prompt),
+            "stable_prefix_chars": min(stable_prefix_chars, len(prompt)),
+            "sections": {s.name: {"tokens": s.tokens, "original_tokens": s.original_tokens, "truncated": s.truncated}
+                         for s in self.sections},
+        }
+        return prompt, report
+
+
+def format_prompt_report(report: dict) -> str:
+    parts = [f"{name}={info['tokens']}" + (f"/{info['original_tokens']}" if info["truncated"] else "")
+             for name, info in report["sections"].items()]
+    return (f"~{report['prompt_tokens'] + report['reserved_tokens']}/{report['budget_tokens']} tokens "
+            f"(system {report['reserved_tokens']}; {', '.join(parts)}; stable prefix {report['stable_prefix_chars']} chars)")
@@ -0,0 +1,264 @@
+# resilience.py
+# Retry with backoff, Retry-After support, token-bucket rate limiting and circuit breaking for LLM provider calls.
+# One ProviderResilience instance is shared per provider endpoint (see get_provider_resilience), so every
+# connector and thread talking to the same provider draws from the same rate limit and the same breaker.
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+BREAKER_FAILURE_STATUS_CODES = {500, 502, 503, 504} # 429/408 mean "slow down", not "provider is down"
+
+DEFAULT_RESILIENCE_CONFIG = {
+    "max_retries": 3,          # Retries after the first attempt
+    "base_delay": 1.0,         # Seconds; backoff is base_delay * 2**attempt with full jitter
+    "max_delay": 30.0,         # Cap for a single backoff sleep
+    "max_retry_after": 60.0,   # Longest Retry-After we are willing to honor; longer means give up
+    "rate_per_second": 0.0,    # Token-bucket refill rate; 0 disables rate limiting
+    "burst": 1,                # Token-bucket capacity
+    "failure_threshold": 5,    # Consecutive failures that open the circuit
+    "recovery_timeout": 30.0,  # Seconds the circuit stays open before a trial call is allowed
+}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without touching the network when a provider's circuit breaker is open."""
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: int = 1):
+        self.rate = float(rate_per_second)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes one token and returns how long the caller must wait before using it (0 if available now)."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_timeout = float(recovery_timeout)
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True # Only one trial call while half-open
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        # The call ended without a provider answer (bad request, cancelled hedge attempt...): neither a success nor a
+        # failure, but the half-open trial slot must be freed or every later call is rejected
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+
+
+class ProviderResilience:
+    """Wraps a single provider HTTP call (a zero-argument `send` returning a response object) with
+    rate limiting, circuit breaking and retries. Works with requests (status_code) and aiohttp (status) responses."""
+    def __init__(self, name: str, config: dict | None = None):
+        self.name = name
+        cfg = dict(DEFAULT_RESILIENCE_CONFIG)
+        if config:
+            cfg.update({k: v for k, v in config.items() if v is not None})
+        self.config = cfg
+        self.bucket = TokenBucket(cfg["rate_per_second"], cfg["burst"])
+        self.breaker = CircuitBreaker(cfg["failure_threshold"], cfg["recovery_timeout"])
+        self._counters_lock = threading.Lock()
+        self.counters = {"calls": 0, "retries": 0, "throttle_waits": 0, "throttle_wait_seconds": 0.0,
+                         "retry_after_honored": 0, "breaker_rejections": 0, "failures": 0}
+
+    def _count(self, key: str, amount=1):
+        with self._counters_lock:
+            self.counters[key] += amount
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            stats = dict(self.counters)
+        stats["breaker_state"] = self.breaker.state
+        stats["breaker_trips"] = self.breaker.trips
+        return stats
+
+    def _backoff_delay(self, attempt: int, retry_after: float | None) -> float | None:
+        """Seconds to sleep before the next attempt, or None if we should give up."""
+        if retry_after is not None:
+            if retry_after > float(self.config["max_retry_after"]):
+                return None
+            self._count("retry_after_honored")
+            return retry_after
+        cap = min(float(self.config["max_delay"]), float(self.config["base_delay"]) * (2 ** attempt))
+        return random.uniform(0, cap) # Full jitter
+
+    def _before_attempt(self) -> float:
+        if not self.breaker.allow_request():
+            self._count("breaker_rejections")
+            raise CircuitOpenError(f"Circuit breaker for '{self.name}' is open; failing fast")
+        wait = self.bucket.reserve()
+        if wait > 0:
+            self._count("throttle_waits")
+            self._count("throttle_wait_seconds", wait)
+        return wait
+
+    def _classify(self, response) -> tuple[bool, bool, float | None]:
+        """Returns (retryable, counts_as_breaker_failure, retry_after_seconds) for an HTTP response."""
+        status = getattr(response, "status_code", None)
+        if status is None:
+            status = getattr(response, "status", 200)
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if status in RETRYABLE_STATUS_CODES else None
+        return status in RETRYABLE_STATUS_CODES, status in BREAKER_FAILURE_STATUS_CODES, retry_after
+
+    def execute(self, send, retry_on: tuple = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        """Calls send() until it returns a non-retryable response or retries are exhausted. The last response is
+        returned (callers still raise_for_status()); the last exception is re-raised."""
+        self._count("calls")
+        max_retries = int(self.config["max_retries"])
+        for attempt in range(max_retries + 1):
+            wait = self._before_attempt()
+            try:
+                if wait > 0: time.sleep(wait)
+                response = send()
+            except retry_on as e:
+                self.breaker.record_failure()
+                delay = self._backoff_delay(attempt, None)
+                if attempt >= max_retries or delay is None:
+                    self._count("failures")
+                    raise
+                print(f"WARNING: {self.name}: {type(e).__name__} on attempt {attempt + 1}; retrying in {delay:.1f}s.")
+                self._count("retries")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            retryable, breaker_failure, retry_after = self._classify(response)
+            if breaker_failure: self.breaker.record_failure()
+            else: self.breaker.record_success()
+            if not retryable:
+                return response
+            delay = self._backoff_delay(attempt, retry_after)
+            if attempt >= max_retries or delay is None:
+                self._count("failures")
+                return response
+            print(f"WARNING: {self.name}: HTTP {getattr(response, 'status_code', getattr(response, 'status', '?'))} on attempt {attempt + 1}; retrying in {delay:.1f}s.")
+            self._count("retries")
+            response.close()
+            time.sleep(delay)
+
+    async def execute_async(self, send, retry_on: tuple):
+        """asyncio counterpart of execute(); send is a zero-argument coroutine function returning an aiohttp response."""
+        self._count("calls")
+        max_retries = int(self.config["max_retries"])
+        for attempt in range(max_retries + 1):
+            wait = self._before_attempt()
+            try:
+                if wait > 0: await asyncio.sleep(wait)
+                response = await send()
+            except retry_on as e:
+                self.breaker.record_failure()
+                delay = self._backoff_delay(attempt, None)
+                if attempt >= max_retries or delay is None:
+                    self._count("failures")
+                    raise
+                print(f"WARNING: {self.name}: {type(e).__name__} on attempt {attempt + 1}; retrying in {delay:.1f}s.")
+                self._count("retries")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            retryable, breaker_failure, retry_after = self._classify(response)
+            if breaker_failure: self.breaker.record_failure()
+            else: self.breaker.record_success()
+            if not retryable:
+                return response
+            delay = self._backoff_delay(attempt, retry_after)
+            if attempt >= max_retries or delay is None:
+                self._count("failures")
+                return response
+            print(f"WARNING: {self.name}: HTTP {response.status} on attempt {attempt + 1}; retrying in {delay:.1f}s.")
+            self._count("retries")
+            response.release()
+            await asyncio.sleep(delay)
+
+
+_resilience_registry: dict[tuple, ProviderResilience] = {}
+_resilience_registry_lock = threading.Lock()
+
+
+def get_provider_resilience(name: str, config: dict | None = None) -> ProviderResilience:
+    """Returns the shared ProviderResilience for a provider endpoint, creating it on first use."""
+    key = (name, tuple(sorted((config or {}).items())))
+    with _resilience_registry_lock:
+        resilience = _resilience_registry.get(key)
+        if resilience is None:
+            resilience = ProviderResilience(name, config)
+            _resilience_registry[key] = resilience
+        return resilience
+
+
+def get_all_resilience_stats() -> dict[str, dict]:
+    with _resilience_registry_lock:
+        return {r.name: r.stats() for r in _resilience_registry.values()}
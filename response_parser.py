@@ -0,0 +1,289 @@
+# response_parser.py
+# Single-pass parser for planner responses ("Thought: ... Action: {...}") and code fences.
+# The response is scanned once, left to right, tracking brace balance and JSON string state, so it runs in linear
+# time on any input (no regex backtracking) and can be fed streamed chunks as they arrive. A complete Action object
+# is reported as soon as its closing brace is seen, which is what the streaming early-stop hook needs.
+import json
+import re
+
+_TEXT, _AWAIT_ACTION, _ACTION, _FENCE_LANG, _FENCE = range(5)
+_CLOSERS = {"{": "}", "[": "]"}
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# Characters that can change the scanner state, per state (_FENCE_LANG is scanned character by character)
+_SKIP_RE = {_TEXT: re.compile(r"[:`]"), _AWAIT_ACTION: re.compile(r"[{\[`]"), _ACTION: re.compile(r'[{}\[\]"]'), _FENCE: re.compile(r"`")}
+_IN_STRING_RE = re.compile(r'["\\]')
+
+
+class ParsedResponse:
+    def __init__(self):
+        self.thought: str | None = None
+        self.action_json_str: str | None = None # Strictly valid JSON text of the action (re-serialized after parsing)
+        self.action: dict | list | None = None
+        self.raw_action: str | None = None      # The action text exactly as the model produced it
+        self.repairs: list[str] = []            # Which JSON defects were fixed
+        self.action_error: str | None = None    # Why the action could not be parsed, if it could not
+        self.code_blocks: list[tuple[str, str]] = [] # (language tag, content) for every ``` fence outside the action
+
+    @property
+    def code(self) -> str:
+        return "\n".join(content.strip("\n") for _, content in self.code_blocks)
+
+
+class ResponseParser:
+    """Feed chunks with feed(); call finish() once for the ParsedResponse.
+    feed() returns True once a complete Action JSON object has been received (usable as a stream stop hook)."""
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._state = _TEXT
+        self._thought_start: int | None = None
+        self._action_marker: int | None = None # Index where "Action:" starts (end of the thought)
+        self._action_start: int | None = None
+        self._action_end: int | None = None
+        self._action_fenced = False
+        self._skip_fence_close = False
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._backticks = 0
+        self._fence_open_end = 0
+        self._fence_content_start = 0
+        self._fence_lang = ""
+        self.code_blocks: list[tuple[str, str]] = []
+
+    @property
+    def action_complete(self) -> bool:
+        return self._action_end is not None
+
+    def _marker_before(self, i: int) -> tuple[str | None, int]:
+        """('thought' | 'action', start index) if the ':' at text[i] ends a marker that starts a line, so prose such as
+        "my next action: read x" is not taken for one."""
+        text = self._text
+        while i > 0 and text[i - 1] in "* ": i -= 1 # "**Thought**:"
+        for marker in ("action", "thought"):
+            start = i - len(marker)
+            if start >= 0 and text[start:i].lower() == marker:
+                j = start
+                while j > 0 and text[j - 1] in "* \t": j -= 1 # "  **Action:"
+                if j == 0 or text[j - 1] == "\n":
+                    return marker, start
+        return None, i
+
+    def feed(self, chunk: str) -> bool:
+        self._text += chunk
+        text, i, n = self._text, self._pos, len(self._text)
+        while i < n:
+            state = self._state
+            # Jump straight to the next character that can change state (a plain character-class search, linear)
+            if state != _FENCE_LANG and not self._escape:
+                skip_re = _IN_STRING_RE if state == _ACTION and self._in_string else _SKIP_RE[state]
+                m = skip_re.search(text, i)
+                if m is None:
+                    if i < n: self._backticks = 0
+                    i = n
+                    break
+                if m.start() > i:
+                    self._backticks = 0
+                    i = m.start()
+            ch = text[i]
+            if state == _ACTION:
+                if self._in_string:
+                    if self._escape: self._escape = False
+                    elif ch == "\\": self._escape = True
+                    elif ch == '"': self._in_string = False
+                elif ch == '"':
+                    self._in_string = True
+                elif ch in "{[":
+                    self._stack.append(ch)
+                elif self._stack: # } or ]
+                    self._stack.pop()
+                    if not self._stack:
+                        self._action_end = i + 1
+                        self._state = _TEXT
+                        self._skip_fence_close = self._action_fenced
+            elif ch == "`":
+                self._backticks += 1
+                if self._backticks == 3:
+                    self._backticks = 0
+                    if state == _AWAIT_ACTION:
+                        self._action_fenced = True # "Action: ```json {...} ```"
+                    elif state == _FENCE or state == _FENCE_LANG:
+                        content_end = i - 2
+                        content = text[self._fence_content_start:content_end] if state == _FENCE else self._fence_lang
+                        self.code_blocks.append((self._fence_lang if state == _FENCE else "", content))
+                        self._state = _TEXT
+                    elif self._skip_fence_close:
+                        self._skip_fence_close = False
+                    else:
+                        self._state = _FENCE_LANG
+                        self._fence_open_end = i + 1
+                        self._fence_lang = ""
+            else:
+                self._backticks = 0
+                if state == _FENCE_LANG:
+                    if ch == "\n":
+                        self._fence_lang = text[self._fence_open_end:i].strip()
+                        self._fence_content_start = i + 1
+                        self._state = _FENCE
+                    elif not (ch.isalnum() or ch in "-_+. "):
+                        # Inline fence such as ```print(1)```: there is no language tag
+                        self._fence_lang = ""
+                        self._fence_content_start = self._fence_open_end
+                        self._state = _FENCE
+                elif state == _AWAIT_ACTION: # { or [
+                    self._action_start = i
+                    self._stack = [ch]
+                    self._state = _ACTION
+                elif state == _TEXT: # :
+                    marker, marker_start = self._marker_before(i)
+                    if marker == "thought" and self._thought_start is None and self._action_marker is None:
+                        self._thought_start = i + 1
+                    elif marker == "action" and self._action_marker is None:
+                        self._action_marker = marker_start
+                        self._state = _AWAIT_ACTION
+            i += 1
+        self._pos = i
+        return self._action_end is not None
+
+    def finish(self) -> ParsedResponse:
+        result = ParsedResponse()
+        text = self._text
+        if self._state == _FENCE: # Unterminated fence (e.g. cut off by max_tokens): keep what we have
+            self.code_blocks.append((self._fence_lang, text[self._fence_content_start:]))
+        result.code_blocks = list(self.code_blocks)
+
+        thought_end = self._action_marker if self._action_marker is not None else len(text)
+        if self._thought_start is not None:
+            result.thought = text[self._thought_start:thought_end].strip(" \t\r\n*")
+        elif self._action_marker is not None:
+            result.thought = text[:self._action_marker].strip() or None
+
+        if self._action_start is None:
+            if self._action_marker is not None:
+                result.action_error = "No JSON object after 'Action:'"
+            return result
+        raw = text[self._action_start:self._action_end] if self._action_end is not None else text[self._action_start:].rstrip()
+        if self._action_end is None and self._action_fenced and raw.endswith("```"):
+            raw = raw[:-3].rstrip()
+        result.raw_action = raw
+        try:
+            result.action = json.loads(raw, strict=False) # strict=False: raw newlines/tabs inside strings are fine
+            result.action_json_str = json.dumps(result.action, ensure_ascii=False)
+            return result
+        except json.JSONDecodeError:
+            pass
+        repaired, result.repairs = repair_json(raw)
+        try:
+            result.action = json.loads(repaired, strict=False)
+            result.action_json_str = json.dumps(result.action, ensure_ascii=False)
+        except json.JSONDecodeError as e:
+            result.action_error = str(e)
+        return result
+
+
+def repair_json(raw: str) -> tuple[str, list[str]]:
+    """One string-aware pass fixing common model JSON defects: single-quoted strings, Python literals, trailing
+    commas, and a truncated tail (unterminated string, unclosed braces/brackets). Returns (text, repairs made)."""
+    out: list[str] = []
+    repairs: list[str] = []
+    stack: list[str] = []
+    quote = None # '"' or "'" while inside a string
+    escape = False
+    string_start, string_end, string_is_key = 0, -1, False
+    i, n = 0, len(raw)
+    while i < n:
+        ch = raw[i]
+        if quote is not None:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+                string_end = len(out)
+            elif ch == '"' and quote == "'":
+                out.append('\\"')
+            else:
+                out.append(ch)
+            i += 1
+            continue
+        if ch == '"' or ch == "'":
+            if ch == "'" and "single-quoted strings" not in repairs: repairs.append("single-quoted strings")
+            quote = ch
+            string_start = len(out)
+            string_is_key = bool(stack) and stack[-1] == "{" and _last_significant(out) in ("{", ",")
+            out.append('"')
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+        elif ch in "}]":
+            # Drop a trailing comma before the closer
+            j = len(out) - 1
+            while j >= 0 and out[j] in " \t\r\n": j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+                if "trailing commas" not in repairs: repairs.append("trailing commas")
+            if stack: stack.pop()
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and raw[j].isalnum(): j += 1
+            word = raw[i:j]
+            if word in _PY_LITERALS:
+                word = _PY_LITERALS[word]
+                if "python literals" not in repairs: repairs.append("python literals")
+            out.append(word)
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    if quote is not None and string_is_key:
+        # Cut off inside an object key: drop the partial member
+        del out[string_start:]
+        repairs.append("truncated key")
+    elif quote is not None:
+        # Unterminated string: closing brackets the model typed at its end belong outside it ({"a": "b} -> {"a": "b"})
+        k = len(out)
+        while k > 0 and out[k - 1] in "}] \t\r\n": k -= 1
+        tail = [c for c in out[k:] if c in "}]"]
+        matched = 0
+        for closer, opener in zip(tail, reversed(stack)):
+            if _CLOSERS[opener] != closer:
+                break
+            matched += 1
+        if matched == len(tail) and tail:
+            del out[k:]
+            out.append('"')
+            out.extend(tail)
+            del stack[len(stack) - matched:]
+        else:
+            out.append('"')
+        repairs.append("unterminated string")
+    elif string_is_key and string_end == len(out):
+        del out[string_start:] # Complete key but no value
+        repairs.append("truncated key")
+    while out and out[-1] in " \t\r\n": out.pop()
+    if stack and out and out[-1] == ":":
+        out.append("null") # Cut off right after "key":
+        repairs.append("missing value")
+    if stack:
+        while out and out[-1] in " \t\r\n,": out.pop()
+        out.extend(_CLOSERS[opener] for opener in reversed(stack))
+        repairs.append("unclosed brackets")
+    return "".join(out), repairs
+
+
+def _last_significant(out: list[str]) -> str:
+    j = len(out) - 1
+    while j >= 0 and out[j] in " \t\r\n": j -= 1
+    return out[j] if j >= 0 else ""
+
+
+def parse_response(text: str) -> ParsedResponse:
+    parser = ResponseParser()
+    parser.feed(text or "")
+    return parser.finish()
@@ -0,0 +1,129 @@
+# tests/test_openrouter_stream.py
+# OpenRouterConnector SSE streaming against local stubs: the LLM emulator for real token streams, and a canned SSE
+# server for exact frame sequences (keep-alive comments, [DONE], error frames).
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from connectors import LLMUsage, OpenRouterConnector, StreamStats
+from llm_emulator import EmulatorServer, ResponseScript
+
+NO_RETRIES = {"max_retries": 0}
+
+
+def delta(text: str) -> bytes:
+    return b"data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": text}}]}).encode("utf-8") + b"\n\n"
+
+
+class CannedSSE:
+    """Answers every POST with the given SSE body, as OpenRouter would (chunked text/event-stream)."""
+    def __init__(self, frames: list[bytes]):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for frame in frames:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/api/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def connector(base_url: str) -> OpenRouterConnector:
+    return OpenRouterConnector("test-key", base_url=base_url, resilience_config=NO_RETRIES)
+
+
+def test_data_frames_are_yielded_in_order():
+    text = "def add(a, b):\n    return a + b\n"
+    with EmulatorServer(script=ResponseScript({"default_response": text})) as server:
+        chunks = list(connector(server.openrouter_base_url).stream_generate("write add", "test/model"))
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+
+
+def test_keep_alive_comments_are_skipped_and_done_ends_the_stream():
+    frames = [b": OPENROUTER PROCESSING\n\n", delta("Hel"), b": OPENROUTER PROCESSING\n\n", delta("lo"),
+              b"data: [DONE]\n\n", delta(" after done")]
+    with CannedSSE(frames) as server:
+        chunks = list(connector(server.base_url).stream_generate("hi", "test/model"))
+    assert chunks == ["Hel", "lo"]
+
+
+def test_error_frame_raises():
+    frames = [delta("partial"), b"data: " + json.dumps({"error": {"message": "upstream overloaded", "code": 502}}).encode("utf-8") + b"\n\n"]
+    with CannedSSE(frames) as server:
+        stream = connector(server.base_url).stream_generate("hi", "test/model")
+        assert next(stream) == "partial"
+        with pytest.raises(requests.exceptions.HTTPError, match="upstream overloaded"):
+            next(stream)
+
+
+def test_error_frame_in_generate_returns_an_error_and_records_it():
+    frames = [delta("partial"), b"data: " + json.dumps({"error": {"message": "upstream overloaded"}}).encode("utf-8") + b"\n\n"]
+    usage = LLMUsage("openrouter", "test/model")
+    with CannedSSE(frames) as server:
+        result = connector(server.base_url).generate("hi", "test/model", stream=True, usage=usage)
+    assert result.startswith("Error:")
+    assert "upstream overloaded" in usage.error
+
+
+def test_stop_when_cancels_the_stream_early():
+    text = "Thought: done. STOP " + "padding " * 200
+    config = {"tokens_per_second": 200}
+    with EmulatorServer(config=config, script=ResponseScript({"default_response": text})) as server:
+        usage = LLMUsage("openrouter", "test/model")
+        result = connector(server.openrouter_base_url).generate("hi", "test/model", stream=True, usage=usage,
+                                                                stop_when=lambda chunk: "STOP" in chunk)
+    assert result.endswith("STOP ")
+    assert usage.early_stopped
+    assert usage.wall_time_s < 1.0 # The full answer would take about 1s at 200 tokens/s
+
+
+def test_usage_has_time_to_first_token_and_tokens_per_second():
+    text = " ".join(f"word{i}" for i in range(20))
+    config = {"first_token_ms": 200, "tokens_per_second": 100}
+    with EmulatorServer(config=config, script=ResponseScript({"default_response": text})) as server:
+        usage = LLMUsage("openrouter", "test/model")
+        result = connector(server.openrouter_base_url).generate("hi", "test/model", stream=True, usage=usage)
+    assert result == text
+    assert usage.streamed and not usage.early_stopped
+    assert usage.time_to_first_token_s >= 0.15
+    assert usage.completion_tokens == 20 # From the usage block of the final frame
+    assert 20 < usage.tokens_per_second < 1000
+
+
+def test_stream_stats_count_chunks_without_a_usage_block():
+    with CannedSSE([delta("a"), delta("b"), delta("c"), b"data: [DONE]\n\n"]) as server:
+        stats = StreamStats()
+        chunks = list(connector(server.base_url).stream_generate("hi", "test/model", stats=stats))
+    assert chunks == ["a", "b", "c"]
+    assert stats.chunks == 3 and stats.completion_tokens is None
+    assert stats.time_to_first_token is not None
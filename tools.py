@@ -1,12 +1,32 @@
 # tools.py
+import asyncio
+import contextvars
+import copy
+import hashlib
 import json
 import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-from connectors import OpenRouterConnector, OllamaConnector # Assuming these are stable
+from typing import Callable
+from connectors import OpenRouterConnector, OllamaConnector, get_openrouter_connector, get_ollama_connector
+from connectors import AsyncOpenRouterConnector, AsyncOllamaConnector, LLMUsage
+from llm_cache import get_response_cache, make_cache_key
+from llm_routing import RoutingPolicy
+from response_parser import ResponseParser, parse_response
+from llm_schemas import get_schema, parse_and_validate
+from prompt_builder import DEFAULT_PROMPT_BUDGET_CONFIG, PromptBuilder, estimate_tokens, format_prompt_report, shorten_strings
+from code_index import CodeIndex, HashingEmbedder, chunk_text, format_code_hits, rank_chunks
+from file_cache import FileCache
+from observation_store import HANDLE_KEY, format_observation, iter_handles
 
 class FileSystemTool:
-    def __init__(self, project_base_path: Path | None = None): # Allow None for testing or if not set
+    def __init__(self, project_base_path: Path | None = None, file_cache: FileCache | None = None): # Allow None for testing or if not set
         self.project_base_path = project_base_path if project_base_path else Path(".") # Default to CWD
+        self.file_cache = file_cache # Shared with the StateManager, so each file is read and decoded once per run
 
     def _resolve_path(self, file_path_str: str) -> Path:
         path_obj = Path(file_path_str)
@@ -19,6 +39,13 @@ class FileSystemTool:
             print(f"ERROR: FileSystemTool.read_file received invalid file_path_str: {file_path_str}")
             return None
         resolved_path = self._resolve_path(file_path_str)
+        if self.file_cache is not None:
+            content = self.file_cache.get(resolved_path)
+            if content is not None:
+                print(f"INFO: FileSystemTool: Read file '{resolved_path}' ({len(content)} chars).")
+            else:
+                print(f"ERROR: FileSystemTool: File not found or could not be read: {resolved_path}")
+            return content
         try:
             if resolved_path.exists() and resolved_path.is_file():
                 content = resolved_path.read_text(encoding='utf-8')
@@ -57,22 +84,49 @@ class LLMTool:
     def __init__(self, config_data: dict):
         self.config_data = config_data
         self.openrouter_key = config_data.get("OPENROUTER_API_KEY")
+        self.openrouter_base_url = config_data.get("OPENROUTER_BASE_URL") or "https://openrouter.ai/api/v1"
         self.openrouter_site_url = config_data.get("OPENROUTER_SITE_URL")
         self.openrouter_app_name = config_data.get("OPENROUTER_REFERRER")
         self.ollama_base_url = config_data.get("OLLAMA_BASE_URL")
         self.default_model_choice = config_data.get("DEFAULT_MODEL_CHOICE")
         self.max_tokens_for_generation = int(config_data.get("MAX_TOKENS_GENERATION", 2048))
+        self.openrouter_pool_config = config_data.get("OPENROUTER_HTTP") or None
+        self.ollama_pool_config = config_data.get("OLLAMA_HTTP") or None
+        self.openrouter_resilience_config = config_data.get("OPENROUTER_RESILIENCE") or None
+        self.ollama_resilience_config = config_data.get("OLLAMA_RESILIENCE") or None
+        self.openrouter_stream = bool(config_data.get("OPENROUTER_STREAM", False))
+        self.prompt_cache_config = config_data.get("PROMPT_CACHE") or None
+        self.response_cache = get_response_cache(config_data.get("LLM_CACHE"))
+        # Called with an LLMUsage after every query_llm call (e.g. StateManager.record_llm_usage)
+        self.usage_recorder: Callable[[LLMUsage], None] | None = None
+        routing_config = config_data.get("LLM_ROUTING") or None
+        self.routing: RoutingPolicy | None = RoutingPolicy(routing_config) if routing_config else None
+        self._route_executor: ThreadPoolExecutor | None = None
+        structured_output_config = config_data.get("STRUCTURED_OUTPUT") or {}
+        self.structured_output_mode = str(structured_output_config.get("mode", "schema")).lower() # schema | json | off
+        self.structured_output_repair_attempts = int(structured_output_config.get("repair_attempts", 1))
+        self.structured_output_stats = {"calls": 0, "valid_first_try": 0, "repair_asks": 0, "repaired": 0, "failed": 0}
+        self._structured_stats_lock = threading.Lock()
+        self.last_prompt_report: dict | None = None # Per-section token usage of the last budgeted prompt
+        self.prompt_budget_config = dict(DEFAULT_PROMPT_BUDGET_CONFIG)
+        self.prompt_budget_config.update({k: v for k, v in (config_data.get("PROMPT_BUDGET") or {}).items() if v is not None})
+        self.code_index: CodeIndex | None = None # Project retrieval index (see code_index.open_code_index); set by the agent
+        self._retrieval_memo: dict[tuple, list[dict]] = {}
         
         self.openrouter_connector: OpenRouterConnector | None = None
         self.ollama_connector: OllamaConnector | None = None
         
         if self.openrouter_key:
-            self.openrouter_connector = OpenRouterConnector(
-                api_key=self.openrouter_key, site_url=self.openrouter_site_url, app_name=self.openrouter_app_name
+            self.openrouter_connector = get_openrouter_connector(
+                api_key=self.openrouter_key, base_url=self.openrouter_base_url, site_url=self.openrouter_site_url, app_name=self.openrouter_app_name,
+                pool_config=self.openrouter_pool_config, resilience_config=self.openrouter_resilience_config,
+                prompt_cache_config=self.prompt_cache_config
             )
         if self.ollama_base_url or (self.default_model_choice and str(self.default_model_choice).startswith("ollama/")):
             self.ollama_base_url = self.ollama_base_url or "http://localhost:11434"
-            self.ollama_connector = OllamaConnector(base_url=self.ollama_base_url)
+            self.ollama_connector = get_ollama_connector(base_url=self.ollama_base_url, pool_config=self.ollama_pool_config,
+                                                         resilience_config=self.ollama_resilience_config,
+                                                         prompt_cache_config=self.prompt_cache_config)
 
     def _get_client_and_model(self, model_choice_str: str | None) -> tuple[OpenRouterConnector | OllamaConnector | None, str | None]:
         effective_model_choice = model_choice_str or self.default_model_choice
@@ -99,7 +153,9 @@ class LLMTool:
             if not self.ollama_connector:
                 self.ollama_base_url = self.ollama_base_url or "http://localhost:11434"
                 print(f"INFO: LLMTool: Initializing Ollama connector on demand with base_url: {self.ollama_base_url}")
-                self.ollama_connector = OllamaConnector(base_url=self.ollama_base_url)
+                self.ollama_connector = get_ollama_connector(base_url=self.ollama_base_url, pool_config=self.ollama_pool_config,
+                                                             resilience_config=self.ollama_resilience_config,
+                                                             prompt_cache_config=self.prompt_cache_config)
             model_name_to_use = model_name_from_parts or self.config_data.get("OLLAMA_DEFAULT_MODEL_NAME_ONLY", "mistral")
             return self.ollama_connector, model_name_to_use
         
@@ -108,10 +164,110 @@ class LLMTool:
             if not self.ollama_connector:
                  self.ollama_base_url = self.ollama_base_url or self.config_data.get("OLLAMA_BASE_URL", "http://localhost:11434")
                  print(f"INFO: LLMTool: Initializing Ollama connector on demand (direct model name) with base_url: {self.ollama_base_url}")
-                 self.ollama_connector = OllamaConnector(base_url=self.ollama_base_url)
+                 self.ollama_connector = get_ollama_connector(base_url=self.ollama_base_url, pool_config=self.ollama_pool_config,
+                                                              resilience_config=self.ollama_resilience_config,
+                                                              prompt_cache_config=self.prompt_cache_config)
             return self.ollama_connector, effective_model_choice
 
-    def query_llm(self, prompt: str, model_choice: str, system_message: str = None, max_tokens: int | None = None, temperature=0.5) -> str:
+    def _cache_get(self, cache_key: str) -> str | None:
+        # A cache that cannot be read (e.g. "database is locked" with several agents on one file) only costs a miss
+        try:
+            return self.response_cache.get(cache_key)
+        except sqlite3.Error as e:
+            print(f"WARNING: LLMTool: Response cache lookup failed, continuing uncached: {e}")
+            return None
+
+    def _cache_put(self, cache_key: str, response_text: str, provider: str, model: str):
+        try:
+            self.response_cache.put(cache_key, response_text, provider=provider, model=model)
+        except sqlite3.Error as e:
+            print(f"WARNING: LLMTool: Response cache store failed, continuing uncached: {e}")
+
+    def _cache_key_for(self, client, model_name: str, system_message: str | None, prompt: str, temperature: float,
+                       max_tokens: int, use_cache: bool, response_format: dict | str | None = None) -> str | None:
+        """Response-cache key for this call, or None if the call should bypass the cache."""
+        if not use_cache or self.response_cache is None or not self.response_cache.is_cacheable(temperature):
+            return None
+        return make_cache_key(client.resilience.name, model_name, system_message, prompt, temperature, max_tokens, response_format)
+
+    def query_llm(self, prompt: str, model_choice: str, system_message: str = None, max_tokens: int | None = None, temperature=0.5,
+                  stop_when: Callable[[str], bool] | None = None, use_cache: bool = True,
+                  stop_when_factory: Callable[[], Callable[[str], bool]] | None = None,
+                  response_format: dict | str | None = None, cache_if: Callable[[str], bool] | None = None,
+                  stable_prefix_chars: int | None = None) -> str:
+        """stop_when: optional early-cancel hook, called with each streamed chunk (providers that support streaming).
+        stop_when_factory: alternative to stop_when for stateful hooks; every routed attempt gets a fresh hook from it.
+        use_cache=False bypasses the persistent response cache (e.g. when sampling diversity is wanted).
+        response_format: structured output request ("json" or {"name", "schema"}), see query_llm_json.
+        cache_if: responses for which it returns False are not stored in the response cache (e.g. invalid JSON).
+        stable_prefix_chars: how much of the prompt is identical from call to call (provider prompt-cache breakpoint).
+        With a routing policy configured, failed calls fall back to the next model and slow calls may be hedged."""
+        effective_model_choice = model_choice or self.default_model_choice
+        route = self.routing.route_for(effective_model_choice) if self.routing and effective_model_choice else [model_choice]
+        if len(route) == 1:
+            hook = stop_when_factory() if stop_when_factory else stop_when
+            return self._query_model(prompt, model_choice, system_message, max_tokens, temperature, hook, use_cache,
+                                     response_format=response_format, cache_if=cache_if, stable_prefix_chars=stable_prefix_chars)
+        return self._query_routed(route, prompt, system_message, max_tokens, temperature, stop_when, stop_when_factory, use_cache,
+                                  response_format=response_format, cache_if=cache_if, stable_prefix_chars=stable_prefix_chars)
+
+    def _query_routed(self, route: list[str], prompt: str, system_message: str | None, max_tokens: int | None, temperature: float,
+                      stop_when: Callable[[str], bool] | None, stop_when_factory: Callable[[], Callable[[str], bool]] | None,
+                      use_cache: bool, response_format: dict | str | None = None, cache_if: Callable[[str], bool] | None = None,
+                      stable_prefix_chars: int | None = None) -> str:
+        """Tries the models in `route` in order. Each attempt runs on a worker thread; when hedging is enabled and the
+        newest attempt has not answered within its latency percentile, the next model is fired alongside it.
+        The first non-error answer wins and the remaining streams are cancelled through their stop hook."""
+        policy = self.routing
+        policy.count("routed_calls")
+        if self._route_executor is None:
+            self._route_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-route")
+        cancelled = threading.Event()
+
+        def hook_for_attempt():
+            # A hook makes the call stream, so only hedged attempts (which may need cancelling) or callers that asked
+            # for one get it; fallback-only routes run one attempt at a time and honour openrouter.stream
+            inner = stop_when_factory() if stop_when_factory else stop_when
+            if not policy.hedge_enabled:
+                return inner
+            return lambda chunk: cancelled.is_set() or (inner is not None and inner(chunk))
+
+        pending = {}
+        next_index = 0
+        last_error = None
+        latest_model, pending_timed_out = route[0], False
+        while pending or next_index < len(route):
+            if not pending or (policy.hedge_enabled and next_index < len(route) and pending_timed_out):
+                model_choice = route[next_index]
+                role = "primary" if next_index == 0 else ("hedge" if pending else "fallback")
+                if role != "primary":
+                    print(f"INFO: LLMTool.query_llm: {'Hedging with' if role == 'hedge' else 'Falling back to'} {model_choice}.")
+                    policy.count("hedges_fired" if role == "hedge" else "fallbacks_used")
+                # Run in a copy of the caller's context, so usage is recorded against the caller's sub-task
+                future = self._route_executor.submit(contextvars.copy_context().run, self._query_model, prompt,
+                                                     model_choice, system_message, max_tokens, temperature, hook_for_attempt(),
+                                                     use_cache, role, cancelled, response_format=response_format,
+                                                     cache_if=cache_if, stable_prefix_chars=stable_prefix_chars)
+                pending[future] = (model_choice, role)
+                next_index += 1
+                latest_model = model_choice
+            can_hedge = policy.hedge_enabled and next_index < len(route)
+            done, _ = wait(pending, timeout=policy.hedge_delay(latest_model) if can_hedge else None, return_when=FIRST_COMPLETED)
+            pending_timed_out = not done
+            for future in done:
+                model_choice, role = pending.pop(future)
+                response_text = future.result()
+                if response_text and not response_text.startswith("Error:"):
+                    cancelled.set() # Losing hedged streams stop at their next chunk
+                    if role == "hedge": policy.count("hedges_won")
+                    return response_text
+                last_error = response_text
+        return last_error or f"Error: All routed models failed: {', '.join(route)}"
+
+    def _query_model(self, prompt: str, model_choice: str, system_message: str = None, max_tokens: int | None = None, temperature=0.5,
+                     stop_when: Callable[[str], bool] | None = None, use_cache: bool = True, route: str = "primary",
+                     cancelled: threading.Event | None = None, response_format: dict | str | None = None,
+                     cache_if: Callable[[str], bool] | None = None, stable_prefix_chars: int | None = None) -> str:
         client, model_name = self._get_client_and_model(model_choice)
         if client is None or model_name is None:
             err_msg = f"Error: Could not get LLM client or model name for '{model_choice}'. Client: {client}, ModelName: {model_name}"
@@ -119,24 +275,191 @@ class LLMTool:
             return err_msg
         
         effective_max_tokens = max_tokens if max_tokens is not None else self.max_tokens_for_generation
+        usage = LLMUsage(provider=client.resilience.name, model=model_choice or model_name)
+        usage.route = route
+        started_at = time.perf_counter()
+        cache_key = self._cache_key_for(client, model_name, system_message, prompt, temperature, effective_max_tokens, use_cache,
+                                        response_format)
+        if cache_key is not None:
+            cached_response = self._cache_get(cache_key)
+            if cached_response is not None:
+                print(f"INFO: LLMTool.query_llm: Response cache hit for {model_choice}.")
+                usage.cached = True
+                usage.wall_time_s = time.perf_counter() - started_at
+                self._record_usage(usage)
+                return cached_response
         
         try:
             # Ensure model_name passed to generate is just the name, not "provider/name" if client handles provider
             # However, OpenRouterConnector expects the full "author/model" string.
             # OllamaConnector expects just the model tag.
             # _get_client_and_model should return the correct form of model_name for the specific client.
-            return client.generate(prompt, model_name, system_message, effective_max_tokens, temperature)
+            stream = stop_when is not None or (isinstance(client, OpenRouterConnector) and self.openrouter_stream)
+            response_text = client.generate(prompt, model_name, system_message, effective_max_tokens, temperature, stream=stream,
+                                            stop_when=stop_when, usage=usage, response_format=response_format,
+                                            stable_prefix_chars=stable_prefix_chars)
         except Exception as e:
             print(f"ERROR: LLMTool.query_llm: Exception during client.generate for {model_name} (using {model_choice}): {e}")
             # import traceback; traceback.print_exc() # Uncomment for deeper debug
+            usage.error = str(e)
+            usage.wall_time_s = time.perf_counter() - started_at
+            self._record_usage(usage)
+            if self.routing is not None: self.routing.record_result(usage.model, usage.wall_time_s, ok=False)
             return f"Error: LLM query failed for {model_name}. Details: {str(e)}"
+        ok = bool(response_text) and not response_text.startswith("Error:")
+        if cancelled is not None and cancelled.is_set():
+            usage.discarded = True # Another routed attempt already answered; a cut-short stream says nothing about latency
+        elif self.routing is not None:
+            self.routing.record_result(usage.model, usage.wall_time_s, ok=ok)
+        self._record_usage(usage)
+        if cache_key is not None and ok and not usage.discarded and (cache_if is None or cache_if(response_text)):
+            self._cache_put(cache_key, response_text, client.resilience.name, model_name)
+        return response_text
+
+    def _response_format_for(self, schema_name: str) -> dict | str | None:
+        if self.structured_output_mode == "schema":
+            return {"name": schema_name, "schema": get_schema(schema_name)}
+        if self.structured_output_mode == "json":
+            return "json"
+        return None
+
+    def _count_structured(self, key: str):
+        with self._structured_stats_lock:
+            self.structured_output_stats[key] += 1
+
+    def _json_query_options(self, schema_name: str) -> dict:
+        """query_llm keyword arguments for a structured query: the provider output format, and no caching of invalid output."""
+        return {"response_format": self._response_format_for(schema_name),
+                "cache_if": lambda text: parse_and_validate(text, schema_name)[0] is not None}
+
+    def query_llm_json(self, prompt: str, model_choice: str, schema_name: str, system_message: str = None,
+                       max_tokens: int | None = None, temperature=0.2, stable_prefix_chars: int | None = None) -> tuple[object | None, str]:
+        """Asks for JSON matching a registered schema (see llm_schemas) using the provider's structured-output mode,
+        validates it locally and, if it is malformed, re-asks once with only the bad output and the problems found.
+        Returns (parsed value or None, last raw response)."""
+        self._count_structured("calls")
+        response_text = self.query_llm(prompt, model_choice, system_message=system_message, max_tokens=max_tokens, temperature=temperature,
+                                       stable_prefix_chars=stable_prefix_chars, **self._json_query_options(schema_name))
+        return self._validated_json(response_text, model_choice, schema_name, max_tokens)
+
+    def _validated_json(self, response_text: str, model_choice: str, schema_name: str, max_tokens: int | None) -> tuple[object | None, str]:
+        """Second half of query_llm_json: validates a response to a structured query and asks for repairs if needed."""
+        if not response_text or response_text.startswith("Error:"):
+            self._count_structured("failed")
+            return None, response_text
+        value, errors = parse_and_validate(response_text, schema_name)
+        if value is not None:
+            self._count_structured("valid_first_try")
+            return value, response_text
+
+        for _ in range(self.structured_output_repair_attempts):
+            print(f"WARNING: LLMTool.query_llm_json: '{schema_name}' output failed validation ({'; '.join(errors[:3])}). Asking for a repair.")
+            self._count_structured("repair_asks")
+            # Cheap re-ask: just the schema, the problems and the bad output, not the original (large) context
+            repair_prompt = (f"Your previous reply did not match the required JSON schema.\n"
+                             f"Problems: {json.dumps(errors[:10])}\n"
+                             f"Schema: {json.dumps(get_schema(schema_name), separators=(',', ':'))}\n"
+                             f"Previous reply:\n{response_text[:6000]}\n\n"
+                             f"Return ONLY the corrected JSON, keeping all content that was already valid.")
+            response_text = self.query_llm(repair_prompt, model_choice, system_message="You fix JSON documents so they match a JSON schema. Output JSON only.",
+                                           max_tokens=max_tokens, temperature=0.0, **self._json_query_options(schema_name))
+            if not response_text or response_text.startswith("Error:"):
+                break
+            value, errors = parse_and_validate(response_text, schema_name)
+            if value is not None:
+                self._count_structured("repaired")
+                return value, response_text
+        print(f"ERROR: LLMTool.query_llm_json: No valid '{schema_name}' JSON from {model_choice}: {'; '.join(errors[:3])}")
+        self._count_structured("failed")
+        return None, response_text
+
+    def get_structured_output_stats(self) -> dict:
+        with self._structured_stats_lock:
+            return dict(self.structured_output_stats)
+
+    def prompt_budget_for(self, model_choice: str | None) -> int:
+        """Input token budget (system + user prompt) for a model; per-model entries override the default."""
+        per_model = self.prompt_budget_config.get("models") or {}
+        return int(per_model.get(model_choice or self.default_model_choice, self.prompt_budget_config["default_tokens"]))
+
+    def relevant_code(self, query: str, top_k: int | None = None, paths: list[str] | None = None) -> list[dict]:
+        """Top-k chunks from the project index for a query ([] without an index). Results are memoized per run, so
+        every plan step of a sub-task sees the same chunks."""
+        if self.code_index is None or not query:
+            return []
+        key = (query, top_k, tuple(paths) if paths is not None else None)
+        if key not in self._retrieval_memo:
+            self._retrieval_memo[key] = self.code_index.search(query, top_k, paths)
+        return self._retrieval_memo[key]
+
+    def get_routing_stats(self) -> dict | None:
+        return self.routing.stats() if self.routing is not None else None
+
+    def _record_usage(self, usage: LLMUsage):
+        if self.usage_recorder is not None:
+            try:
+                self.usage_recorder(usage)
+            except Exception as e:
+                print(f"WARNING: LLMTool: usage recorder failed: {e}")
+
+    def get_cache_stats(self) -> dict | None:
+        if self.response_cache is None:
+            return None
+        try:
+            return self.response_cache.get_stats()
+        except sqlite3.Error as e:
+            print(f"WARNING: LLMTool: Response cache stats unavailable: {e}")
+            return None
+
+    def get_resilience_stats(self) -> dict[str, dict]:
+        """Retry / throttling / circuit-breaker counters for the providers this tool talks to."""
+        stats = {}
+        for connector in (self.openrouter_connector, self.ollama_connector):
+            if connector is not None:
+                stats[connector.resilience.name] = connector.resilience.stats()
+        return stats
+
+    def query_llm_many(self, queries: list[dict], max_concurrency: int = 8) -> list[str]:
+        """Synchronous wrapper: runs several query_llm calls concurrently and returns results in input order.
+        Each query is a dict of query_llm keyword arguments (prompt, model_choice, system_message, ...)."""
+        async_tool = AsyncLLMTool(self.config_data, llm_tool=self)
+        async def _run():
+            try:
+                return await async_tool.gather(queries, max_concurrency=max_concurrency)
+            finally:
+                await async_tool.aclose()
+        return asyncio.run(_run())
+
+    # Generation methods whose LLM queries generate_many can issue together through the async connectors
+    BATCHED_GENERATION_METHODS = ("generate_code_snippet", "generate_multi_part_code_solution")
+
+    def generate_many(self, calls: list[tuple[str, dict]], max_concurrency: int = 4) -> list:
+        """Runs several generation method calls, given as (method name, keyword arguments), with their LLM queries in
+        flight at the same time (query_llm_many). Returns what each method would have returned, in input order.
+        Raises TypeError/ValueError for a call that does not fit its method, before any query is made."""
+        queries, finishers = [], []
+        for method_name, kwargs in calls:
+            if method_name == "generate_code_snippet":
+                queries.append(self._code_snippet_query(**kwargs))
+                finishers.append(self._extract_code_from_llm_response)
+            elif method_name == "generate_multi_part_code_solution":
+                query = self._multi_part_query(**kwargs)
+                queries.append(dict(query, **self._json_query_options("change_directives")))
+                finishers.append(lambda text, model=query["model_choice"]: self._multi_part_directives(
+                    *self._validated_json(text, model, "change_directives", None)))
+            else:
+                raise ValueError(f"LLMTool.generate_many: '{method_name}' cannot be batched.")
+        for method_name, _ in calls:
+            if method_name == "generate_multi_part_code_solution":
+                self._count_structured("calls")
+        responses = self.query_llm_many(queries, max_concurrency=max_concurrency) if queries else []
+        return [finish(text) for finish, text in zip(finishers, responses)]
 
     def _extract_code_from_llm_response(self, llm_response: str) -> list[str]:
         if not llm_response: return []
-        code_blocks = re.findall(r"```(?:[a-zA-Z0-9\-\_]*\n)?([\s\S]*?)```", llm_response, re.DOTALL)
-        if code_blocks:
-            full_code = "\n".join([block.strip('\n') for block in code_blocks])
-            return full_code.splitlines()
+        parsed = parse_response(llm_response)
+        if parsed.code_blocks:
+            return parsed.code.splitlines()
         lines = llm_response.splitlines()
         cleaned_lines = []
         skip_patterns = [
@@ -157,15 +480,17 @@ class LLMTool:
         return cleaned_lines
 
     def generate_code_snippet(self, user_request: str, model_choice: str, original_code_snippet: str | None = None, surrounding_context: str | None = None) -> list[str]:
+        generated_text = self.query_llm(**self._code_snippet_query(user_request, model_choice, original_code_snippet, surrounding_context))
+        return self._extract_code_from_llm_response(generated_text)
+
+    def _code_snippet_query(self, user_request: str, model_choice: str, original_code_snippet: str | None = None, surrounding_context: str | None = None) -> dict:
         system_message = "You are a precise code generation assistant... (same as before)"
         prompt = f"User Request: {user_request}\n\n"
         # ... (prompt construction as before) ...
         if original_code_snippet: prompt += f"Original Code Snippet (to be replaced/refactored):\n```\n{original_code_snippet}\n```\n\n"
         if surrounding_context: prompt += f"Surrounding Code Context (for style and reference, do not repeat this context in your output):\n```\n{surrounding_context}\n```\n\n"
         prompt += "New Code Snippet (output only the code, without any surrounding text or explanation):"
-
-        generated_text = self.query_llm(prompt, model_choice, system_message=system_message, temperature=0.2)
-        return self._extract_code_from_llm_response(generated_text)
+        return {"prompt": prompt, "model_choice": model_choice, "system_message": system_message, "temperature": 0.2}
 
     def generate_json_block_identifier(self, user_block_description: str, file_context_snippet: str, model_choice: str) -> dict | None:
         system_message = """You are an expert in identifying code blocks... (same as before)"""
@@ -173,31 +498,17 @@ class LLMTool:
         prompt += f"Snippet of the file content (for context):\n```\n{file_context_snippet}\n```\n"
         prompt += "Generate the JSON block identifier object (JSON only):"
 
-        response_str = self.query_llm(prompt, model_choice, system_message=system_message, temperature=0.1, max_tokens=600) # Increased max_tokens
-        
-        if not response_str or response_str.startswith("Error:"):
-            print(f"ERROR: LLMTool.generate_json_block_identifier: LLM query failed: {response_str}")
+        parsed_json, response_str = self.query_llm_json(prompt, model_choice, "block_identifier", system_message=system_message,
+                                                        max_tokens=600, temperature=0.1)
+        if parsed_json is None:
+            print(f"ERROR: LLM failed to generate valid JSON for block identifier. LLM Response was:\n---\n{response_str}\n---")
             return None
-
-        response_str_cleaned = response_str.strip()
-        # ... (cleaning and parsing logic as before) ...
-        if response_str_cleaned.startswith("```json"): response_str_cleaned = response_str_cleaned[len("```json"):]
-        if response_str_cleaned.startswith("```"): response_str_cleaned = response_str_cleaned[len("```"):]
-        if response_str_cleaned.endswith("```"): response_str_cleaned = response_str_cleaned[:-len("```")]
-        response_str_cleaned = response_str_cleaned.strip()
-        try:
-            parsed_json = json.loads(response_str_cleaned)
-            if "type" not in parsed_json: raise ValueError("Generated JSON missing 'type' field.")
-            print(f"INFO: LLM generated block identifier: {json.dumps(parsed_json, indent=2)}")
-            return parsed_json
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"ERROR: LLM failed to generate valid JSON for block identifier. Error: {e}")
-            print(f"LLM Response (cleaned) was:\n---\n{response_str_cleaned}\n---"); return None
+        print(f"INFO: LLM generated block identifier: {json.dumps(parsed_json, indent=2)}")
+        return parsed_json
 
 
-    def generate_plan_step(self, current_state: 'StateManager') -> tuple[str | None, str | None]:
-        planning_model = current_state.mode_config.get('planning_model', 'ollama/mistral:7b')
-        
+    def plan_step_system_prompt(self, structured: bool) -> str:
+        """Static for a whole run (it depends only on the output mode), so providers can cache its prefill."""
         system_prompt = """You are an AI assistant driving a ReAct loop.
 Your goal is to complete sub-tasks for modifying code.
 1. First, provide your 'thought' process (between 1-3 sentences) on how to achieve the current sub-task.
@@ -205,12 +516,11 @@ Your goal is to complete sub-tasks for modifying code.
    Action JSON format: {"tool_name": "ToolClass.method_name", "arguments": {"arg1": "val1", ...}}
    OR {"tool_name": "finish_sub_task", "result": {"status": "success" | "failure", "message": "...", "directives": [...]}}
    OR {"tool_name": "RequestClarificationTool.request_clarification", "arguments": {"question_for_user": "Your question"}}
+   OR a JSON array of independent tool calls that run together in one step, e.g. to read several files at once:
+   [{"tool_name": "FileSystemTool.read_file", "arguments": {...}}, {"tool_name": "FileSystemTool.read_file", "arguments": {...}}]
+   (finish_sub_task and request_clarification cannot be part of an array)
 
-Respond ONLY with the following structure, ensuring valid JSON for the action part:
-Thought: [Your thought process here]
-Action: [Your JSON action object here]
-
-Do NOT include any other text before "Thought:" or after the "Action:" JSON. The Action JSON must be valid and complete.
+{response_structure}
 Tool Argument Details:
 - FileSystemTool.read_file: needs {"file_path_str": "relative/path/to/file.ext"}
 - CodeAnalysisTool.get_code_structure: needs {"file_content": "content_string_from_cache", "file_type": "python|html|css|etc."}
@@ -224,59 +534,144 @@ Important Notes:
 - If `File Cache Summary` shows a file's content, use that content for other tools (like `CodeAnalysisTool.get_code_structure` or as context for generation). Do not read it again unless necessary.
 - Ensure all string values within the JSON action are properly quoted (e.g. "value"). File paths should be strings.
 """
-        history_for_prompt = current_state.get_history_for_sub_task(current_state.current_sub_task_id)
-        if len(history_for_prompt) > 2: history_for_prompt = history_for_prompt[-2:] # Limit history further
-        
-        file_cache_summary = {}
+        if structured:
+            response_structure = """Respond ONLY with one JSON object of this shape:
+{"thought": "Your thought process here", "action": {...your action object...}}"""
+        else:
+            response_structure = """Respond ONLY with the following structure, ensuring valid JSON for the action part:
+Thought: [Your thought process here]
+Action: [Your JSON action object here]
+
+Do NOT include any other text before "Thought:" or after the "Action:" JSON. The Action JSON must be valid and complete."""
+        return system_prompt.replace("{response_structure}", response_structure)
+
+    def build_plan_step_prompt(self, current_state: 'StateManager', planning_model: str, system_prompt: str,
+                               structured: bool) -> tuple[str, dict]:
+        """The planner's user prompt and its budget report. Layout is prefix-cache friendly: everything that stays the
+        same for every iteration of a sub-task (goal, sub-task, tool list, retrieved code) comes first, then the history, which only grows
+        at its end, then the short file-cache summary and the content of the latest stored results, so consecutive prompts share a
+        byte-identical prefix."""
+        history_steps = int(self.prompt_budget_config["history_steps"])
+        max_field_chars = int(self.prompt_budget_config["max_field_chars"])
+        history = current_state.get_history_for_sub_task(current_state.current_sub_task_id)
+        # The window start moves by half a window at a time instead of one step per iteration, so the shown history
+        # (and everything before it) stays a stable prefix between moves.
+        stride = max(history_steps // 2, 1)
+        window_start = max(len(history) - history_steps, 0)
+        window_start -= window_start % stride
+        history_items = [shorten_strings(step, max_field_chars) for step in history[window_start:]]
+
+        # History holds handles for large results; the latest ones are shown in full if the budget has room left
+        store = current_state.observations
+        expand_steps = int(store.config["expand_recent_steps"])
+        observation_items, seen_handles = [], set()
+        for step in (history[window_start:][-expand_steps:] if expand_steps > 0 else []):
+            for handle in iter_handles(step):
+                if handle[HANDLE_KEY] in seen_handles:
+                    continue
+                seen_handles.add(handle[HANDLE_KEY])
+                try:
+                    observation_items.append(format_observation(handle, store.get(handle), int(store.config["expand_max_chars"])))
+                except KeyError:
+                    pass
+
+        if not history:
+            # First step of a sub-task: show the sub-task's files that are already cached (e.g. prefetched), so the
+            # planner can go straight to generation instead of reading them one by one
+            for fp in current_state.get_current_sub_task_files():
+                if fp in current_state.file_cache:
+                    content = current_state.file_cache.get(fp)
+                    if content:
+                        cut = int(store.config["expand_max_chars"])
+                        observation_items.append(f"[file {fp}]\n{content if len(content) <= cut else content[:cut] + '...'}")
+
+        file_cache_items = []
         for fp, content in current_state.file_cache.items():
-            file_cache_summary[fp] = f"Exists in cache. Length: {len(content) if content else 0}. Snippet: {str(content)[:80]}..." if content else "Exists in cache (content is None - read failed or not found)."
+            file_cache_items.append({"path": fp, "length": len(content), "snippet": content[:80]} if content
+                                    else {"path": fp, "status": "read failed or not found"})
+
+        relevant_chunks = self.relevant_code(f"{current_state.plan.get('overall_goal', '')}\n{current_state.get_current_sub_task_description()}")
+        chunk_chars = int(self.code_index.config["prompt_chunk_chars"]) if self.code_index is not None else 0
 
-        prompt = f"Overall Goal: {current_state.plan.get('overall_goal', 'N/A')}\n"
-        prompt += f"Current Sub-task ID '{current_state.current_sub_task_id}': {current_state.get_current_sub_task_description()}\n"
-        prompt += f"History for this sub-task (last {len(history_for_prompt)} steps): {json.dumps(history_for_prompt, indent=2)}\n"
-        prompt += f"File Cache Summary: {json.dumps(file_cache_summary, indent=2)}\n"
-        prompt += f"Available tools: [FileSystemTool.read_file, LLMTool.generate_code_snippet, LLMTool.generate_multi_part_code_solution, CodeAnalysisTool.get_code_structure, RequestClarificationTool.request_clarification, finish_sub_task]\n"
-        prompt += "Provide your Thought and Action (Thought: ... Action: {JSON...}):"
+        # Budget is handed out goal/tools -> sub-task -> relevant code -> recent actions -> cache summary; item sections
+        # lose their oldest (history, cache) or lowest-ranked (code) entries first
+        builder = PromptBuilder(self.prompt_budget_for(planning_model), reserved_tokens=estimate_tokens(system_prompt))
+        builder.add_section("goal", f"Overall Goal: {current_state.plan.get('overall_goal', 'N/A')}", priority=0, required=True, stable=True)
+        builder.add_section("sub_task", f"Current Sub-task ID '{current_state.current_sub_task_id}': {current_state.get_current_sub_task_description()}",
+                            priority=1, required=True, stable=True)
+        builder.add_section("tools", "Available tools: [FileSystemTool.read_file, LLMTool.generate_code_snippet, LLMTool.generate_multi_part_code_solution, CodeAnalysisTool.get_code_structure, RequestClarificationTool.request_clarification, finish_sub_task]",
+                            priority=0, required=True, stable=True)
+        if relevant_chunks:
+            builder.add_items_section("relevant_code", "Relevant code from the project index (read a file for its full content):\n",
+                                      relevant_chunks, priority=2, render=lambda hit: format_code_hits([hit], chunk_chars),
+                                      newest_last=False, stable=True)
+        if history_items:
+            builder.add_items_section("recent_actions", "History for this sub-task (oldest first, one JSON step per line):\n",
+                                      history_items, priority=3)
+        else:
+            builder.add_section("recent_actions", "History for this sub-task: (none yet)", priority=3)
+        if file_cache_items:
+            builder.add_items_section("file_cache", "File Cache Summary (one JSON entry per line):\n", file_cache_items, priority=4)
+        else:
+            builder.add_section("file_cache", "File Cache Summary: (empty)", priority=4)
+        if observation_items and not history:
+            builder.add_items_section("observations", "Content of this sub-task's files (already read, no need to read them again):\n",
+                                      observation_items, priority=5, render=str)
+        elif observation_items:
+            builder.add_items_section("observations", f"Content of the latest stored results (history refers to them by {HANDLE_KEY} handle):\n",
+                                      observation_items, priority=5, render=str)
+        builder.add_section("instructions", "Provide your thought and action as JSON ({\"thought\": ..., \"action\": {...}}):" if structured
+                            else "Provide your Thought and Action (Thought: ... Action: {JSON...}):", priority=0, required=True)
+        return builder.build()
 
-        print(f"DEBUG LLMTool.generate_plan_step: Prompting {planning_model} for thought and action...")
+    def generate_plan_step(self, current_state: 'StateManager') -> tuple[str | None, str | None]:
+        planning_model = current_state.get_model('planning_model') or 'ollama/mistral:7b' # Budget tier or the mode's
+        
+        structured = self.structured_output_mode != "off"
+        system_prompt = self.plan_step_system_prompt(structured)
+        prompt, prompt_report = self.build_plan_step_prompt(current_state, planning_model, system_prompt, structured)
+        self.last_prompt_report = prompt_report
+
+        print(f"DEBUG LLMTool.generate_plan_step: Prompting {planning_model} for thought and action, prompt {format_prompt_report(prompt_report)}")
         # print(f"--- Plan Step Prompt (to {planning_model}) ---\nSYSTEM:\n{system_prompt}\nUSER:\n{prompt}\n--- End Plan Step Prompt ---")
         
-        response_text = self.query_llm(
-            prompt, planning_model, system_message=system_prompt, 
-            max_tokens=current_state.mode_config.get('max_tokens_generation', 1500), temperature=0.25 # Slightly lower temp
-        )
+        max_tokens = current_state.mode_config.get('max_tokens_generation', 1500)
+        if structured:
+            plan_step, response_text = self.query_llm_json(prompt, planning_model, "plan_step", system_message=system_prompt,
+                                                           max_tokens=max_tokens, temperature=0.25,
+                                                           stable_prefix_chars=prompt_report["stable_prefix_chars"])
+            if plan_step is not None:
+                thought, action_json_str = plan_step["thought"], json.dumps(plan_step["action"], ensure_ascii=False)
+                print(f"LLMTool.generate_plan_step -> Thought: {thought}")
+                print(f"LLMTool.generate_plan_step -> Action JSON str: {action_json_str}")
+                return thought, action_json_str
+        else:
+            response_text = self.query_llm(
+                prompt, planning_model, system_message=system_prompt, 
+                max_tokens=max_tokens, temperature=0.25, # Slightly lower temp
+                stop_when_factory=lambda: ResponseParser().feed, # Stop streaming once the Action JSON is complete
+                stable_prefix_chars=prompt_report["stable_prefix_chars"]
+            )
 
         if not response_text or response_text.startswith("Error:"):
             print(f"ERROR: LLMTool.generate_plan_step: LLM query failed or returned error: {response_text}")
             return f"LLM query for plan step failed: {response_text}", None
 
-        thought = "Could not parse thought."
-        action_json_str = None # Initialize to None
-
-        # Try to parse "Thought: ... Action: {JSON...}" structure
-        # Make regex more robust to variations in whitespace and ensure DOTALL for thought
-        thought_action_match = re.search(r"Thought:\s*(.*?)(?:\n\s*Action:\s*(\{[\s\S]*?\})\s*$|\Z)", response_text, re.DOTALL | re.IGNORECASE)
-
-        if thought_action_match:
-            thought = thought_action_match.group(1).strip()
-            if thought_action_match.group(2): # If Action JSON part was captured
-                action_json_str_candidate = thought_action_match.group(2).strip()
-                # Attempt to fix common LLM JSON errors (e.g., missing trailing quote on last string value)
-                action_json_str_candidate = re.sub(r'(:\s*"[^"]*?[^"\\])\s*(\}\s*)$', r'\1"\2', action_json_str_candidate)
-                action_json_str_candidate = re.sub(r'(:\s*"[^"]*?[^"\\])\s*(,\s*".*)$', r'\1"\2', action_json_str_candidate)
-                try:
-                    json.loads(action_json_str_candidate) 
-                    action_json_str = action_json_str_candidate # Valid JSON
-                except json.JSONDecodeError as e:
-                    print(f"ERROR: LLMTool.generate_plan_step: Action part looked like JSON but failed to parse: {e}")
-                    print(f"Problematic Action JSON string from LLM (after attempted fix): {action_json_str_candidate}")
-                    thought += f" (Self-correction note: Previous LLM Action was not valid JSON: '{action_json_str_candidate[:100]}...')"
-                    # action_json_str remains None
-        else: # Could not parse "Thought: ... Action: ..." structure, treat whole response as thought.
+        parsed = parse_response(response_text)
+        action_json_str = parsed.action_json_str
+        if parsed.thought is None and parsed.raw_action is None:
+            # Could not find the "Thought: ... Action: ..." structure, treat whole response as thought.
             thought = f"LLM Response (could not parse Thought/Action structure): {response_text}"
             print(f"WARNING: LLMTool.generate_plan_step: Could not parse standard Thought/Action structure. Full response treated as thought.")
             print(f"LLM Response for plan step was:\n{response_text}")
-
+        else:
+            thought = parsed.thought or "Could not parse thought."
+            if parsed.repairs and action_json_str:
+                print(f"INFO: LLMTool.generate_plan_step: Repaired Action JSON ({', '.join(parsed.repairs)}).")
+            elif parsed.raw_action and not action_json_str:
+                print(f"ERROR: LLMTool.generate_plan_step: Action part looked like JSON but failed to parse: {parsed.action_error}")
+                print(f"Problematic Action JSON string from LLM (after attempted repair): {parsed.raw_action}")
+                thought += f" (Self-correction note: Previous LLM Action was not valid JSON: '{parsed.raw_action[:100]}...')"
 
         print(f"LLMTool.generate_plan_step -> Thought: {thought}")
         print(f"LLMTool.generate_plan_step -> Action JSON str: {action_json_str if action_json_str else 'None (parsing failed or not provided by LLM)'}")
@@ -284,45 +679,35 @@ Important Notes:
 
 
     def generate_multi_part_code_solution(self, user_request: str, file_contexts: dict, model_choice: str) -> list:
+        query = self._multi_part_query(user_request, file_contexts, model_choice)
+        result, response_str = self.query_llm_json(query["prompt"], model_choice, "change_directives",
+                                                   system_message=query["system_message"], temperature=query["temperature"])
+        return self._multi_part_directives(result, response_str)
+
+    def _multi_part_query(self, user_request: str, file_contexts: dict, model_choice: str) -> dict:
         system_prompt = """You are an AI code generation assistant... (same as before, ensure JSON only, no markdown)"""
         # ... (prompt construction and LLM call as before, ensuring robust JSON parsing of the list of directives) ...
         # ... (cleaning and parsing logic for list of directives as before) ...
         prompt_parts = [f"User Request: {user_request}\n\nFile Contexts (relevant snippets from files already read, or indicate if a file is new):"]
         for fp, content in file_contexts.items():
             content_str = str(content) if content is not None else " (File is new or content not yet available)"
-            prompt_parts.append(f"\n--- Context for: {fp} ---\n{content_str[:1500]}...\n--- END Context for: {fp} ---")
+            if content is not None and len(content_str) > 1500:
+                # The parts of the file relevant to the request rather than its first 1500 characters
+                hits = self.relevant_code(user_request, top_k=3, paths=[fp])
+                content_str = format_code_hits(hits, 1500) if hits else content_str[:1500] + "..."
+            prompt_parts.append(f"\n--- Context for: {fp} ---\n{content_str}\n--- END Context for: {fp} ---")
         
-        llm_prompt = "\n".join(prompt_parts) + "\n\nGenerate the JSON array of change directives (JSON only, no markdown):"
+        llm_prompt = "\n".join(prompt_parts) + "\n\nGenerate the change directives as a JSON object {\"directives\": [...]} (JSON only, no markdown):"
         print(f"DEBUG LLMTool.generate_multi_part_code_solution: Prompting {model_choice}...")
-        
-        response_str = self.query_llm(llm_prompt, model_choice, system_message=system_prompt, temperature=0.2)
+        return {"prompt": llm_prompt, "model_choice": model_choice, "system_message": system_prompt, "temperature": 0.2}
 
-        if not response_str or response_str.startswith("Error:"):
-            print(f"ERROR: LLMTool.generate_multi_part_code_solution: LLM query failed or returned error: {response_str}")
+    def _multi_part_directives(self, result: dict | None, response_str: str) -> list:
+        if result is None:
+            print(f"ERROR: LLMTool.generate_multi_part_code_solution: No valid change directives. LLM Response was:\n---\n{response_str}\n---")
             return []
-
-        response_str_cleaned = response_str.strip()
-        if response_str_cleaned.startswith("```json"): response_str_cleaned = response_str_cleaned[len("```json"):]
-        if response_str_cleaned.startswith("```"): response_str_cleaned = response_str_cleaned[len("```"):]
-        if response_str_cleaned.endswith("```"): response_str_cleaned = response_str_cleaned[:-len("```")]
-        response_str_cleaned = response_str_cleaned.strip()
-
-        try:
-            directives = json.loads(response_str_cleaned)
-            if isinstance(directives, list):
-                valid_directives = []
-                for i, d in enumerate(directives):
-                    if isinstance(d, dict) and "file_path" in d and "change_type" in d and "code_snippet" in d:
-                        valid_directives.append(d)
-                    else: print(f"WARNING: Directive {i} in multi-part solution has invalid structure, skipping: {d}")
-                print(f"INFO: LLM generated {len(valid_directives)} valid multi-part directives.")
-                return valid_directives
-            else:
-                print(f"ERROR: LLM did not return a list for multi-part solution. Response was:\n{response_str_cleaned}")
-                return []
-        except json.JSONDecodeError as e:
-            print(f"ERROR: Failed to parse multi-part code solution JSON: {e}")
-            print(f"LLM Response (cleaned) for multi-part was:\n---\n{response_str_cleaned}\n---"); return []
+        directives = result["directives"]
+        print(f"INFO: LLM generated {len(directives)} valid multi-part directives.")
+        return directives
 
 
     def generate_clarification_question(self, current_state: 'StateManager', ambiguity_details: str, model_choice: str) -> str:
@@ -341,8 +726,148 @@ Important Notes:
         return question.strip()
 
 
+class AsyncLLMTool:
+    """asyncio variant of LLMTool.query_llm backed by the aiohttp connectors.
+    Model routing (provider/model parsing, connector config) is delegated to a regular LLMTool."""
+    def __init__(self, config_data: dict, llm_tool: LLMTool | None = None):
+        self.llm_tool = llm_tool if llm_tool is not None else LLMTool(config_data)
+        self.max_tokens_for_generation = self.llm_tool.max_tokens_for_generation
+        self.async_openrouter_connector: AsyncOpenRouterConnector | None = None
+        self.async_ollama_connector: AsyncOllamaConnector | None = None
+
+    def _get_async_client_and_model(self, model_choice_str: str | None) -> tuple[AsyncOpenRouterConnector | AsyncOllamaConnector | None, str | None]:
+        client, model_name = self.llm_tool._get_client_and_model(model_choice_str)
+        if isinstance(client, OpenRouterConnector):
+            if self.async_openrouter_connector is None:
+                self.async_openrouter_connector = AsyncOpenRouterConnector(
+                    api_key=self.llm_tool.openrouter_key, base_url=client.base_url, site_url=self.llm_tool.openrouter_site_url,
+                    app_name=self.llm_tool.openrouter_app_name, pool_config=self.llm_tool.openrouter_pool_config,
+                    resilience_config=self.llm_tool.openrouter_resilience_config, prompt_cache_config=self.llm_tool.prompt_cache_config
+                )
+            return self.async_openrouter_connector, model_name
+        if isinstance(client, OllamaConnector):
+            if self.async_ollama_connector is None:
+                self.async_ollama_connector = AsyncOllamaConnector(base_url=client.base_url, pool_config=self.llm_tool.ollama_pool_config,
+                                                                   resilience_config=self.llm_tool.ollama_resilience_config,
+                                                                   prompt_cache_config=self.llm_tool.prompt_cache_config)
+            return self.async_ollama_connector, model_name
+        return None, None
+
+    async def query_llm(self, prompt: str, model_choice: str, system_message: str = None, max_tokens: int | None = None, temperature=0.5,
+                        use_cache: bool = True, response_format: dict | str | None = None, cache_if: Callable[[str], bool] | None = None,
+                        stable_prefix_chars: int | None = None) -> str:
+        """Follows the same routing policy as LLMTool.query_llm; losing hedged attempts are cancelled as tasks."""
+        policy = self.llm_tool.routing
+        effective_model_choice = model_choice or self.llm_tool.default_model_choice
+        route = policy.route_for(effective_model_choice) if policy and effective_model_choice else [model_choice]
+        if len(route) == 1:
+            return await self._query_model(prompt, model_choice, system_message, max_tokens, temperature, use_cache,
+                                           response_format=response_format, cache_if=cache_if, stable_prefix_chars=stable_prefix_chars)
+
+        policy.count("routed_calls")
+        pending: dict[asyncio.Task, tuple[str, str]] = {}
+        next_index, last_error = 0, None
+        latest_model, pending_timed_out = route[0], False
+        try:
+            while pending or next_index < len(route):
+                if not pending or (policy.hedge_enabled and next_index < len(route) and pending_timed_out):
+                    latest_model = route[next_index]
+                    role = "primary" if next_index == 0 else ("hedge" if pending else "fallback")
+                    if role != "primary":
+                        print(f"INFO: AsyncLLMTool.query_llm: {'Hedging with' if role == 'hedge' else 'Falling back to'} {latest_model}.")
+                        policy.count("hedges_fired" if role == "hedge" else "fallbacks_used")
+                    task = asyncio.ensure_future(self._query_model(prompt, latest_model, system_message, max_tokens, temperature, use_cache, role,
+                                                                          response_format=response_format, cache_if=cache_if,
+                                                                          stable_prefix_chars=stable_prefix_chars))
+                    pending[task] = (latest_model, role)
+                    next_index += 1
+                can_hedge = policy.hedge_enabled and next_index < len(route)
+                done, _ = await asyncio.wait(pending, timeout=policy.hedge_delay(latest_model) if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                pending_timed_out = not done
+                for task in done:
+                    _, role = pending.pop(task)
+                    response_text = task.result()
+                    if response_text and not response_text.startswith("Error:"):
+                        if role == "hedge": policy.count("hedges_won")
+                        return response_text
+                    last_error = response_text
+        finally:
+            for task in pending:
+                task.cancel()
+        return last_error or f"Error: All routed models failed: {', '.join(route)}"
+
+    async def _query_model(self, prompt: str, model_choice: str, system_message: str = None, max_tokens: int | None = None, temperature=0.5,
+                           use_cache: bool = True, route: str = "primary", response_format: dict | str | None = None,
+                           cache_if: Callable[[str], bool] | None = None, stable_prefix_chars: int | None = None) -> str:
+        client, model_name = self._get_async_client_and_model(model_choice)
+        if client is None or model_name is None:
+            err_msg = f"Error: Could not get LLM client or model name for '{model_choice}'. Client: {client}, ModelName: {model_name}"
+            print(f"ERROR: AsyncLLMTool.query_llm: {err_msg}")
+            return err_msg
+
+        effective_max_tokens = max_tokens if max_tokens is not None else self.max_tokens_for_generation
+        usage = LLMUsage(provider=client.resilience.name, model=model_choice or model_name)
+        usage.route = route
+        started_at = time.perf_counter()
+        cache_key = self.llm_tool._cache_key_for(client, model_name, system_message, prompt, temperature, effective_max_tokens, use_cache,
+                                                 response_format)
+        if cache_key is not None:
+            cached_response = self.llm_tool._cache_get(cache_key)
+            if cached_response is not None:
+                print(f"INFO: AsyncLLMTool.query_llm: Response cache hit for {model_choice}.")
+                usage.cached = True
+                usage.wall_time_s = time.perf_counter() - started_at
+                self.llm_tool._record_usage(usage)
+                return cached_response
+        policy = self.llm_tool.routing
+        try:
+            response_text = await client.generate(prompt, model_name, system_message, effective_max_tokens, temperature, usage=usage,
+                                                  response_format=response_format, stable_prefix_chars=stable_prefix_chars)
+        except asyncio.CancelledError:
+            usage.discarded = True # A routed sibling answered first
+            usage.wall_time_s = time.perf_counter() - started_at
+            self.llm_tool._record_usage(usage)
+            raise
+        except Exception as e:
+            print(f"ERROR: AsyncLLMTool.query_llm: Exception during client.generate for {model_name} (using {model_choice}): {e}")
+            usage.error = str(e)
+            usage.wall_time_s = time.perf_counter() - started_at
+            self.llm_tool._record_usage(usage)
+            if policy is not None: policy.record_result(usage.model, usage.wall_time_s, ok=False)
+            return f"Error: LLM query failed for {model_name}. Details: {str(e)}"
+        self.llm_tool._record_usage(usage)
+        ok = bool(response_text) and not response_text.startswith("Error:")
+        if policy is not None: policy.record_result(usage.model, usage.wall_time_s, ok=ok)
+        if cache_key is not None and ok and (cache_if is None or cache_if(response_text)):
+            self.llm_tool._cache_put(cache_key, response_text, client.resilience.name, model_name)
+        return response_text
+
+    async def gather(self, queries: list[dict], max_concurrency: int = 8) -> list[str]:
+        """Runs many query_llm calls concurrently (at most max_concurrency in flight). Results keep input order."""
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        async def _bounded(query: dict) -> str:
+            async with semaphore:
+                return await self.query_llm(**query)
+        return list(await asyncio.gather(*(_bounded(q) for q in queries)))
+
+    async def aclose(self):
+        for connector in (self.async_openrouter_connector, self.async_ollama_connector):
+            if connector is not None:
+                await connector.close()
+
+
 class CodeAnalysisTool:
-    # ... (No changes needed here from the previous full code listing for CodeAnalysisTool) ...
+    STRUCTURE_CACHE_ENTRIES = 1024
+    # get_code_structure results by (content SHA-1, file type), least recently used first; warmed by the prefetcher.
+    # Keyed by content, so it is shared by every instance: later runs in the same process (--batch, --serve) start warm
+    _structure_cache: "OrderedDict[tuple[str, str], dict]" = OrderedDict()
+    _structure_lock = threading.Lock()
+
+    def __init__(self, code_index: CodeIndex | None = None):
+        self.code_index = code_index # Supplies the embedder for relevance ranking; a hashing embedder is used without one
+        self.structure_cache_stats = {"hits": 0, "misses": 0} # This instance's (this run's) lookups
+
     def get_file_context_snippet(self, file_content: str, max_lines=50, max_chars=2000) -> str:
         lines = str(file_content).splitlines() 
         snippet_lines = lines[:max_lines]
@@ -352,7 +877,22 @@ class CodeAnalysisTool:
     def get_code_structure(self, file_content: str, file_type: str) -> dict:
         print(f"INFO: CodeAnalysisTool.get_code_structure called for file_type: {file_type}")
         content_str = str(file_content) 
+        key = (hashlib.sha1(content_str.encode("utf-8", errors="replace")).hexdigest(), file_type)
+        with self._structure_lock:
+            cached = self._structure_cache.get(key)
+            if cached is not None:
+                self._structure_cache.move_to_end(key)
+                self.structure_cache_stats["hits"] += 1
+                return copy.deepcopy(cached)
+            self.structure_cache_stats["misses"] += 1
+        structure = self._scan_structure(content_str, file_type)
+        with self._structure_lock:
+            self._structure_cache[key] = copy.deepcopy(structure)
+            while len(self._structure_cache) > self.STRUCTURE_CACHE_ENTRIES:
+                self._structure_cache.popitem(last=False)
+        return structure
 
+    def _scan_structure(self, content_str: str, file_type: str) -> dict:
         if file_type == "python":
             functions = re.findall(r"^\s*def\s+(\w+)\s*\(", content_str, re.MULTILINE)
             classes = re.findall(r"^\s*class\s+(\w+)\s*[:\(]", content_str, re.MULTILINE)
@@ -371,9 +911,28 @@ class CodeAnalysisTool:
         
         return {"type": file_type, "summary": f"Basic structure analysis for '{file_type}'. First 200 chars: {content_str[:200]}..."}
 
-    def extract_relevant_context(self, file_content: str, primary_target_identifier: dict, surrounding_lines: int = 10) -> str:
-        print(f"INFO: CodeAnalysisTool.extract_relevant_context called (currently a placeholder). Target: {primary_target_identifier}")
-        return str(file_content)[:1000]
+    def extract_relevant_context(self, file_content: str, primary_target_identifier: dict, surrounding_lines: int = 10,
+                                 max_chars: int = 1000) -> str:
+        """The chunks of file_content most similar to the target (its name/markers/description), in file order,
+        within max_chars. surrounding_lines sets the chunk size."""
+        content_str = str(file_content)
+        if len(content_str) <= max_chars:
+            return content_str
+        target = primary_target_identifier if isinstance(primary_target_identifier, dict) else {"description": str(primary_target_identifier)}
+        query = " ".join(str(v) for v in target.values() if isinstance(v, str))
+        chunks = chunk_text(target.get("file_path", ""), content_str, chunk_lines=max(2 * surrounding_lines, 4), chunk_overlap=0)
+        embedder = self.code_index.embedder if self.code_index is not None else HashingEmbedder()
+        picked, used = [], 0
+        for chunk, _ in rank_chunks(chunks, query, embedder, top_k=len(chunks)):
+            if used + len(chunk.text) > max_chars and picked:
+                continue
+            picked.append(chunk)
+            used += len(chunk.text)
+        print(f"INFO: CodeAnalysisTool.extract_relevant_context: {len(picked)}/{len(chunks)} chunks for target {primary_target_identifier}")
+        if not picked:
+            return content_str[:max_chars]
+        picked.sort(key=lambda c: c.start_line)
+        return "\n...\n".join(c.text[:max_chars] for c in picked)
 
 
 class ChangeOrchestratorTool:
@@ -401,17 +960,15 @@ class ChangeOrchestratorTool:
             print("INFO: ChangeOrchestratorTool: No valid directives to apply.")
             return True 
 
-        changes_by_file = {}
+        changes_by_file = {} # Keyed by resolved path, so "./a.py" and "a.py" are edited as one file
         for directive in flat_directives:
             fp = directive.get("file_path")
             if not fp or not isinstance(fp, str):
                 print(f"WARNING: Directive missing or has invalid 'file_path': {directive}")
                 overall_success = False; continue
-            if fp not in changes_by_file: changes_by_file[fp] = []
-            changes_by_file[fp].append(directive)
+            changes_by_file.setdefault(fs_tool._resolve_path(fp), (fp, []))[1].append(directive)
 
-        for file_path_str, directives_for_file in changes_by_file.items():
-            resolved_file_path_for_log = fs_tool._resolve_path(file_path_str)
+        for resolved_file_path_for_log, (file_path_str, directives_for_file) in changes_by_file.items():
             print(f"\nProcessing changes for file: '{file_path_str}' (resolved: '{resolved_file_path_for_log}')")
             
             current_file_content_str = state_manager.get_file_from_cache(file_path_str)